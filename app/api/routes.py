@@ -1,13 +1,15 @@
 """API路由定义"""
 import json
+import threading
 import uuid
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Union
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Request, Response, Query
+from fastapi.responses import FileResponse, PlainTextResponse
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger
@@ -15,8 +17,24 @@ from loguru import logger
 from app.config import settings
 from app.models.database import get_db
 from app.models.task import Task, TaskStatus
+from app.api.schemas import (
+    BatchCancelResponse, CancelResponse, HealthResponse, HostAvailability, LogLine, ReadyResponse, ResultFile,
+    SubmitResponse, TaskListResponse, TaskLogResponse, TaskPendingResponse, TaskResultResponse,
+    TaskStatusResponse, TaskSummary
+)
 from app.services.task_queue import task_queue
-from app.services.ssh_service import ssh_service
+from app.services.backend_pool import backend_pool
+from app.services.phase_timing import aggregate_phase_report
+from app.services.profiler import admin_authorized, loop_monitor, sampling_profiler, trace_store
+from app.services.admission import admission_controller, Admission
+from app.services.analytics import task_analytics
+from app.services.autoscaler import concurrency_controller
+from app.services.rate_limit import rate_limiter, retry_after_header
+from app.services.readiness import readiness
+from app.services.retention import retention_service
+from app.services.result_index import load_task_files, mime_type, result_root
+from app.services.speculation import speculator
+from app.services.task_processor import cancel_task, get_live_output
 
 
 router = APIRouter()
@@ -29,67 +47,258 @@ def get_client_info(request: Request) -> dict:
     return {"client_ip": client_ip, "user_agent": user_agent}
 
 
-@router.post("/inference", summary="提交推理任务")
+def rate_limited(rule: str):
+    """
+    按客户端限流的依赖（rule: submit / poll）
+    
+    响应头 X-RateLimit-Limit / X-RateLimit-Remaining / X-RateLimit-Reset 为突发容量、剩余次数与补满秒数，
+    超出时返回 429 及 Retry-After
+    """
+    async def dependency(request: Request, response: Response):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        client = request.client.host if request.client else "unknown"
+        if client in settings.RATE_LIMIT_EXEMPT:
+            return
+        decision = rate_limiter.check(rule, client)
+        headers = {
+            "X-RateLimit-Limit": str(decision.limit),
+            "X-RateLimit-Remaining": str(decision.remaining),
+            "X-RateLimit-Reset": retry_after_header(decision.reset),
+        }
+        if not decision.allowed:
+            headers["Retry-After"] = retry_after_header(decision.retry_after)
+            raise HTTPException(status_code=429, detail="请求过于频繁，请稍后重试", headers=headers)
+        response.headers.update(headers)
+    
+    return Depends(dependency)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None, description="管理令牌（ADMIN_TOKEN）")):
+    """管理接口鉴权（未配置 ADMIN_TOKEN 时管理接口不可用）"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="管理接口未开启")
+    if not admin_authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+
+async def check_client_quota(db: AsyncSession, client_ip: Optional[str]):
+    """单个客户端排队与执行中的任务数达到 RATE_LIMIT_MAX_ACTIVE_TASKS 时返回 429"""
+    if settings.RATE_LIMIT_MAX_ACTIVE_TASKS <= 0 or not client_ip or client_ip in settings.RATE_LIMIT_EXEMPT:
+        return
+    result = await db.execute(
+        select(func.count(Task.id)).where(
+            Task.client_ip == client_ip,
+            Task.status.in_((TaskStatus.DEFERRED, TaskStatus.PENDING, TaskStatus.PROCESSING)),
+            Task.speculative.is_not(True)
+        )
+    )
+    if result.scalar() >= settings.RATE_LIMIT_MAX_ACTIVE_TASKS:
+        raise HTTPException(
+            status_code=429,
+            detail=f"未完成的任务数已达上限（{settings.RATE_LIMIT_MAX_ACTIVE_TASKS}），请等待任务完成后再提交",
+            headers={"Retry-After": str(settings.ADMISSION_DEFAULT_RETRY_AFTER)}
+        )
+
+
+def resolve_deadline(ttl: Optional[int], deadline: Optional[datetime]) -> Optional[datetime]:
+    """
+    计算任务开始执行的期限（UTC，不带时区）
+    
+    ttl 与 deadline 同时指定时取较早者，都未指定时使用 TASK_DEFAULT_TTL
+    """
+    now = datetime.utcnow()
+    candidates = []
+    if deadline is not None:
+        if deadline.tzinfo is not None:
+            deadline = deadline.astimezone(timezone.utc).replace(tzinfo=None)
+        if deadline <= now:
+            raise HTTPException(status_code=400, detail="deadline 早于当前时间")
+        candidates.append(deadline)
+    if ttl is not None:
+        candidates.append(now + timedelta(seconds=ttl))
+    if not candidates and settings.TASK_DEFAULT_TTL > 0:
+        candidates.append(now + timedelta(seconds=settings.TASK_DEFAULT_TTL))
+    return min(candidates) if candidates else None
+
+
+def cache_validators(last_update: Optional[datetime], *parts: int) -> dict:
+    """
+    条件请求的校验响应头：弱 ETag（parts 与最后更新时间）与 Last-Modified（UTC）
+    
+    Last-Modified 只有秒级精度，最后更新时间仍在当前这一秒内时不返回（同一秒内的后续更新无法区分），只依赖 ETag；
+    Cache-Control: no-cache 要求客户端每次都带校验头重新验证
+    """
+    stamp = int(last_update.replace(tzinfo=timezone.utc).timestamp() * 1_000_000) if last_update else 0
+    headers = {
+        "ETag": 'W/"{}"'.format("-".join(f"{value:x}" for value in (*parts, stamp))),
+        "Cache-Control": "no-cache"
+    }
+    if last_update and last_update.replace(microsecond=0) + timedelta(seconds=1) <= datetime.utcnow():
+        headers["Last-Modified"] = format_datetime(last_update.replace(tzinfo=timezone.utc), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """按 If-None-Match（弱比较）判断资源是否未变化，没有 If-None-Match 时使用 If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = headers["ETag"].removeprefix("W/")
+        return any(tag.strip() == "*" or tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or "Last-Modified" not in headers:
+        return False
+    try:
+        return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+@router.post(
+    "/inference",
+    summary="提交推理任务",
+    response_model=SubmitResponse,
+    response_model_exclude_none=True,  # status 仅延后排队时返回
+    dependencies=[rate_limited("submit")]
+)
 async def submit_inference(
     request: Request,
+    response: Response,
     index: int = Query(..., ge=1, description="序号参数"),
     subfolder: str = Query(..., description="子文件夹参数，如 00000"),
+    ttl: Optional[int] = Query(None, ge=1, description="任务有效期（秒），超过后仍未开始执行则不再执行"),
+    deadline: Optional[datetime] = Query(None, description="开始执行的期限（ISO 8601，不带时区时视为 UTC）"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     提交推理任务
     
-    - 接收序号参数和子文件夹参数
-    - 创建任务记录
-    - 将任务推入队列
+    - 按客户端限流（RATE_LIMIT_*），超出时返回 429 及 Retry-After
+    - 先进行准入控制（不写数据库），队列已满时返回 503 及 Retry-After
+    - 开启延后模式时，队列已满的任务持久化为 deferred，返回 202
+    - 开启推测执行时，已预先执行的 (subfolder, index) 直接认领该任务，不重复推理
+    - 创建任务记录并将任务推入队列
     - 返回task_id给前端
     
     Args:
         index: 序号（必填，大于等于1）
         subfolder: 子文件夹（必填，如 00000）
+        ttl / deadline: 任务期限（可选），超过期限仍未开始执行的任务标记为 expired
     """
-    # 生成任务ID
-    task_id = str(uuid.uuid4())
-    
+    deadline = resolve_deadline(ttl, deadline)
     # 获取客户端信息
     client_info = get_client_info(request)
+    await check_client_quota(db, client_info["client_ip"])
+    
+    # 推测执行：认领已预先执行的任务
+    claimed = await speculator.claim(db, subfolder, index, client_info, deadline)
+    if claimed:
+        task_id, status = claimed
+        await speculator.observe(client_info["client_ip"], subfolder, index)
+        return SubmitResponse(
+            task_id=task_id,
+            index=index,
+            subfolder=subfolder,
+            status=status,
+            estimated_wait=0.0,
+            deadline=deadline,
+            speculative=True,
+            message="任务已预先执行" if status == TaskStatus.COMPLETED else "任务已在预先执行中"
+        )
+    
+    # 准入控制：在任何数据库写入之前判断容量
+    decision = admission_controller.admit()
+    if decision.admission == Admission.REJECT:
+        raise HTTPException(
+            status_code=503,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": str(decision.retry_after)}
+        )
+    deferred = decision.admission == Admission.DEFER
+    
+    # 生成任务ID
+    task_id = str(uuid.uuid4())
     
     # 创建任务记录
     task = Task(
         task_id=task_id,
         index=index,
         subfolder=subfolder,
-        status=TaskStatus.PENDING,
+        status=TaskStatus.DEFERRED if deferred else TaskStatus.PENDING,
+        deadline=deadline,
         client_ip=client_info["client_ip"],
         user_agent=client_info["user_agent"]
     )
-    db.add(task)
-    await db.commit()
-    
-    # 将任务推入队列
-    enqueued = await task_queue.enqueue({
-        "task_id": task_id,
-        "index": index,
-        "subfolder": subfolder
-    })
+    committed = False
+    try:
+        db.add(task)
+        await db.commit()
+        committed = True
+        
+        # 将任务推入队列（准入时已预留位置）
+        if not deferred:
+            enqueued = await task_queue.enqueue({
+                "task_id": task_id,
+                "index": index,
+                "subfolder": subfolder
+            })
+    finally:
+        if deferred:
+            admission_controller.finish_deferral(committed)
+        else:
+            admission_controller.release()
     
-    if not enqueued:
+    if not deferred and not enqueued:
+        # 入队失败（队列已满），任务不会被执行
         task.status = TaskStatus.FAILED
         task.error_message = "任务队列已满"
+        task.completed_at = datetime.utcnow()
         await db.commit()
-        raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+        raise HTTPException(
+            status_code=503,
+            detail="服务繁忙，请稍后重试",
+            headers={"Retry-After": str(settings.ADMISSION_DEFAULT_RETRY_AFTER)}
+        )
+    
+    if deferred:
+        logger.info(f"任务已延后: {task_id}, 序号: {index}, 子文件夹: {subfolder}")
+        response.status_code = 202
+        response.headers["Retry-After"] = str(decision.retry_after)
+        return SubmitResponse(
+            task_id=task_id,
+            index=index,
+            subfolder=subfolder,
+            status=TaskStatus.DEFERRED,
+            estimated_wait=round(decision.estimated_wait, 1),
+            deadline=deadline,
+            message="队列已满，任务已延后排队"
+        )
     
     logger.info(f"任务已创建: {task_id}, 序号: {index}, 子文件夹: {subfolder}")
     
-    return {
-        "task_id": task_id,
-        "index": index,
-        "subfolder": subfolder,
-        "message": "任务已创建，正在处理中"
-    }
+    # 推测任务占用了全部 Worker 时让出一个给真实任务
+    preempted = task_queue.preemption_candidate()
+    if preempted:
+        logger.info(f"有任务排队，取消推测任务: {preempted}")
+        await cancel_task(preempted)
+    await speculator.observe(client_info["client_ip"], subfolder, index)
+    
+    return SubmitResponse(
+        task_id=task_id,
+        index=index,
+        subfolder=subfolder,
+        estimated_wait=round(decision.estimated_wait, 1),
+        deadline=deadline,
+        message="任务已创建，正在处理中"
+    )
 
 
-@router.get("/task/{task_id}/status", summary="查询任务状态")
+@router.get(
+    "/task/{task_id}/status",
+    summary="查询任务状态",
+    response_model=TaskStatusResponse,
+    dependencies=[rate_limited("poll")]
+)
 async def get_task_status(
     task_id: str,
     db: AsyncSession = Depends(get_db)
@@ -102,24 +311,96 @@ async def get_task_status(
     
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
+    task_queue.touch(task_id)
     
-    return {
-        "task_id": task.task_id,
-        "index": task.index,
-        "status": task.status,
-        "created_at": task.created_at.isoformat(),
-        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
-        "inference_time": task.inference_time,
-        "error_message": task.error_message
-    }
+    # 处理中的任务优先使用实时进度（数据库中的进度按间隔写入）
+    output = get_live_output(task_id)
+    progress = output.progress if output and output.progress is not None else task.progress
+    
+    return TaskStatusResponse(
+        task_id=task.task_id,
+        index=task.index,
+        status=task.status,
+        progress=progress,
+        created_at=task.created_at,
+        completed_at=task.completed_at,
+        inference_time=task.inference_time,
+        error_message=task.error_message,
+        deadline=task.deadline
+    )
 
 
-@router.get("/task/{task_id}/result", summary="获取任务结果")
+@router.get(
+    "/task/{task_id}/log",
+    summary="查看任务实时输出",
+    response_model=TaskLogResponse,
+    dependencies=[rate_limited("poll")]
+)
+async def get_task_log(
+    task_id: str,
+    lines: int = Query(50, ge=1, le=1000, description="返回最近的行数"),
+    db: AsyncSession = Depends(get_db)
+):
+    """查看处理中任务的最近输出（stdout/stderr），任务结束后不再保留"""
+    task_queue.touch(task_id)
+    output = get_live_output(task_id)
+    if output is None:
+        result = await db.execute(
+            select(Task.status, Task.progress).where(Task.task_id == task_id)
+        )
+        row = result.first()
+        if not row:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        return TaskLogResponse(
+            task_id=task_id,
+            status=row.status,
+            live=False,
+            progress=row.progress,
+            total_lines=0,
+            lines=[]
+        )
+    
+    return TaskLogResponse(
+        task_id=task_id,
+        status=TaskStatus.PROCESSING,
+        live=True,
+        progress=output.progress,
+        total_lines=output.total_lines,
+        updated_at=output.updated_at,
+        lines=[LogLine(**line) for line in output.tail(lines)]
+    )
+
+
+@router.get(
+    "/task/{task_id}/result",
+    summary="获取任务结果",
+    response_model=Union[TaskResultResponse, TaskPendingResponse],
+    dependencies=[rate_limited("poll")]
+)
 async def get_task_result(
     task_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db)
 ):
-    """获取任务的推理结果，包含结果文件列表"""
+    """
+    获取任务的推理结果，包含结果文件列表
+    
+    支持条件请求（ETag / Last-Modified 取自任务的 updated_at），未变化时只查询一列并返回 304
+    """
+    result = await db.execute(
+        select(Task.status, Task.updated_at).where(Task.task_id == task_id)
+    )
+    validator = result.one_or_none()
+    if not validator:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if validator.status != TaskStatus.COMPLETED:
+        task_queue.touch(task_id)
+    headers = cache_validators(validator.updated_at)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
     result = await db.execute(
         select(Task).where(Task.task_id == task_id)
     )
@@ -129,61 +410,44 @@ async def get_task_result(
         raise HTTPException(status_code=404, detail="任务不存在")
     
     if task.status != TaskStatus.COMPLETED:
-        return {
-            "task_id": task.task_id,
-            "status": task.status,
-            "message": "任务尚未完成",
-            "error_message": task.error_message
-        }
+        return TaskPendingResponse(
+            task_id=task.task_id,
+            status=task.status,
+            message="任务尚未完成",
+            error_message=task.error_message
+        )
     
-    # 获取结果文件列表
-    result_files = []
+    # 获取结果文件列表（路径相对结果根目录）
+    root = f"{result_root(task_id)}/" if settings.LOCAL_MODE else None
+    result_files = [
+        ResultFile(
+            filename=entry["name"],
+            type=entry["media_type"],
+            size=entry["size"],
+            url=f"/api/task/{task_id}/file/{entry['path']}",  # API访问路径
+            path=root + entry["path"] if root else None  # 本地绝对路径，前端可直接访问
+        )
+        for entry in await load_task_files(db, task.id)
+    ]
     
-    # 本地模式：从数据库结果中解析文件列表
-    if settings.LOCAL_MODE:
-        if task.result:
-            try:
-                result_data = json.loads(task.result)
-                files = result_data.get("files", [])
-                for file_path in files:
-                    # 获取相对于 LOCAL_RESULT_DIR 的路径
-                    relative_path = file_path.replace(settings.LOCAL_RESULT_DIR + "/", "")
-                    filename = Path(file_path).name
-                    file_ext = Path(file_path).suffix.lower()
-                    file_type = "image" if file_ext in [".jpg", ".jpeg", ".png", ".bmp", ".gif"] else "video" if file_ext in [".mp4", ".avi", ".mov"] else "other"
-                    result_files.append({
-                        "filename": filename,
-                        "type": file_type,
-                        "path": file_path,  # 本地绝对路径，前端可直接访问
-                        "url": f"/api/task/{task_id}/file/{relative_path}"  # API访问路径
-                    })
-            except json.JSONDecodeError:
-                pass
-    else:
-        # 远程模式：从本地下载目录获取文件
-        result_dir = settings.RESULTS_DIR / task_id
-        if result_dir.exists():
-            for file_path in result_dir.rglob("*"):  # 递归遍历
-                if file_path.is_file():
-                    file_ext = file_path.suffix.lower()
-                    file_type = "image" if file_ext in [".jpg", ".jpeg", ".png", ".bmp", ".gif"] else "video" if file_ext in [".mp4", ".avi", ".mov"] else "other"
-                    relative_path = file_path.relative_to(result_dir)
-                    result_files.append({
-                        "filename": file_path.name,
-                        "type": file_type,
-                        "url": f"/api/task/{task_id}/file/{relative_path}"
-                    })
+    sync = None
+    if task.result:
+        try:
+            sync = json.loads(task.result).get("sync")
+        except json.JSONDecodeError:
+            pass
     
-    return {
-        "task_id": task.task_id,
-        "index": task.index,
-        "status": task.status,
-        "inference_time": task.inference_time,
-        "created_at": task.created_at.isoformat(),
-        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
-        "files": result_files,
-        "local_mode": settings.LOCAL_MODE
-    }
+    return TaskResultResponse(
+        task_id=task.task_id,
+        index=task.index,
+        status=task.status,
+        inference_time=task.inference_time,
+        created_at=task.created_at,
+        completed_at=task.completed_at,
+        files=result_files,
+        sync=sync,
+        local_mode=settings.LOCAL_MODE
+    )
 
 
 @router.get("/task/{task_id}/file/{file_path:path}", summary="获取结果文件")
@@ -210,44 +474,88 @@ async def get_result_file(
     if not full_path.exists():
         raise HTTPException(status_code=404, detail="文件不存在")
     
-    # 根据扩展名设置媒体类型
-    ext = full_path.suffix.lower()
-    media_types = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".bmp": "image/bmp",
-        ".gif": "image/gif",
-        ".mp4": "video/mp4",
-        ".avi": "video/x-msvideo",
-        ".mov": "video/quicktime"
-    }
-    media_type = media_types.get(ext, "application/octet-stream")
-    
     return FileResponse(
         path=str(full_path),
-        media_type=media_type,
+        media_type=mime_type(full_path.name),
         filename=full_path.name
     )
 
 
-@router.get("/tasks", summary="获取任务列表")
+@router.delete("/task/{task_id}", summary="取消任务", response_model=CancelResponse)
+async def cancel_inference_task(task_id: str):
+    """
+    取消任务
+    
+    - 排队中（pending / deferred）的任务直接移出队列
+    - 处理中的任务会终止远程推理进程，释放GPU与Worker
+    """
+    cancelled, previous = await cancel_task(task_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"任务已结束（{previous.value}），无法取消")
+    
+    return CancelResponse(
+        task_id=task_id,
+        status=TaskStatus.CANCELLED,
+        previous_status=previous,
+        message="任务已取消"
+    )
+
+
+@router.post("/tasks/cancel", summary="批量取消任务", response_model=BatchCancelResponse)
+async def cancel_inference_tasks(
+    task_ids: List[str] = Body(..., embed=True, min_length=1, max_length=100, description="任务ID列表")
+):
+    """批量取消任务，返回成功取消、不存在及已结束的任务ID"""
+    cancelled, not_found, finished = [], [], []
+    for task_id in dict.fromkeys(task_ids):
+        ok, previous = await cancel_task(task_id)
+        if ok:
+            cancelled.append(task_id)
+        elif previous is None:
+            not_found.append(task_id)
+        else:
+            finished.append(task_id)
+    
+    return BatchCancelResponse(cancelled=cancelled, not_found=not_found, finished=finished)
+
+
+@router.get(
+    "/tasks",
+    summary="获取任务列表",
+    response_model=TaskListResponse,
+    dependencies=[rate_limited("poll")]
+)
 async def get_task_list(
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
     status: Optional[TaskStatus] = Query(None, description="任务状态过滤"),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取任务列表，支持分页和状态过滤"""
-    query = select(Task)
-    count_query = select(func.count(Task.id))
+    """
+    获取任务列表，支持分页和状态过滤
+    
+    支持条件请求：ETag 由筛选结果的任务数与最大 updated_at 计算（与总数在同一条查询中得到），
+    未变化时返回 304，不查询分页数据
+    """
+    # 未被认领的推测任务不属于任何客户端，不在列表中显示
+    query = select(Task).where(Task.speculative.is_not(True))
+    count_query = select(func.count(Task.id), func.max(Task.updated_at)).where(Task.speculative.is_not(True))
     
     if status:
         query = query.where(Task.status == status)
         count_query = count_query.where(Task.status == status)
     
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
+    total, last_update = (await db.execute(count_query)).one()
+    # 删除任务记录不会改变剩余记录的 updated_at，Last-Modified 同时考虑最近一次删除的时间
+    deleted_at = retention_service.rows_deleted_at
+    headers = cache_validators(max(filter(None, (last_update, deleted_at)), default=None), total)
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     
     offset = (page - 1) * page_size
     query = query.order_by(Task.created_at.desc()).offset(offset).limit(page_size)
@@ -255,21 +563,55 @@ async def get_task_list(
     result = await db.execute(query)
     tasks = result.scalars().all()
     
-    return {
-        "total": total,
-        "page": page,
-        "page_size": page_size,
-        "tasks": [
-            {
-                "task_id": t.task_id,
-                "index": t.index,
-                "status": t.status,
-                "created_at": t.created_at.isoformat(),
-                "completed_at": t.completed_at.isoformat() if t.completed_at else None
-            }
+    return TaskListResponse(
+        total=total,
+        page=page,
+        page_size=page_size,
+        tasks=[
+            TaskSummary(
+                task_id=t.task_id,
+                index=t.index,
+                status=t.status,
+                created_at=t.created_at,
+                completed_at=t.completed_at
+            )
             for t in tasks
         ]
-    }
+    )
+
+
+@router.get("/stats/phases", summary="任务阶段耗时报表")
+async def get_phase_stats(
+    limit: int = Query(500, ge=1, le=10000, description="统计最近的任务数量"),
+    status: Optional[TaskStatus] = Query(TaskStatus.COMPLETED, description="任务状态过滤"),
+    db: AsyncSession = Depends(get_db)
+):
+    """聚合最近任务的阶段耗时，返回各阶段的百分位统计"""
+    query = select(Task.phase_timings).where(Task.phase_timings.is_not(None))
+    if status:
+        query = query.where(Task.status == status)
+    query = query.order_by(Task.id.desc()).limit(limit)
+    
+    result = await db.execute(query)
+    report = aggregate_phase_report(result.scalars().all())
+    report["limit"] = limit
+    return report
+
+
+@router.get("/stats", summary="任务统计")
+async def get_task_stats(
+    granularity: str = Query("hour", pattern="^(minute|hour)$", description="时间粒度: minute / hour"),
+    buckets: int = Query(24, ge=1, le=1440, description="统计最近的时间桶数量（含当前时间桶）"),
+    dimension: str = Query("all", pattern="^(all|subfolder|client)$", description="分组维度: all / subfolder / client"),
+    key: Optional[str] = Query(None, description="只返回该维度取值（如某个 subfolder 或客户端 IP）"),
+    limit: int = Query(20, ge=1, le=200, description="返回的维度取值数量（按任务数从多到少）")
+):
+    """
+    按时间桶与维度统计吞吐量、失败率与推理耗时分位数
+    
+    只读取增量维护的汇总表（task_rollups），耗时与历史任务数量无关
+    """
+    return await task_analytics.query(granularity, buckets, dimension, key, limit)
 
 
 @router.get("/system/status", summary="获取系统状态")
@@ -277,13 +619,100 @@ async def get_system_status():
     """获取系统运行状态"""
     return {
         "status": "running",
-        "ssh_connected": ssh_service.is_connected,
+        "ssh_connected": backend_pool.is_available,
         "queue_size": task_queue.queue_size,
-        "queue_running": task_queue.is_running
+        "queue_running": task_queue.is_running,
+        "queue": task_queue.stats,
+        "admission": admission_controller.stats,
+        "workers": concurrency_controller.stats,
+        "backends": backend_pool.stats,
+        "retention": retention_service.stats,
+        "rate_limit": rate_limiter.stats,
+        "analytics": task_analytics.stats,
+        "speculation": speculator.stats,
+        "event_loop": loop_monitor.stats
     }
 
 
-@router.get("/health", summary="健康检查")
+@router.post("/system/retention", summary="立即执行结果清理", dependencies=[Depends(require_admin)])
+async def run_retention():
+    """按保留策略立即执行一次清理，返回清理报告（需要管理令牌，未开启 RETENTION_ENABLED 时返回 409）"""
+    if not settings.RETENTION_ENABLED:
+        raise HTTPException(status_code=409, detail="结果保留策略未开启（RETENTION_ENABLED）")
+    return await retention_service.run_once()
+
+
+@router.get("/admin/loop", summary="事件循环延迟与阻塞记录", dependencies=[Depends(require_admin)])
+async def get_loop_stalls():
+    """事件循环调度延迟统计，以及最近的阻塞记录（含阻塞期间事件循环线程的调用栈）"""
+    return {**loop_monitor.stats, "stalls": list(reversed(loop_monitor.stalls))}
+
+
+@router.get(
+    "/admin/profile", summary="采样分析", response_class=PlainTextResponse, dependencies=[Depends(require_admin)]
+)
+async def run_profile(
+    seconds: float = Query(5, gt=0, description="采样时长（秒）"),
+    threads: str = Query("loop", pattern="^(loop|all)$", description="采样线程: loop（事件循环线程）/ all（所有线程）"),
+    idle: bool = Query(False, description="是否计入线程空闲等待的样本")
+):
+    """
+    采样 seconds 秒内的调用栈，返回 flamegraph 折叠栈格式（每行: 根;...;叶 样本数）
+    
+    可直接交给 flamegraph.pl 或 speedscope 生成火焰图；同一时间只允许一个采样分析
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"采样时长不能超过 {settings.PROFILE_MAX_SECONDS} 秒")
+    thread_ids = {loop_monitor.loop_thread_id or threading.get_ident()} if threads == "loop" else None
+    try:
+        session = await sampling_profiler.profile(seconds, thread_ids, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        session.folded(),
+        headers={"X-Profile-Samples": str(session.samples), "X-Profile-Idle-Samples": str(session.idle_samples)}
+    )
+
+
+@router.get("/admin/traces", summary="最近的请求追踪", dependencies=[Depends(require_admin)])
+async def list_traces():
+    """最近的请求追踪摘要（请求头 X-Trace: 1 开启），最新的在前"""
+    return {"traces": trace_store.list()}
+
+
+@router.get(
+    "/admin/traces/{trace_id}", summary="请求追踪的调用栈", response_class=PlainTextResponse,
+    dependencies=[Depends(require_admin)]
+)
+async def get_trace(trace_id: str):
+    """请求期间事件循环线程的采样调用栈（flamegraph 折叠栈格式）"""
+    trace = trace_store.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="追踪记录不存在")
+    return PlainTextResponse(trace["session"].folded(), headers={"X-Profile-Samples": str(trace["samples"])})
+
+
+@router.get("/health", summary="健康检查", response_model=HealthResponse)
 async def health_check():
     """健康检查接口"""
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return HealthResponse(status="healthy", timestamp=datetime.utcnow())
+
+
+@router.get("/ready", summary="就绪检查", response_model=ReadyResponse)
+async def ready_check(response: Response):
+    """
+    各启动依赖的就绪情况（不发起任何探测，只读取后台检查的结果）
+    
+    必需依赖（数据库、任务队列）未就绪时返回 503；推理主机、旧数据迁移等非必需依赖失败时为 degraded
+    """
+    stats = readiness.stats
+    if not readiness.is_ready:
+        response.status_code = 503
+    return ReadyResponse(
+        **stats,
+        ready=readiness.is_ready,
+        hosts=HostAvailability(
+            healthy=sum(1 for backend in backend_pool.backends if backend.healthy),
+            total=len(backend_pool.backends)
+        )
+    )
@@ -0,0 +1,150 @@
+"""API 响应模型"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.models.task import TaskStatus
+
+
+class SubmitResponse(BaseModel):
+    """提交推理任务"""
+    task_id: str
+    index: int
+    subfolder: str
+    status: Optional[TaskStatus] = None  # 延后排队时为 deferred，认领推测任务时为该任务的当前状态
+    estimated_wait: float
+    deadline: Optional[datetime] = None  # 开始执行的期限（UTC），未设置时不返回
+    speculative: Optional[bool] = None  # 认领了预先执行的推测任务时为 true
+    message: str
+
+
+class TaskStatusResponse(BaseModel):
+    """任务状态"""
+    task_id: str
+    index: int
+    status: TaskStatus
+    progress: Optional[float] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    inference_time: Optional[float] = None
+    error_message: Optional[str] = None
+    deadline: Optional[datetime] = None
+
+
+class LogLine(BaseModel):
+    """一行任务输出"""
+    time: float
+    stream: str
+    line: str
+
+
+class TaskLogResponse(BaseModel):
+    """任务实时输出"""
+    task_id: str
+    status: TaskStatus
+    live: bool
+    progress: Optional[float] = None
+    total_lines: int
+    updated_at: Optional[float] = None
+    lines: List[LogLine]
+
+
+class ResultFile(BaseModel):
+    """结果文件"""
+    filename: str
+    type: str
+    size: Optional[int] = None
+    url: str
+    path: Optional[str] = None  # 本地绝对路径（仅本地模式）
+
+
+class SyncStats(BaseModel):
+    """结果同步统计"""
+    transferred_bytes: int = 0
+    saved_bytes: int = 0
+    resumed_bytes: int = 0
+    reused_files: int = 0
+
+
+class TaskResultResponse(BaseModel):
+    """已完成任务的结果"""
+    task_id: str
+    index: int
+    status: TaskStatus
+    inference_time: Optional[float] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    files: List[ResultFile]
+    sync: Optional[SyncStats] = None  # 远程模式的结果同步统计
+    local_mode: bool
+
+
+class TaskPendingResponse(BaseModel):
+    """未完成任务的结果"""
+    task_id: str
+    status: TaskStatus
+    message: str
+    error_message: Optional[str] = None
+
+
+class CancelResponse(BaseModel):
+    """取消任务"""
+    task_id: str
+    status: TaskStatus
+    previous_status: TaskStatus
+    message: str
+
+
+class BatchCancelResponse(BaseModel):
+    """批量取消任务"""
+    cancelled: List[str]
+    not_found: List[str]
+    finished: List[str]
+
+
+class TaskSummary(BaseModel):
+    """任务列表项"""
+    task_id: str
+    index: int
+    status: TaskStatus
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+
+class TaskListResponse(BaseModel):
+    """任务列表"""
+    total: int
+    page: int
+    page_size: int
+    tasks: List[TaskSummary]
+
+
+class HealthResponse(BaseModel):
+    """健康检查"""
+    status: str
+    timestamp: datetime
+
+
+class DependencyStatus(BaseModel):
+    """启动依赖状态"""
+    state: str
+    required: bool
+    seconds: float
+    detail: Optional[str] = None
+
+
+class HostAvailability(BaseModel):
+    """推理主机可用情况"""
+    healthy: int
+    total: int
+
+
+class ReadyResponse(BaseModel):
+    """就绪检查"""
+    status: str
+    ready: bool
+    startup_seconds: Optional[float] = None  # 进程启动到开始接收请求的耗时
+    time_to_first_request: Optional[float] = None  # 进程启动到首个请求的耗时
+    dependencies: Dict[str, DependencyStatus]
+    hosts: HostAvailability
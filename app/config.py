@@ -1,6 +1,7 @@
 """应用配置"""
 import os
 from pathlib import Path
+from typing import Any, Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -24,19 +25,174 @@ class Settings(BaseSettings):
     SSH_USER: str = "xcsz"
     SSH_PASSWORD: str = "123456"
     
+    # ssh/scp 可执行命令（可替换为 scripts/fake_ssh.py 等本地模拟）
+    SSH_COMMAND: str = "ssh"
+    SCP_COMMAND: str = "scp"
+    
+    # SSH 超时、重试与熔断
+    SSH_CONNECT_TIMEOUT: int = 10  # 建立连接超时（秒）
+    SSH_KEEPALIVE_INTERVAL: int = 15  # 保活探测间隔（秒），连续 3 次无响应视为连接断开
+    SSH_LIST_TIMEOUT: int = 30  # 连接测试、列目录、GPU探测等短命令超时（秒）
+    SSH_TRANSFER_TIMEOUT: int = 60  # 单个文件下载超时（秒）
+    SSH_RETRY_ATTEMPTS: int = 3  # 幂等操作最大尝试次数
+    SSH_RETRY_BASE_DELAY: float = 1.0  # 重试初始等待（秒），之后指数增长
+    SSH_RETRY_MAX_DELAY: float = 10.0  # 重试最大等待（秒）
+    BREAKER_FAILURE_THRESHOLD: int = 3  # 连续失败次数达到该值时熔断
+    BREAKER_RECOVERY_TIMEOUT: int = 30  # 熔断后多久允许试探恢复（秒）
+    
+    # 推理主机池：JSON 列表，每项包含 name/host/port/user/password/slots/executor，
+    # 未填写的字段使用上面的 SSH_* 配置；为空时只使用 SSH_HOST 单台主机
+    INFERENCE_HOSTS: List[Dict[str, Any]] = []
+    # 推理执行方式: ssh（通过 SSH 在推理主机执行）/ local（推理与后端在同一主机，直接启动脚本，
+    # 不经过 SSH 与登录 shell，conda 环境变量只解析一次）；INFERENCE_HOSTS 中可按主机设置 executor
+    INFERENCE_EXECUTOR: str = "ssh"
+    BACKEND_DEFAULT_SLOTS: int = 0  # 每台主机的并发槽位数，0 表示不限制（由 Worker 数决定）
+    BACKEND_STRATEGY: str = "least_loaded"  # 调度策略: least_loaded / latency
+    BACKEND_HEALTH_INTERVAL: int = 30  # 健康检查周期（秒）
+    BACKEND_MAX_ATTEMPTS: int = 2  # 连接失败时最多尝试的主机数
+    BACKEND_ACQUIRE_TIMEOUT: int = 300  # 等待可用主机的超时时间（秒）
+    
     # 远程服务器路径配置
     REMOTE_WORK_DIR: str = "/home/xcsz/aaai2025"
     REMOTE_CONDA_ENV: str = "Toponet"
+    CONDA_PROFILE: str = "/opt/anaconda3/etc/profile.d/conda.sh"  # 推理主机上 conda 的初始化脚本
     REMOTE_SCRIPT: str = "tools/demo/demo.sh"
     REMOTE_RESULT_DIR: str = "/home/xcsz/aaai2025/work_dirs/lcs/demo/test/vis"
+    REMOTE_PID_DIR: str = "/tmp/autonomous_driving_tasks"  # 远程推理进程 PID 文件目录（用于取消任务）
+    # 每个任务使用独立的输出目录: 推理脚本从环境变量 RESULT_OUTPUT_DIR 读取输出目录
+    # （REMOTE_RESULT_DIR/.tasks/<task_id>.partial/sample_<subfolder>），成功后整体重命名为
+    # REMOTE_RESULT_DIR/.tasks/<task_id>，结果下载后删除远程目录（本地模式下保留，随任务记录清理）。
+    # 同一 subfolder 的任务可以并行执行；关闭时结果写入共享的 sample_<subfolder>，同一 subfolder 的任务串行执行
+    TASK_OUTPUT_DIRS: bool = False
     
     # 任务配置
     MAX_QUEUE_SIZE: int = 100
     MAX_WORKERS: int = 2
-    TASK_TIMEOUT: int = 600  # 任务超时时间（秒）
+    TASK_TIMEOUT: int = 600  # 任务超时时间（秒），即远程推理命令的执行超时
+    # 任务默认有效期（秒，从提交开始计算），超过期限仍未开始执行的任务标记为 expired，不再占用推理主机；
+    # 提交时可用 ttl / deadline 参数单独指定，0 表示不限制
+    TASK_DEFAULT_TTL: int = 0
+    # 排队任务超过该时间（秒）没有被查询状态或结果时视为客户端已放弃，出队时移到队尾（每个任务一次），0 表示不检测
+    TASK_ABANDON_AFTER: int = 0
+    
+    # 推理输出采集
+    TASK_OUTPUT_LINES: int = 200  # 每个任务保留的最近输出行数
+    TASK_OUTPUT_LINE_LENGTH: int = 1000  # 单行最大长度（超出截断）
+    PROGRESS_PATTERN: str = r"(?i)frame\D{0,3}(\d+)\s*/\s*(\d+)"  # 从输出行解析进度（已完成/总数）的正则，留空不解析
+    PROGRESS_UPDATE_INTERVAL: float = 2.0  # 进度写入数据库的最小间隔（秒）
+    RESULT_MANIFEST: bool = True  # 推理结束时由远程输出结果清单（大小、哈希），省去列目录请求
+    # 结果同步模式: store 按内容哈希存储并硬链接到任务目录（相同文件只下载一次，支持断点续传）；
+    # copy 每个任务完整下载到任务目录
+    SYNC_MODE: str = "store"
+    
+    # 自适应并发（开启后 MAX_WORKERS 作为初始 Worker 数）
+    AUTOSCALE_ENABLED: bool = False
+    AUTOSCALE_MIN_WORKERS: int = 1
+    AUTOSCALE_MAX_WORKERS: int = 8
+    AUTOSCALE_INTERVAL: int = 30  # 调整周期（秒）
+    AUTOSCALE_TARGET_LATENCY: float = 0  # 单任务处理耗时 p50 目标（秒），0 表示不按延迟调整
+    AUTOSCALE_MAX_FAILURE_RATE: float = 0.2  # 周期内失败率超过该值时缩容
+    AUTOSCALE_DECREASE_FACTOR: float = 0.5  # 缩容时的乘性因子
+    AUTOSCALE_GPU_PROBE: bool = False  # 通过 nvidia-smi 探测远程GPU负载
+    AUTOSCALE_GPU_HIGH: float = 90  # GPU 利用率饱和阈值（%）
+    AUTOSCALE_GPU_MEMORY_HIGH: float = 0.9  # 显存占用饱和阈值（比例）
+    
+    # 准入控制
+    ADMISSION_CAPACITY: int = 0  # 允许排队的任务数上限，0 表示使用 MAX_QUEUE_SIZE
+    ADMISSION_DEFERRED: bool = False  # 队列满时将任务持久化为 deferred 而非拒绝
+    ADMISSION_DEFERRED_MAX: int = 1000  # deferred 任务数上限
+    ADMISSION_THROUGHPUT_WINDOW: int = 300  # 估算吞吐量的时间窗口（秒）
+    ADMISSION_DEFAULT_RETRY_AFTER: int = 30  # 无吞吐量数据时建议的重试等待（秒）
+    
+    # 按客户端（IP）限流：令牌桶，提交接口与查询接口（状态、日志、结果、任务列表）分别计数，超出时返回 429
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_SUBMIT_RATE: float = 1.0  # 每个客户端每秒可提交的任务数
+    RATE_LIMIT_SUBMIT_BURST: int = 10  # 提交的突发容量
+    RATE_LIMIT_POLL_RATE: float = 10.0  # 每个客户端每秒可查询的次数
+    RATE_LIMIT_POLL_BURST: int = 50  # 查询的突发容量
+    # 令牌桶存储: memory（进程内）/ sqlite（RATE_LIMIT_DB，同一主机的多个 Worker 进程共享）
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_DB: Path = BASE_DIR / "ratelimit.db"
+    RATE_LIMIT_EXEMPT: List[str] = []  # 不限流的客户端 IP
+    RATE_LIMIT_MAX_ACTIVE_TASKS: int = 0  # 单个客户端排队与执行中的任务数上限，0 表示不限制
+    
+    # 推测执行：客户端在同一 subfolder 内按序号依次提交时，由空闲 Worker 以低优先级预先执行后续序号，
+    # 客户端提交到这些序号时直接认领已有任务；有真实任务排队且没有空闲 Worker 时取消执行中的推测任务
+    SPECULATIVE_ENABLED: bool = False
+    SPECULATIVE_LOOKAHEAD: int = 2  # 预先执行的后续序号数
+    SPECULATIVE_MIN_STREAK: int = 2  # 连续递增提交的次数达到该值时开始推测
+    SPECULATIVE_MAX_TASKS: int = 4  # 未被认领的推测任务总数上限
+    SPECULATIVE_TTL: int = 300  # 推测任务等待执行、以及完成后等待认领的时间（秒）
+    
+    # 任务统计：任务结束时按分钟/小时与 subfolder、客户端维度增量汇总，/api/stats 只读取汇总表
+    ANALYTICS_ENABLED: bool = True
+    ANALYTICS_FLUSH_INTERVAL: float = 10  # 汇总写入数据库的间隔（秒）
+    ANALYTICS_SKETCH_ACCURACY: float = 0.01  # 推理耗时分位数的相对误差
+    ANALYTICS_MINUTE_RETENTION_HOURS: int = 48  # 分钟汇总的保留小时数
+    ANALYTICS_HOUR_RETENTION_DAYS: int = 0  # 小时汇总的保留天数，0 表示不删除
+    
+    # 响应压缩：按 Accept-Encoding 压缩 JSON 等文本响应（结果文件与流式响应不压缩），已安装 brotli 时优先使用 br
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    COMPRESSION_GZIP_LEVEL: int = 6  # gzip 压缩级别（1-9）
+    COMPRESSION_BROTLI_QUALITY: int = 4  # brotli 压缩质量（0-11）
+    
+    # 结果保留策略（后台清理结果文件与历史任务记录）
+    RETENTION_ENABLED: bool = False
+    RETENTION_INTERVAL: int = 3600  # 清理周期（秒）
+    RETENTION_RESULT_DAYS: float = 7  # 结果文件保留天数，0 表示不按时间清理
+    RETENTION_MAX_BYTES: int = 0  # 结果文件总容量上限（字节），超出时从最旧的任务删除，0 表示不限制
+    RETENTION_CLIENT_QUOTA_BYTES: int = 0  # 单个客户端（按 IP）的结果容量配额（字节），0 表示不限制
+    RETENTION_TASK_DAYS: float = 30  # 已结束任务记录的保留天数，0 表示不删除
+    RETENTION_ARCHIVE: bool = True  # 删除任务记录前归档到 ARCHIVE_DIR（gzip 压缩的 JSON Lines）
+    ARCHIVE_DIR: Path = BASE_DIR / "archive"
+    RETENTION_BATCH_SIZE: int = 500  # 每批删除的记录/目录数
+    RETENTION_BATCH_PAUSE: float = 0.1  # 批次之间的间隔（秒），让出数据库写锁
+    RETENTION_VACUUM_PAGES: int = 2000  # 每次增量 VACUUM 回收的最大页数，0 表示不回收
+    # 已有数据库（非增量 VACUUM 模式）在清理时执行一次完整 VACUUM 切换模式，期间阻塞所有写入
+    RETENTION_VACUUM_CONVERT: bool = False
+    
+    # 运行时诊断：事件循环阻塞超过阈值时由看门狗线程记录事件循环线程的调用栈；
+    # 管理接口（/api/admin/*，请求头 X-Admin-Token）提供按需采样分析与单个请求的追踪（请求头 X-Trace: 1）
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL: float = 0.1  # 调度延迟的测量间隔（秒）
+    LOOP_SLOW_THRESHOLD: float = 0.1  # 事件循环阻塞超过该秒数时记录调用栈
+    LOOP_STALL_HISTORY: int = 50  # 保留的最近阻塞记录数
+    ADMIN_TOKEN: str = ""  # 管理令牌，为空时管理接口与请求追踪不可用
+    PROFILE_SAMPLE_INTERVAL: float = 0.01  # 采样分析的采样间隔（秒）
+    PROFILE_MAX_SECONDS: int = 60  # 单次按需采样分析的最长时间（秒）
+    PROFILE_STACK_DEPTH: int = 64  # 调用栈的最大层数
+    TRACE_KEEP: int = 100  # 保留的最近请求追踪数
+    
+    # 日志配置
+    LOG_LEVEL: str = ""  # 控制台日志级别，留空时 DEBUG 模式为 DEBUG，否则为 INFO
+    LOG_JSON: bool = False  # 输出 JSON 结构化日志
+    LOG_ASYNC: bool = True  # 队列化写出，日志 I/O 由后台线程完成，不阻塞事件循环
+    LOG_QUEUE_SIZE: int = 10000  # 日志队列容量，写出跟不上时丢弃新日志（ERROR 及以上等待入队，不丢弃）
+    # 按模块设置日志级别，如 {"app.middleware": "WARNING", "app.services.ssh_service": "DEBUG"}
+    LOG_MODULE_LEVELS: Dict[str, str] = {}
+    
+    # 访问日志配置
+    # 按路由模板设置采样率（0-1），未配置的路由全部记录；错误与慢请求始终记录
+    ACCESS_LOG_SAMPLE_RATES: Dict[str, float] = {
+        "/api/task/{task_id}/status": 0.1,
+        "/api/health": 0.01,
+    }
+    ACCESS_LOG_SLOW_MS: int = 1000  # 慢请求阈值（毫秒）
     
     # Mock模式（用于测试，无需连接远程服务器）
     MOCK_MODE: bool = False
+    # 模拟推理耗时分布: uniform:<最小>:<最大> / lognormal:<中位数>:<sigma> /
+    # empirical:<文件>（秒数的 JSON 列表，或生产数据库 .db 中已完成任务的 inference_time）
+    MOCK_LATENCY: str = "uniform:2:5"
+    MOCK_LATENCY_SCALE: float = 1.0  # 耗时缩放系数，压测时可按比例压缩
+    MOCK_FAILURE_RATE: float = 0.0  # 推理脚本报错退出的概率
+    MOCK_TIMEOUT_RATE: float = 0.0  # 推理卡住直到 TASK_TIMEOUT 的概率
+    MOCK_TRANSPORT_ERROR_RATE: float = 0.0  # 连接失败（退出码255，触发熔断与换主机）的概率
+    MOCK_RESULT_FILES: int = 3  # 每个任务的结果 GIF 数
+    MOCK_POOL_SIZE: int = 8  # 预生成的 GIF 数（RESULTS_DIR/.mock_pool）
+    MOCK_GIF_FRAMES: int = 8  # 每个 GIF 的帧数
+    MOCK_UNIQUE_OUTPUTS: bool = True  # 每个任务的结果内容不同（关闭时硬链接池文件，不占额外空间）
     
     # 本地模式：前后端部署在同一服务器，跳过文件下载，直接访问本地路径
     LOCAL_MODE: bool = True
@@ -1,43 +1,90 @@
 """FastAPI 应用主入口"""
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from loguru import logger
 
 from app.config import settings
 from app.models.database import init_db
+from app.services.result_index import migrate_legacy_results
 from app.api import router
-from app.middleware import LoggingMiddleware
+from app.middleware import CompressionMiddleware, LoggingMiddleware, TracingMiddleware
 from app.services.task_queue import task_queue
-from app.services.ssh_service import ssh_service
+from app.services.backend_pool import backend_pool
 from app.services.task_processor import process_inference_task
-from app.utils.logger import setup_logger
+from app.services.admission import admission_controller
+from app.services.analytics import task_analytics
+from app.services.autoscaler import concurrency_controller
+from app.services.profiler import loop_monitor
+from app.services.readiness import readiness
+from app.services.retention import retention_service
+from app.services.simulation import mock_engine
+from app.utils.logger import setup_logger, shutdown_logger
+
+
+async def _probe_hosts() -> str:
+    """探测推理主机（健康检查周期之外的首次检查）"""
+    healthy = sum(await backend_pool.check_all())
+    if not healthy:
+        raise RuntimeError(f"没有可用的推理主机（共 {len(backend_pool.backends)} 台）")
+    return f"{healthy}/{len(backend_pool.backends)} 台推理主机可用"
+
+
+async def _migrate_legacy_results() -> str:
+    return f"迁移 {await migrate_legacy_results()} 个任务"
+
+
+async def _warm_mock_pool() -> str:
+    await mock_engine.prepare()
+    return f"{mock_engine.pool.size} 个模拟结果"
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时执行
+    startup_start = time.time()
     setup_logger()
     logger.info(f"启动 {settings.APP_NAME} v{settings.APP_VERSION}")
+    # 事件循环监控最先启动，启动阶段的阻塞调用同样会被记录
+    await loop_monitor.start()
     
-    # 初始化数据库
-    logger.info("初始化数据库...")
-    await init_db()
+    # 初始化数据库（表结构未变化时只读取一次结构指纹）
+    readiness.begin("database")
+    checked = await init_db()
+    readiness.finish("database", detail="已检查表结构" if checked else "表结构未变化")
     
-    # 连接SSH服务器（Mock模式跳过）
+    # 慢依赖在后台执行，不阻塞启动：推理主机探测、旧数据迁移、模拟结果预热
     if settings.MOCK_MODE:
         logger.info("[MOCK MODE] 跳过SSH连接，使用模拟数据")
+        readiness.run_in_background("mock_pool", _warm_mock_pool)
     else:
-        logger.info("连接SSH服务器...")
-        ssh_service.connect()
+        logger.info(f"后台检查推理主机（{len(backend_pool.backends)} 台）...")
+        readiness.run_in_background("inference_hosts", _probe_hosts)
+    readiness.run_in_background("legacy_results", _migrate_legacy_results)
+    # 任务统计在任务队列之前启动，之前结束的任务（首次启用时）由后台回填
+    await task_analytics.start()
+    if settings.ANALYTICS_ENABLED:
+        readiness.run_in_background("analytics_backfill", task_analytics.backfill)
+    await backend_pool.start()
     
     # 启动任务队列
     logger.info("启动任务队列...")
+    readiness.begin("task_queue")
     await task_queue.start(process_inference_task)
+    await admission_controller.start()
+    readiness.finish("task_queue")
+    await concurrency_controller.start()
+    await retention_service.start()
     
-    logger.info("应用启动完成")
+    readiness.mark_serving()
+    logger.info(
+        f"应用启动完成，耗时 {time.time() - startup_start:.2f}s"
+        f"（距进程启动 {readiness.serving_at - readiness.process_started_at:.2f}s）"
+    )
     
     yield
     
@@ -45,12 +92,21 @@ async def lifespan(app: FastAPI):
     logger.info("正在关闭应用...")
     
     # 停止任务队列
+    await readiness.stop()
+    await retention_service.stop()
+    await concurrency_controller.stop()
+    await admission_controller.stop()
     await task_queue.stop()
+    await task_analytics.stop()
     
     # 断开SSH连接
-    ssh_service.disconnect()
+    await backend_pool.stop()
+    for backend in backend_pool.backends:
+        backend.service.disconnect()
     
+    await loop_monitor.stop()
     logger.info("应用已关闭")
+    shutdown_logger()
 
 
 # 创建FastAPI应用
@@ -59,6 +115,7 @@ app = FastAPI(
     description="自动驾驶大模型推理系统后端API",
     version=settings.APP_VERSION,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # orjson 序列化响应
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -72,9 +129,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 添加响应压缩中间件（位于日志中间件内层，访问日志记录压缩后的字节数）
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
 # 添加日志中间件
 app.add_middleware(LoggingMiddleware)
 
+# 添加请求追踪中间件（最外层，追踪覆盖整个请求）
+app.add_middleware(TracingMiddleware)
+
 # 注册路由
 app.include_router(router, prefix="/api", tags=["推理任务"])
 
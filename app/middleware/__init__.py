@@ -1,3 +1,5 @@
+from app.middleware.compression import CompressionMiddleware
 from app.middleware.logging import LoggingMiddleware
+from app.middleware.tracing import TracingMiddleware
 
-__all__ = ["LoggingMiddleware"]
+__all__ = ["CompressionMiddleware", "LoggingMiddleware", "TracingMiddleware"]
@@ -1,33 +1,72 @@
 """请求日志中间件"""
+import random
 import time
-from typing import Callable
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
 from loguru import logger
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from app.config import settings
+from app.services.readiness import readiness
+
+
+class LoggingMiddleware:
+    """
+    请求日志记录中间件（纯ASGI实现）
+
+    不包装请求/响应流，因此不影响流式响应与大文件传输；
+    日志写入由 loguru 的队列化 sink 在后台线程完成。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.sample_rates = settings.ACCESS_LOG_SAMPLE_RATES
+        self.slow_ms = settings.ACCESS_LOG_SLOW_MS
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if readiness.first_request_at is None:
+            readiness.mark_first_request()
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    """请求日志记录中间件"""
-    
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
         # 记录开始时间
-        start_time = time.time()
-        
-        # 获取请求信息
-        method = request.method
-        path = request.url.path
-        client_ip = request.client.host if request.client else None
-        
-        # 处理请求
-        response = await call_next(request)
-        
-        # 计算响应时间
-        response_time = int((time.time() - start_time) * 1000)  # 毫秒
-        
-        # 记录日志
+        start_time = time.perf_counter()
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            response_time = int((time.perf_counter() - start_time) * 1000)  # 毫秒
+            self._log(scope, status_code, response_time, response_bytes)
+
+    def _log(self, scope: Scope, status_code: int, response_time: int, response_bytes: int):
+        """按采样率记录访问日志（错误与慢请求始终记录）"""
+        route = scope.get("route")
+        route_path = getattr(route, "path", None)
+
+        if status_code < 400 and response_time < self.slow_ms:
+            rate = self.sample_rates.get(route_path, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return
+
+        client = scope.get("client")
         logger.info(
-            f"{method} {path} - {response.status_code} - {response_time}ms - {client_ip}"
+            "{method} {path} - {status} - {ms}ms - {bytes}B - {client_ip}",
+            method=scope["method"],
+            path=scope["path"],
+            route=route_path,
+            status=status_code,
+            ms=response_time,
+            bytes=response_bytes,
+            client_ip=client[0] if client else None,
         )
-        
-        return response
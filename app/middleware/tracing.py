@@ -0,0 +1,75 @@
+"""请求追踪中间件"""
+import threading
+import time
+import uuid
+
+from loguru import logger
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.profiler import admin_authorized, sampling_profiler, trace_store
+
+
+class TracingMiddleware:
+    """
+    按请求开启的追踪（纯ASGI实现）
+
+    请求头带 X-Trace: 1 与有效的 X-Admin-Token 时，请求期间对事件循环线程采样，
+    响应头返回 X-Trace-Id 与 Server-Timing（处理耗时、期间事件循环线程的繁忙时间），
+    调用栈通过 GET /api/admin/traces/{trace_id} 获取；未带请求头时只检查一次请求头，不产生其他开销。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = token = None
+        for name, value in scope["headers"]:
+            if name == b"x-trace":
+                trace = value
+            elif name == b"x-admin-token":
+                token = value
+        if trace not in (b"1", b"true") or not admin_authorized(token.decode("latin-1") if token else None):
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = uuid.uuid4().hex[:16]
+        status_code = 500
+        start_time = time.perf_counter()
+        session = sampling_profiler.start_session({threading.get_ident()})
+
+        def busy(elapsed: float) -> float:
+            """事件循环线程的繁忙时间（按非空闲样本的比例估算，包含同时处理的其他请求）"""
+            samples = session.samples
+            return elapsed * (samples - session.idle_samples) / samples if samples else 0.0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers["X-Trace-Id"] = trace_id
+                elapsed = time.perf_counter() - start_time
+                headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}, loop-busy;dur={busy(elapsed) * 1000:.1f}"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampling_profiler.stop_session(session)
+            trace_store.save({
+                "trace_id": trace_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round(session.seconds * 1000, 1),
+                "loop_busy_ms": round(busy(session.seconds) * 1000, 1),
+                "samples": session.samples,
+                "idle_samples": session.idle_samples,
+                "session": session,
+            })
+            logger.info(f"请求追踪: {trace_id} {scope['method']} {scope['path']} - {session.samples} 个样本")
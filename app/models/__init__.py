@@ -1,4 +1,4 @@
 from app.models.database import Base, get_db, init_db
-from app.models.task import Task, TaskStatus
+from app.models.task import Task, TaskStatus, TaskFile, TaskRollup, PathPrefix
 
-__all__ = ["Base", "get_db", "init_db", "Task", "TaskStatus"]
+__all__ = ["Base", "get_db", "init_db", "Task", "TaskStatus", "TaskFile", "TaskRollup", "PathPrefix"]
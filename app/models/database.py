@@ -1,4 +1,7 @@
 """数据库配置和会话管理"""
+import hashlib
+
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
@@ -38,7 +41,48 @@ async def get_db():
             await session.close()
 
 
-async def init_db():
-    """初始化数据库，创建所有表"""
+def _add_missing_columns(conn):
+    """为已存在的表补充新增的列（create_all 不会修改已有表结构）"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def _schema_version() -> int:
+    """表结构指纹（表、列、类型与索引），记录在 SQLite 的 user_version 中"""
+    items = []
+    for table in Base.metadata.sorted_tables:
+        items.extend(f"{table.name}.{column.name}:{column.type}" for column in table.columns)
+        items.extend(f"{table.name}#{index.name}" for index in table.indexes)
+    digest = hashlib.sha256("\n".join(sorted(items)).encode()).digest()
+    return int.from_bytes(digest[:4], "big") & 0x7FFFFFFF or 1
+
+
+async def init_db() -> bool:
+    """
+    初始化数据库，创建所有表
+    
+    SQLite 的表结构指纹与模型一致时跳过建表与补列检查，只读取一次 user_version
+    
+    Returns:
+        是否执行了建表检查
+    """
     async with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            version = _schema_version()
+            if (await conn.exec_driver_sql("PRAGMA user_version")).scalar() == version:
+                return False
+            # 新建数据库使用增量 VACUUM，删除记录后可分批回收空间（对已有数据库无效）
+            await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        if engine.dialect.name == "sqlite":
+            await conn.exec_driver_sql(f"PRAGMA user_version = {version}")
+    return True
@@ -1,7 +1,7 @@
 """任务模型定义"""
 import enum
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, Float
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, DateTime, Text, Enum, Float, ForeignKey, Index, LargeBinary
 from sqlalchemy.sql import func
 
 from app.models.database import Base
@@ -13,6 +13,9 @@ class TaskStatus(str, enum.Enum):
     PROCESSING = "processing"    # 处理中
     COMPLETED = "completed"      # 已完成
     FAILED = "failed"            # 失败
+    DEFERRED = "deferred"        # 队列已满，已持久化等待入队
+    CANCELLED = "cancelled"      # 已取消
+    EXPIRED = "expired"          # 超过期限仍未开始执行，已跳过
 
 
 class Task(Base):
@@ -34,14 +37,24 @@ class Task(Base):
     
     # 性能指标
     inference_time = Column(Float, nullable=True)  # 推理耗时(秒)
+    progress = Column(Float, nullable=True)  # 推理进度(0-100)，由远程输出解析
+    phase_timings = Column(Text, nullable=True)  # 各阶段时间点（紧凑JSON，见 phase_timing）
+    
+    # 执行主机
+    backend = Column(String(64), nullable=True)
     
     # 错误信息
     error_message = Column(Text, nullable=True)
     
     # 时间戳
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    # 微秒精度（条件请求的 ETag 依赖该字段，秒级精度无法区分同一秒内的多次更新）
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, server_default=func.now(), onupdate=datetime.utcnow, nullable=False
+    )
     completed_at = Column(DateTime, nullable=True)
+    deadline = Column(DateTime, nullable=True)  # 开始执行的期限（UTC），超过时不再执行
+    speculative = Column(Boolean, nullable=True)  # 推测执行且尚未被客户端认领的任务（认领后为 False）
     
     # 用户信息
     client_ip = Column(String(45), nullable=True)
@@ -49,3 +62,49 @@ class Task(Base):
     
     def __repr__(self):
         return f"<Task(task_id={self.task_id}, index={self.index}, subfolder={self.subfolder}, status={self.status})>"
+
+
+class PathPrefix(Base):
+    """结果文件目录表（相同目录只存一次）"""
+    __tablename__ = "path_prefixes"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    path = Column(String(1024), unique=True, nullable=False)  # 相对结果根目录的目录，根目录为空字符串
+
+
+class TaskFile(Base):
+    """任务结果文件表"""
+    __tablename__ = "task_files"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_pk = Column(Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False, index=True)  # tasks.id
+    prefix_id = Column(Integer, ForeignKey("path_prefixes.id"), nullable=False)
+    name = Column(String(255), nullable=False)  # 文件名
+    size = Column(BigInteger, nullable=True)  # 字节数
+    sha256 = Column(LargeBinary(32), nullable=True)  # 原始 32 字节
+    media_type = Column(String(8), nullable=False)  # image / video / other
+    
+    def __repr__(self):
+        return f"<TaskFile(task_pk={self.task_pk}, name={self.name})>"
+
+
+class TaskRollup(Base):
+    """任务统计汇总表（按时间桶与维度增量累加，见 analytics）"""
+    __tablename__ = "task_rollups"
+    __table_args__ = (
+        Index("ix_task_rollups_bucket", "granularity", "dimension", "bucket", "key", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    granularity = Column(String(8), nullable=False)  # minute / hour
+    dimension = Column(String(16), nullable=False)  # all / subfolder / client
+    bucket = Column(DateTime, nullable=False)  # 时间桶起点（UTC）
+    key = Column(String(64), nullable=False)  # 维度取值（all 为空字符串）
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    inference_sum = Column(Float, nullable=False, default=0.0)  # 完成任务的推理耗时之和（秒）
+    inference_max = Column(Float, nullable=False, default=0.0)
+    sketch = Column(Text, nullable=True)  # 推理耗时分位数草图（紧凑JSON）
+    
+    def __repr__(self):
+        return f"<TaskRollup({self.granularity} {self.bucket} {self.dimension}={self.key})>"
@@ -0,0 +1,245 @@
+"""准入控制 - 在写数据库之前判断队列容量，并提供 Retry-After 估算与延后入队"""
+import asyncio
+import enum
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import select, func, update
+
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import Task, TaskStatus
+from app.services.task_queue import EXPIRED_MESSAGE, task_queue
+from app.services.backend_pool import backend_pool
+
+
+class Admission(str, enum.Enum):
+    """准入结果"""
+    ACCEPT = "accept"    # 直接入队
+    DEFER = "defer"      # 持久化为 deferred，稍后入队
+    REJECT = "reject"    # 拒绝，客户端按 Retry-After 重试
+
+
+@dataclass
+class AdmissionDecision:
+    """准入判断结果"""
+    admission: Admission
+    retry_after: int          # 建议的重试等待（秒）
+    estimated_wait: float     # 预计排队等待（秒）
+
+
+class AdmissionController:
+    """准入控制器"""
+    
+    def __init__(self):
+        self._reserved = 0          # 已通过准入、尚未入队的任务数
+        self._deferred = 0          # deferred 任务数（含正在写入数据库的）
+        self._deferring = 0         # 正在写入数据库的 deferred 任务数
+        self._drain_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self.rejected_count = 0
+        self.deferred_count = 0
+    
+    @property
+    def capacity(self) -> int:
+        """允许排队的任务数上限（不超过队列本身的容量）"""
+        capacity = settings.ADMISSION_CAPACITY or settings.MAX_QUEUE_SIZE
+        return min(capacity, task_queue.max_size)
+    
+    @property
+    def pending(self) -> int:
+        """排队中（含已准入未入队）的任务数"""
+        return task_queue.queue_size + self._reserved
+    
+    def estimate_wait(self, ahead: int) -> float:
+        """根据最近吞吐量估算前方 ahead 个任务的等待时间（秒），无数据时返回 -1"""
+        throughput = task_queue.throughput(settings.ADMISSION_THROUGHPUT_WINDOW)
+        if throughput <= 0:
+            return -1
+        return (ahead + task_queue.active_count) / throughput
+    
+    def _retry_after(self, ahead: int) -> int:
+        wait = self.estimate_wait(ahead)
+        if wait < 0:
+            return settings.ADMISSION_DEFAULT_RETRY_AFTER
+        return min(max(int(math.ceil(wait)), 1), 3600)
+    
+    def admit(self) -> AdmissionDecision:
+        """
+        判断是否接受新任务（同步执行，不涉及数据库）
+        
+        ACCEPT 时会预留一个队列位置，调用方入队后须调用 release()；
+        DEFER 时调用方写入数据库后须调用 finish_deferral()
+        """
+        pending = self.pending
+        backend_up = backend_pool.is_available
+        if task_queue.is_running and backend_up and pending < self.capacity and self._deferred == 0:
+            self._reserved += 1
+            return AdmissionDecision(Admission.ACCEPT, 0, max(self.estimate_wait(pending), 0))
+        
+        # 队列已满（或已有 deferred 任务，需保持先后顺序），或所有推理主机已熔断
+        ahead = pending + self._deferred
+        retry_after = self._retry_after(ahead)
+        if not backend_up:
+            retry_after = max(retry_after, int(math.ceil(backend_pool.retry_after)), 1)
+        if settings.ADMISSION_DEFERRED and self._deferred < settings.ADMISSION_DEFERRED_MAX:
+            self._deferred += 1
+            self._deferring += 1
+            self.deferred_count += 1
+            return AdmissionDecision(Admission.DEFER, retry_after, max(self.estimate_wait(ahead), 0))
+        
+        self.rejected_count += 1
+        return AdmissionDecision(Admission.REJECT, retry_after, max(self.estimate_wait(ahead), 0))
+    
+    def try_reserve(self) -> bool:
+        """
+        有空余容量时预留一个队列位置（不延后、不计入拒绝），调用方入队后须调用 release()
+        
+        用于已被接受、需要移入队列的任务（如被认领的推测任务）
+        """
+        if task_queue.is_running and self.pending < self.capacity and self._deferred == 0:
+            self._reserved += 1
+            return True
+        return False
+    
+    def release(self):
+        """释放 ACCEPT 时预留的队列位置"""
+        self._reserved = max(self._reserved - 1, 0)
+    
+    def finish_deferral(self, committed: bool):
+        """DEFER 的任务写入数据库完成（committed=False 表示写入失败，撤销计数）"""
+        self._deferring = max(self._deferring - 1, 0)
+        if not committed:
+            self._deferred = max(self._deferred - 1, 0)
+        self._wakeup.set()
+    
+    def cancel_deferred(self):
+        """deferred 任务被取消"""
+        self._deferred = max(self._deferred - 1, 0)
+    
+    def notify_capacity(self):
+        """队列腾出空位（如任务被取消），唤醒回填协程"""
+        self._wakeup.set()
+    
+    async def start(self):
+        """启动 deferred 任务回填协程"""
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(func.count(Task.id)).where(Task.status == TaskStatus.DEFERRED)
+            )
+            self._deferred = result.scalar() or 0
+        if self._deferred:
+            logger.info(f"发现 {self._deferred} 个 deferred 任务，等待回填入队")
+        self._drain_task = asyncio.create_task(self._drain_loop())
+    
+    async def stop(self):
+        """停止回填协程"""
+        if self._drain_task:
+            self._drain_task.cancel()
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+            self._drain_task = None
+    
+    async def _drain_loop(self):
+        """队列有空位时按创建顺序将 deferred 任务转为 pending 并入队"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._deferred == 0:
+                continue
+            try:
+                await self._drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"deferred 任务回填失败: {e}")
+    
+    async def _drain_once(self):
+        """回填一批 deferred 任务，已超过期限的任务直接标记为过期，不占用队列位置"""
+        free = self.capacity - self.pending
+        if free <= 0 or not task_queue.is_running or not backend_pool.is_available:
+            return
+        
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(Task.task_id, Task.index, Task.subfolder, Task.deadline)
+                .where(Task.status == TaskStatus.DEFERRED)
+                .order_by(Task.id)
+                .limit(free)
+            )
+            tasks = result.all()
+            if not tasks:
+                if self._deferring == 0:
+                    self._deferred = 0
+                return
+            # 按状态条件更新：读取之后被取消的任务（cancel_task 已扣减计数）不再回填
+            now = datetime.utcnow()
+            promoted, expired = [], 0
+            for task in tasks:
+                if task.deadline and task.deadline <= now:
+                    values = {"status": TaskStatus.EXPIRED, "completed_at": now, "error_message": EXPIRED_MESSAGE}
+                else:
+                    values = {"status": TaskStatus.PENDING}
+                updated = await session.execute(
+                    update(Task)
+                    .where(Task.task_id == task.task_id, Task.status == TaskStatus.DEFERRED)
+                    .values(**values)
+                )
+                if updated.rowcount != 1:
+                    continue
+                self._deferred = max(self._deferred - 1, 0)
+                if values["status"] == TaskStatus.EXPIRED:
+                    expired += 1
+                else:
+                    promoted.append(task)
+            await session.commit()
+        
+        if expired:
+            task_queue.record_expired(expired)
+            logger.info(f"{expired} 个 deferred 任务已过期，跳过回填")
+        requeued = 0
+        for task in promoted:
+            enqueued = await task_queue.enqueue({
+                "task_id": task.task_id,
+                "index": task.index,
+                "subfolder": task.subfolder
+            })
+            if not enqueued:
+                # 队列已满（不应发生，free 按队列实际占用计算），退回 deferred 等待下次回填
+                requeued += await self._return_to_deferred(task.task_id)
+        logger.info(f"已回填 {len(promoted) - requeued} 个 deferred 任务，剩余 {self._deferred} 个")
+    
+    async def _return_to_deferred(self, task_id: str) -> int:
+        async with async_session_factory() as session:
+            updated = await session.execute(
+                update(Task)
+                .where(Task.task_id == task_id, Task.status == TaskStatus.PENDING)
+                .values(status=TaskStatus.DEFERRED)
+            )
+            await session.commit()
+        if updated.rowcount:
+            self._deferred += 1
+        return updated.rowcount
+    
+    @property
+    def stats(self) -> dict:
+        """准入统计"""
+        return {
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "deferred": self._deferred,
+            "rejected_total": self.rejected_count,
+            "deferred_total": self.deferred_count,
+            "throughput_per_min": round(
+                task_queue.throughput(settings.ADMISSION_THROUGHPUT_WINDOW) * 60, 2
+            ),
+        }
+
+
+# 全局准入控制器实例
+admission_controller = AdmissionController()
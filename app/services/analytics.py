@@ -0,0 +1,430 @@
+"""任务统计 - 任务结束时增量更新分钟/小时汇总（吞吐量、失败率、推理耗时分位数草图），查询只读取汇总表"""
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import Task, TaskRollup, TaskStatus
+
+
+# 时间粒度 -> 时间桶长度（秒）
+GRANULARITIES = {"minute": 60, "hour": 3600}
+
+# 汇总维度: all（全部任务）/ subfolder / client（客户端 IP）
+DIMENSIONS = ("all", "subfolder", "client")
+
+# 计入统计的任务状态（实际占用推理主机的任务）
+RECORDED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+# 小于该值的耗时计入零桶（秒）
+SKETCH_MIN_VALUE = 1e-3
+
+# 清除过期汇总的间隔（秒）
+PRUNE_INTERVAL = 3600
+
+# 历史任务回填每批读取的记录数
+BACKFILL_BATCH_SIZE = 1000
+
+# 汇总键: (粒度, 维度, 时间桶起点, 维度取值)
+RollupKey = Tuple[str, str, datetime, str]
+
+
+class QuantileSketch:
+    """
+    分位数草图（对数分桶）：分位数的相对误差不超过 accuracy，草图之间可以直接合并；
+    桶数只与取值范围有关（1% 精度下 0.1 秒到 1 小时约 530 个桶），与样本数无关
+    """
+    
+    def __init__(self, accuracy: float):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+    
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.bins.values())
+    
+    def add(self, value: float, count: int = 1):
+        if value <= SKETCH_MIN_VALUE:
+            self.zeros += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+    
+    def _value(self, index: int) -> float:
+        """桶的代表值（与桶内任意取值的相对误差不超过 accuracy）"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+    
+    def merge(self, other: "QuantileSketch"):
+        self.zeros += other.zeros
+        if other.gamma == self.gamma:
+            for index, count in other.bins.items():
+                self.bins[index] = self.bins.get(index, 0) + count
+            return
+        # 精度配置变化前写入的草图，按代表值重新分桶
+        for index, count in other.bins.items():
+            self.add(other._value(index), count)
+    
+    def quantile(self, q: float) -> float:
+        """第 q 百分位数"""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = (total - 1) * q / 100
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.bins))
+    
+    def to_json(self) -> str:
+        data = {"g": self.gamma, "b": [[index, count] for index, count in sorted(self.bins.items())]}
+        if self.zeros:
+            data["z"] = self.zeros
+        return json.dumps(data, separators=(",", ":"))
+    
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> "QuantileSketch":
+        sketch = cls(settings.ANALYTICS_SKETCH_ACCURACY)
+        if not raw:
+            return sketch
+        data = json.loads(raw)
+        stored = cls.__new__(cls)
+        stored.gamma = data["g"]
+        stored._log_gamma = math.log(stored.gamma)
+        stored.bins = {index: count for index, count in data["b"]}
+        stored.zeros = data.get("z", 0)
+        sketch.merge(stored)
+        return sketch
+
+
+@dataclass
+class Rollup:
+    """一个时间桶、一个维度取值的汇总"""
+    completed: int = 0
+    failed: int = 0
+    inference_sum: float = 0.0
+    inference_max: float = 0.0
+    sketch: QuantileSketch = field(default_factory=lambda: QuantileSketch(settings.ANALYTICS_SKETCH_ACCURACY))
+    
+    def add(self, status: TaskStatus, inference_time: Optional[float]):
+        if status != TaskStatus.COMPLETED:
+            self.failed += 1
+            return
+        self.completed += 1
+        if inference_time is not None:
+            self.inference_sum += inference_time
+            self.inference_max = max(self.inference_max, inference_time)
+            self.sketch.add(inference_time)
+    
+    def merge(self, other: "Rollup"):
+        self.completed += other.completed
+        self.failed += other.failed
+        self.inference_sum += other.inference_sum
+        self.inference_max = max(self.inference_max, other.inference_max)
+        self.sketch.merge(other.sketch)
+    
+    @classmethod
+    def from_row(cls, row: TaskRollup) -> "Rollup":
+        return cls(row.completed, row.failed, row.inference_sum, row.inference_max, QuantileSketch.from_json(row.sketch))
+    
+    def summary(self, seconds: float) -> dict:
+        """汇总指标（seconds 为统计时长，用于计算吞吐量）"""
+        finished = self.completed + self.failed
+        timed = self.sketch.count
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "failure_rate": round(self.failed / finished, 4) if finished else 0.0,
+            "throughput_per_min": round(self.completed * 60 / seconds, 3) if seconds > 0 else 0.0,
+            "inference_time": {
+                "count": timed,
+                "mean": round(self.inference_sum / timed, 3) if timed else 0.0,
+                "p50": round(self.sketch.quantile(50), 3),
+                "p90": round(self.sketch.quantile(90), 3),
+                "p99": round(self.sketch.quantile(99), 3),
+                "max": round(self.inference_max, 3),
+            },
+        }
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """时间所在时间桶的起点"""
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def _rollup_keys(moment: datetime, subfolder: Optional[str], client_ip: Optional[str]) -> Iterable[RollupKey]:
+    values = {"all": "", "subfolder": subfolder or "", "client": client_ip or "unknown"}
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(moment, granularity)
+        for dimension in DIMENSIONS:
+            yield granularity, dimension, bucket, values[dimension]
+
+
+class TaskAnalytics:
+    """
+    任务统计
+    
+    任务结束时只在内存中累加，每 ANALYTICS_FLUSH_INTERVAL 秒合并写入 task_rollups 表（每个时间桶、
+    维度取值一行），查询读取的行数只与时间窗口有关，不随历史任务增多而变慢，也不扫描 tasks 表
+    """
+    
+    def __init__(self):
+        self._pending: Dict[RollupKey, Rollup] = {}
+        self._flushing: Dict[RollupKey, Rollup] = {}  # 正在写入的汇总（查询时一并计入）
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.started_at: Optional[datetime] = None
+        self._pruned_at = 0.0
+        self.recorded = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.last_flush_at: Optional[float] = None
+    
+    async def start(self):
+        """启动汇总写入循环（需在任务队列启动之前调用，此后结束的任务由 record 统计）"""
+        self.started_at = datetime.utcnow()
+        if not settings.ANALYTICS_ENABLED:
+            return
+        self._task = asyncio.create_task(self._loop())
+    
+    async def stop(self):
+        """停止写入循环，写入剩余的汇总"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"任务统计写入失败: {e}")
+    
+    def record(self, status: TaskStatus, subfolder: Optional[str], client_ip: Optional[str], inference_time: Optional[float]):
+        """统计一个结束的任务（只更新内存）"""
+        if not settings.ANALYTICS_ENABLED or status not in RECORDED_STATUSES:
+            return
+        self.recorded += 1
+        for key in _rollup_keys(datetime.utcnow(), subfolder, client_ip):
+            self._pending.setdefault(key, Rollup()).add(status, inference_time)
+    
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.ANALYTICS_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+                if time.time() - self._pruned_at >= PRUNE_INTERVAL:
+                    await self._prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"任务统计写入失败: {e}")
+    
+    async def flush(self) -> int:
+        """将内存中的汇总合并写入数据库，返回写入的行数"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            try:
+                await self._write(self._flushing)
+            except BaseException:
+                # 写入失败时放回，下次重试
+                for key, rollup in self._flushing.items():
+                    self._pending.setdefault(key, Rollup()).merge(rollup)
+                raise
+            finally:
+                written, self._flushing = len(self._flushing), {}
+            self.flushes += 1
+            self.flushed_rows += written
+            self.last_flush_at = time.time()
+            return written
+    
+    @staticmethod
+    async def _write(rollups: Dict[RollupKey, Rollup]):
+        """读取已有的汇总行合并后写回（单个事务）"""
+        async with async_session_factory() as session:
+            for (granularity, dimension, bucket, key), rollup in rollups.items():
+                result = await session.execute(
+                    select(TaskRollup).where(
+                        TaskRollup.granularity == granularity,
+                        TaskRollup.dimension == dimension,
+                        TaskRollup.bucket == bucket,
+                        TaskRollup.key == key
+                    )
+                )
+                row = result.scalar_one_or_none()
+                if row is None:
+                    row = TaskRollup(granularity=granularity, dimension=dimension, bucket=bucket, key=key)
+                    session.add(row)
+                else:
+                    merged = Rollup.from_row(row)
+                    merged.merge(rollup)
+                    rollup = merged
+                row.completed = rollup.completed
+                row.failed = rollup.failed
+                row.inference_sum = rollup.inference_sum
+                row.inference_max = rollup.inference_max
+                row.sketch = rollup.sketch.to_json()
+            await session.commit()
+    
+    async def _prune(self):
+        """删除超过保留期的汇总"""
+        self._pruned_at = time.time()
+        now = datetime.utcnow()
+        async with async_session_factory() as session:
+            result = await session.execute(
+                delete(TaskRollup).where(
+                    TaskRollup.granularity == "minute",
+                    TaskRollup.bucket < now - timedelta(hours=settings.ANALYTICS_MINUTE_RETENTION_HOURS)
+                )
+            )
+            removed = result.rowcount
+            if settings.ANALYTICS_HOUR_RETENTION_DAYS > 0:
+                result = await session.execute(
+                    delete(TaskRollup).where(
+                        TaskRollup.granularity == "hour",
+                        TaskRollup.bucket < now - timedelta(days=settings.ANALYTICS_HOUR_RETENTION_DAYS)
+                    )
+                )
+                removed += result.rowcount
+            await session.commit()
+        if removed:
+            logger.info(f"已删除 {removed} 条过期的任务统计汇总")
+    
+    async def backfill(self) -> str:
+        """
+        汇总表为空时（首次启用）从已有任务记录回填，只统计 start 之前结束的任务；
+        分批读取 tasks 表，最后在一个事务中写入，中途失败不会留下部分数据
+        """
+        async with async_session_factory() as session:
+            if (await session.execute(select(TaskRollup.id).limit(1))).first():
+                return "汇总表已有数据，跳过回填"
+        
+        cutoff = self.started_at or datetime.utcnow()
+        minute_since = cutoff - timedelta(hours=settings.ANALYTICS_MINUTE_RETENTION_HOURS)
+        rollups: Dict[RollupKey, Rollup] = {}
+        tasks = 0
+        last_id = 0
+        while True:
+            async with async_session_factory() as session:
+                result = await session.execute(
+                    select(
+                        Task.id, Task.status, Task.subfolder, Task.client_ip, Task.inference_time, Task.completed_at
+                    )
+                    .where(
+                        Task.id > last_id,
+                        Task.status.in_(RECORDED_STATUSES),
+                        Task.completed_at.is_not(None),
+                        Task.completed_at < cutoff
+                    )
+                    .order_by(Task.id)
+                    .limit(BACKFILL_BATCH_SIZE)
+                )
+                rows = result.all()
+            if not rows:
+                break
+            for row in rows:
+                for key in _rollup_keys(row.completed_at, row.subfolder, row.client_ip):
+                    if key[0] == "minute" and row.completed_at < minute_since:
+                        continue
+                    rollups.setdefault(key, Rollup()).add(row.status, row.inference_time)
+            tasks += len(rows)
+            last_id = rows[-1].id
+            await asyncio.sleep(0)
+        
+        if rollups:
+            await self._write(rollups)
+        return f"回填 {tasks} 个任务"
+    
+    async def query(
+        self, granularity: str, buckets: int, dimension: str, key: Optional[str] = None, limit: int = 20
+    ) -> dict:
+        """
+        查询最近 buckets 个时间桶的统计（含当前未结束的时间桶）
+        
+        Returns:
+            按任务数从多到少排列的前 limit 个维度取值，每项包含窗口内的汇总与各时间桶的序列
+        """
+        step = GRANULARITIES[granularity]
+        now = datetime.utcnow()
+        since = bucket_start(now, granularity) - timedelta(seconds=step * (buckets - 1))
+        
+        query = select(TaskRollup).where(
+            TaskRollup.granularity == granularity,
+            TaskRollup.dimension == dimension,
+            TaskRollup.bucket >= since
+        )
+        if key is not None:
+            query = query.where(TaskRollup.key == key)
+        async with async_session_factory() as session:
+            rows = (await session.execute(query)).scalars().all()
+        
+        series: Dict[str, Dict[datetime, Rollup]] = {}
+        for row in rows:
+            series.setdefault(row.key, {})[row.bucket] = Rollup.from_row(row)
+        # 尚未写入数据库的汇总
+        for pending in (self._flushing, self._pending):
+            for (pending_granularity, pending_dimension, bucket, pending_key), rollup in list(pending.items()):
+                if (
+                    pending_granularity != granularity or pending_dimension != dimension or bucket < since
+                    or (key is not None and pending_key != key)
+                ):
+                    continue
+                series.setdefault(pending_key, {}).setdefault(bucket, Rollup()).merge(rollup)
+        
+        window = (now - since).total_seconds()
+        groups = []
+        for group_key, by_bucket in series.items():
+            total = Rollup()
+            for rollup in by_bucket.values():
+                total.merge(rollup)
+            groups.append((group_key, total, by_bucket))
+        groups.sort(key=lambda item: item[1].completed + item[1].failed, reverse=True)
+        
+        return {
+            "granularity": granularity,
+            "dimension": dimension,
+            "since": since,
+            "until": now,
+            "groups": [
+                {
+                    "key": group_key,
+                    "total": total.summary(window),
+                    "series": [
+                        {"bucket": bucket, **by_bucket[bucket].summary(min(step, (now - bucket).total_seconds()))}
+                        for bucket in sorted(by_bucket)
+                    ],
+                }
+                for group_key, total, by_bucket in groups[:limit]
+            ],
+        }
+    
+    @property
+    def stats(self) -> dict:
+        """统计写入情况"""
+        return {
+            "enabled": settings.ANALYTICS_ENABLED,
+            "recorded_total": self.recorded,
+            "pending_rows": len(self._pending),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "last_flush_at": self.last_flush_at,
+        }
+
+
+# 全局任务统计实例
+task_analytics = TaskAnalytics()
@@ -0,0 +1,132 @@
+"""工作协程自适应扩缩容 - 根据推理延迟、失败率与远程GPU负载调整并发（AIMD）"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.task_queue import task_queue
+from app.services.backend_pool import backend_pool
+from app.services.phase_timing import percentile
+
+
+class ConcurrencyController:
+    """
+    并发控制器
+    
+    每个周期采集上一周期完成任务的处理耗时与成功率，并可选探测远程GPU负载:
+    - 失败率超限、GPU饱和或 p50 延迟超过目标时，乘性减少 Worker 数
+    - 队列有积压且各项指标正常时，加性增加 1 个 Worker
+    - 其余情况保持不变
+    """
+    
+    def __init__(self):
+        self.min_workers = max(settings.AUTOSCALE_MIN_WORKERS, 1)
+        self.max_workers = max(settings.AUTOSCALE_MAX_WORKERS, self.min_workers)
+        self._task: Optional[asyncio.Task] = None
+        self.decisions: deque = deque(maxlen=50)  # 最近的扩缩容决策
+        self.last_metrics: dict = {}
+    
+    async def start(self):
+        """启动控制循环（未开启自适应时不启动）"""
+        if not settings.AUTOSCALE_ENABLED:
+            return
+        initial = min(max(task_queue.target_workers, self.min_workers), self.max_workers)
+        task_queue.resize(initial)
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"自适应并发已开启，Worker 范围: {self.min_workers}-{self.max_workers}")
+    
+    async def stop(self):
+        """停止控制循环"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.AUTOSCALE_INTERVAL)
+            try:
+                await self.step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"自适应并发调整失败: {e}")
+    
+    async def step(self):
+        """执行一次采集与调整"""
+        outcomes = task_queue.collect_outcomes()
+        latencies = sorted(duration for duration, _ in outcomes)
+        failures = sum(1 for _, ok in outcomes if not ok)
+        
+        gpu = None
+        if settings.AUTOSCALE_GPU_PROBE:
+            gpu = await asyncio.to_thread(backend_pool.probe_gpu_load)
+        
+        metrics = {
+            "completed": len(outcomes),
+            "failure_rate": round(failures / len(outcomes), 3) if outcomes else 0.0,
+            "latency_p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "backlog": task_queue.waiting_count,
+            "active": task_queue.active_count,
+            "gpu": gpu,
+        }
+        self.last_metrics = metrics
+        
+        current = task_queue.target_workers
+        target, reason = self._decide(current, metrics)
+        if target != current:
+            task_queue.resize(target)
+            self.decisions.append({
+                "time": time.time(),
+                "from": current,
+                "to": target,
+                "reason": reason,
+                "metrics": metrics,
+            })
+            logger.info(f"自适应并发: {current} -> {target}，原因: {reason}")
+    
+    def _decide(self, current: int, metrics: dict):
+        """AIMD 决策，返回 (目标 Worker 数, 原因)"""
+        gpu = metrics["gpu"]
+        latency_target = settings.AUTOSCALE_TARGET_LATENCY
+        
+        reason = None
+        if metrics["completed"] and metrics["failure_rate"] > settings.AUTOSCALE_MAX_FAILURE_RATE:
+            reason = f"失败率 {metrics['failure_rate']:.0%} 超过阈值"
+        elif gpu and (gpu["utilization"] >= settings.AUTOSCALE_GPU_HIGH
+                      or gpu["memory"] >= settings.AUTOSCALE_GPU_MEMORY_HIGH):
+            reason = f"GPU 饱和 (利用率 {gpu['utilization']:.0f}%, 显存 {gpu['memory']:.0%})"
+        elif latency_target and metrics["latency_p50"] and metrics["latency_p50"] > latency_target:
+            reason = f"p50 延迟 {metrics['latency_p50']}s 超过目标 {latency_target}s"
+        
+        if reason:
+            target = max(self.min_workers, math.floor(current * settings.AUTOSCALE_DECREASE_FACTOR))
+            return target, reason
+        
+        # 仅在有积压、且当前 Worker 均在忙时扩容
+        if metrics["backlog"] > 0 and metrics["active"] >= current and current < self.max_workers:
+            return current + 1, f"队列积压 {metrics['backlog']} 个任务"
+        
+        return current, "保持"
+    
+    @property
+    def stats(self) -> dict:
+        """并发指标"""
+        return {
+            "autoscale": settings.AUTOSCALE_ENABLED,
+            "current": task_queue.worker_count,
+            "target": task_queue.target_workers,
+            "active": task_queue.active_count,
+            "min": self.min_workers,
+            "max": self.max_workers,
+            "last_metrics": self.last_metrics,
+            "decisions": list(self.decisions)[-10:],
+        }
+
+
+# 全局并发控制器实例
+concurrency_controller = ConcurrencyController()
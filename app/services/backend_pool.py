@@ -0,0 +1,251 @@
+"""推理主机池 - 多台推理主机的调度、健康检查与指标"""
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.executor import InferenceExecutor
+from app.services.local_executor import LocalExecutor
+from app.services.ssh_service import SSHService, ssh_service
+
+
+class NoBackendAvailable(Exception):
+    """没有可用的推理主机"""
+
+
+class InferenceBackend:
+    """单台推理主机"""
+    
+    def __init__(self, service: InferenceExecutor, slots: int = 0):
+        self.service = service
+        self.name = service.name
+        self.slots = slots  # 并发槽位数，0 表示不限制
+        self.in_flight = 0
+        self.ewma_latency: Optional[float] = None  # 推理耗时的指数滑动平均（秒）
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0  # 执行中被取消的任务，不计入失败
+        self.transport_errors = 0
+        self.busy_seconds = 0.0
+        self.last_check: Optional[float] = None
+    
+    @property
+    def healthy(self) -> bool:
+        """熔断器未打开（half_open 时允许试探）"""
+        return self.service.breaker.state != self.service.breaker.OPEN
+    
+    @property
+    def available(self) -> bool:
+        """是否可以接收新任务"""
+        return self.healthy and (self.slots == 0 or self.in_flight < self.slots)
+    
+    def load_score(self) -> float:
+        """调度打分，越小越优先"""
+        load = self.in_flight / self.slots if self.slots else float(self.in_flight)
+        if settings.BACKEND_STRATEGY == "latency" and self.ewma_latency:
+            # 预计完成时间：排队中的任务数 × 平均推理耗时
+            return (self.in_flight + 1) * self.ewma_latency
+        return load
+    
+    @property
+    def stats(self) -> dict:
+        """主机指标"""
+        return {
+            "name": self.name,
+            "host": self.service.host,
+            "healthy": self.healthy,
+            "slots": self.slots,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "transport_errors": self.transport_errors,
+            "ewma_latency": round(self.ewma_latency, 2) if self.ewma_latency else None,
+            "busy_seconds": round(self.busy_seconds, 1),
+            "breaker": self.service.breaker.stats,
+        }
+
+
+def create_executor(host: dict) -> InferenceExecutor:
+    """
+    按主机配置创建执行后端：executor 未填写时使用 INFERENCE_EXECUTOR
+    
+    Mock 模式始终使用 SSHService 的模拟推理；未配置 INFERENCE_HOSTS 的 SSH 单主机复用全局 ssh_service
+    """
+    executor = host.get("executor") or settings.INFERENCE_EXECUTOR
+    if executor == "local" and not settings.MOCK_MODE:
+        return LocalExecutor(name=host.get("name"))
+    if executor not in ("ssh", "local"):
+        raise ValueError(f"无法识别的推理执行方式: {executor}")
+    if not host:
+        return ssh_service
+    return SSHService(
+        host=host.get("host"),
+        port=host.get("port"),
+        user=host.get("user"),
+        password=host.get("password"),
+        name=host.get("name")
+    )
+
+
+class BackendPool:
+    """推理主机池"""
+    
+    def __init__(self):
+        self.backends: List[InferenceBackend] = self._load_backends()
+        self._changed: Optional[asyncio.Condition] = None
+        self._health_task: Optional[asyncio.Task] = None
+    
+    def _load_backends(self) -> List[InferenceBackend]:
+        """从配置加载主机列表；未配置 INFERENCE_HOSTS 时使用 SSH_* 单主机"""
+        if not settings.INFERENCE_HOSTS:
+            return [InferenceBackend(create_executor({}), settings.BACKEND_DEFAULT_SLOTS)]
+        
+        return [
+            InferenceBackend(create_executor(host), host.get("slots", settings.BACKEND_DEFAULT_SLOTS))
+            for host in settings.INFERENCE_HOSTS
+        ]
+    
+    @property
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+    
+    def get(self, name: str) -> Optional[InferenceBackend]:
+        """按名称获取主机"""
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+    
+    def has_alternative(self, exclude: Iterable[str]) -> bool:
+        """除 exclude 之外是否还有健康的主机"""
+        excluded = set(exclude)
+        return any(b.healthy and b.name not in excluded for b in self.backends)
+    
+    def _pick(self, exclude: set) -> Optional[InferenceBackend]:
+        candidates = [b for b in self.backends if b.available and b.name not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: b.load_score())
+    
+    async def acquire(self, exclude: Iterable[str] = ()) -> InferenceBackend:
+        """
+        选择负载最低（或预计完成最早）的可用主机并占用一个槽位
+        
+        所有主机槽位已满时等待，在 BACKEND_ACQUIRE_TIMEOUT 内没有空闲槽位时抛出 NoBackendAvailable；
+        所有主机均已熔断时立即抛出，不占用 Worker 等待
+        """
+        excluded = set(exclude)
+        condition = self._condition
+        
+        async with condition:
+            try:
+                backend = await asyncio.wait_for(
+                    condition.wait_for(lambda: self._pick(excluded) or not self.has_alternative(excluded)),
+                    timeout=settings.BACKEND_ACQUIRE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise NoBackendAvailable("等待推理主机空闲超时")
+            if backend is True:
+                raise NoBackendAvailable(f"所有推理主机已熔断，{self.retry_after:.0f}s 后重试")
+            backend.in_flight += 1
+            return backend
+    
+    async def release(
+        self, backend: InferenceBackend, duration: float, succeeded: bool,
+        transport_error: bool = False, cancelled: bool = False
+    ):
+        """释放槽位并记录本次执行结果（取消的任务只计入 cancelled，不影响失败数与平均耗时）"""
+        backend.in_flight = max(backend.in_flight - 1, 0)
+        backend.busy_seconds += duration
+        if cancelled:
+            backend.cancelled += 1
+            await self._notify()
+            return
+        if succeeded:
+            backend.completed += 1
+            alpha = 0.3
+            backend.ewma_latency = duration if backend.ewma_latency is None else (
+                alpha * duration + (1 - alpha) * backend.ewma_latency
+            )
+        else:
+            backend.failed += 1
+        if transport_error:
+            backend.transport_errors += 1
+        await self._notify()
+    
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+    
+    async def check_backend(self, backend: InferenceBackend) -> bool:
+        """
+        健康检查单台主机
+        
+        结果计入该主机的熔断器；熔断器处于 half_open 时本次检查即为试探调用，成功后主机恢复可用
+        """
+        if settings.MOCK_MODE:
+            return True
+        if backend.service.breaker.state == backend.service.breaker.OPEN:
+            return False
+        ok = await asyncio.to_thread(backend.service.connect)
+        backend.last_check = time.time()
+        return ok
+    
+    async def check_all(self) -> List[bool]:
+        """并发检查所有主机，返回各主机的检查结果"""
+        results = await asyncio.gather(*(self.check_backend(b) for b in self.backends))
+        await self._notify()
+        return list(results)
+    
+    async def start(self):
+        """启动周期性健康检查"""
+        self._health_task = asyncio.create_task(self._health_loop())
+    
+    async def stop(self):
+        """停止健康检查"""
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+    
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(settings.BACKEND_HEALTH_INTERVAL)
+            try:
+                await self.check_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"推理主机健康检查失败: {e}")
+    
+    def probe_gpu_load(self) -> Optional[dict]:
+        """探测所有健康主机的GPU负载，返回最饱和的一台"""
+        readings = [b.service.probe_gpu_load() for b in self.backends if b.healthy]
+        readings = [r for r in readings if r]
+        if not readings:
+            return None
+        return max(readings, key=lambda r: max(r["utilization"] / 100, r["memory"]))
+    
+    @property
+    def is_available(self) -> bool:
+        """是否存在健康的主机"""
+        return any(b.healthy for b in self.backends)
+    
+    @property
+    def retry_after(self) -> float:
+        """所有主机均熔断时，最早可试探恢复的剩余秒数"""
+        return min(b.service.breaker.retry_after for b in self.backends)
+    
+    @property
+    def stats(self) -> List[Dict]:
+        """所有主机的指标"""
+        return [b.stats for b in self.backends]
+
+
+# 全局推理主机池实例
+backend_pool = BackendPool()
@@ -0,0 +1,171 @@
+"""推理执行后端接口 - SSH 远程执行（SSHService）与本机直接执行（LocalExecutor）"""
+import asyncio
+import codecs
+import os
+import signal
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+from app.config import settings
+from app.services.phase_timing import PhaseTimer
+from app.services.resilience import CircuitBreaker
+from app.services.task_output import OutputBuffer
+
+
+# ssh/scp 连接失败（无法建立连接、认证失败等）时的退出码，熔断拒绝时也返回该退出码
+SSH_TRANSPORT_ERROR = 255
+# 本地执行超时或异常时的退出码
+COMMAND_FAILED = -1
+
+# 任务独立输出目录（TASK_OUTPUT_DIRS）: 推理脚本写入 <结果目录>/.tasks/<task_id>.partial/sample_<subfolder>，
+# 目录路径通过环境变量传给脚本；成功后整体重命名为 <结果目录>/.tasks/<task_id> 发布
+TASK_OUTPUT_SUBDIR = ".tasks"
+STAGING_SUFFIX = ".partial"
+OUTPUT_DIR_ENV = "RESULT_OUTPUT_DIR"
+
+# 查询 GPU 负载的 nvidia-smi 命令（远程与本机相同）
+GPU_QUERY_COMMAND = [
+    "nvidia-smi", "--query-gpu=utilization.gpu,memory.used,memory.total", "--format=csv,noheader,nounits"
+]
+
+
+def task_result_base(task_id: Optional[str], root: Optional[str] = None) -> str:
+    """
+    任务结果的根目录（其下为 sample_<subfolder>），root 默认为 REMOTE_RESULT_DIR
+    
+    开启 TASK_OUTPUT_DIRS 时为任务独立目录，否则为所有任务共享的结果目录
+    """
+    root = root or settings.REMOTE_RESULT_DIR
+    if settings.TASK_OUTPUT_DIRS and task_id:
+        return f"{root}/{TASK_OUTPUT_SUBDIR}/{task_id}"
+    return root
+
+
+def parse_gpu_load(output: str) -> Optional[dict]:
+    """
+    解析 GPU_QUERY_COMMAND 的输出（每块 GPU 一行）
+    
+    Returns:
+        {"gpus": GPU数量, "utilization": 最高利用率(%), "memory": 最高显存占用比例}，没有有效数据时返回 None
+    """
+    utilization, memory, gpus = 0.0, 0.0, 0
+    for line in output.strip().splitlines():
+        try:
+            util, used, total = (float(v) for v in line.split(","))
+        except ValueError:
+            continue
+        gpus += 1
+        utilization = max(utilization, util)
+        memory = max(memory, used / total if total else 0.0)
+    
+    if not gpus:
+        return None
+    return {"gpus": gpus, "utilization": utilization, "memory": round(memory, 3)}
+
+
+class InferenceExecutor(ABC):
+    """
+    推理执行后端
+    
+    主机池中的每台主机对应一个执行后端，调度、熔断与故障转移只依赖这里定义的接口:
+    - run_inference:     执行推理脚本，输出流式写入 OutputBuffer
+    - list_result_files: 列出结果文件（没有结果清单时使用）
+    - download_results:  将结果文件同步到本地目录
+    - kill_remote:       终止任务的推理进程
+    - remove_output:     删除任务的独立输出目录（TASK_OUTPUT_DIRS）
+    - probe_gpu_load:    探测 GPU 负载
+    - connect:           健康检查
+    """
+    
+    name: str
+    host: str
+    breaker: CircuitBreaker
+    
+    @staticmethod
+    def is_transport_error(exit_code: Optional[int]) -> bool:
+        """退出码是否表示连接层失败（而非推理命令本身失败）"""
+        return exit_code == SSH_TRANSPORT_ERROR
+    
+    @property
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """是否已连接"""
+    
+    @abstractmethod
+    def connect(self) -> bool:
+        """健康检查（建立连接）"""
+    
+    @abstractmethod
+    def disconnect(self):
+        """断开连接"""
+    
+    @abstractmethod
+    async def run_inference(
+        self,
+        index: int,
+        subfolder: str,
+        timer: Optional[PhaseTimer] = None,
+        task_id: Optional[str] = None,
+        output: Optional[OutputBuffer] = None
+    ) -> dict:
+        """执行推理脚本，输出流式写入 output"""
+    
+    @abstractmethod
+    def list_result_files(self, subfolder: str = None, task_id: Optional[str] = None) -> List[str]:
+        """列出结果文件"""
+    
+    @abstractmethod
+    def download_results(
+        self, subfolder: str, local_dir: str, timer=None, manifest=None, report=None, task_id: Optional[str] = None
+    ) -> List[str]:
+        """将结果文件同步到本地目录，返回本地文件路径"""
+    
+    @abstractmethod
+    def kill_remote(self, task_id: str) -> bool:
+        """终止任务的推理进程"""
+    
+    @abstractmethod
+    def remove_output(self, task_id: str):
+        """删除任务的独立输出目录"""
+    
+    @abstractmethod
+    def probe_gpu_load(self) -> Optional[dict]:
+        """探测 GPU 负载（返回值见 parse_gpu_load），探测失败时返回 None"""
+    
+    @staticmethod
+    async def _stream_process(process: asyncio.subprocess.Process, timeout: int, output: OutputBuffer) -> int:
+        """
+        逐行读取子进程的 stdout/stderr 写入 output（不在内存中累积完整输出）
+        
+        子进程需以 start_new_session=True 启动，超时或取消时结束整个进程组
+        
+        Returns:
+            退出码，超时时为 COMMAND_FAILED
+        """
+        async def pump(stream: asyncio.StreamReader, name: str):
+            # 增量解码，避免多字节字符被分块截断
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                chunk = await stream.read(65536)
+                if not chunk:
+                    break
+                output.write(name, decoder.decode(chunk))
+            output.write(name, decoder.decode(b"", final=True))
+        
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"), process.wait()),
+                timeout=timeout
+            )
+            return process.returncode
+        except asyncio.TimeoutError:
+            output.feed("stderr", "命令执行超时")
+            return COMMAND_FAILED
+        finally:
+            output.flush()
+            if process.returncode is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await process.wait()
@@ -0,0 +1,326 @@
+"""本机推理执行 - 推理与后端部署在同一主机时直接启动推理脚本，不经过 SSH 与登录 shell"""
+import asyncio
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.executor import (
+    COMMAND_FAILED, GPU_QUERY_COMMAND, OUTPUT_DIR_ENV, SSH_TRANSPORT_ERROR, STAGING_SUFFIX, TASK_OUTPUT_SUBDIR,
+    InferenceExecutor, parse_gpu_load, task_result_base
+)
+from app.services.phase_timing import PhaseTimer
+from app.services.resilience import CircuitBreaker
+from app.services.result_manifest import ResultFile, ResultManifest, file_sha256
+from app.services.task_output import OutputBuffer
+
+
+# 没有指定 subfolder 时列出的结果文件类型
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+
+class LocalExecutor(InferenceExecutor):
+    """
+    本机执行推理脚本
+    
+    - 以 argv 方式启动 bash REMOTE_SCRIPT，不经过 shell 拼接命令
+    - conda 环境只在首次使用（或健康检查）时激活一次，之后直接使用缓存的环境变量
+    - 推理进程由本进程持有，取消任务时直接向其进程组发送信号
+    """
+    
+    def __init__(self, name: str = None):
+        self.name = name or "local"
+        self.host = "localhost"
+        self.breaker = CircuitBreaker(self.name)
+        self._connected = False
+        self._env: Optional[Dict[str, str]] = None
+        self._env_lock = threading.Lock()
+        self._processes: Dict[str, asyncio.subprocess.Process] = {}
+    
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+    
+    def _resolve_env(self) -> Dict[str, str]:
+        """激活 conda 环境后的环境变量（只解析一次）"""
+        with self._env_lock:
+            if self._env is None:
+                self._env = self._activate_conda()
+            return self._env
+    
+    def _activate_conda(self) -> Dict[str, str]:
+        """执行一次 source conda.sh && conda activate，读取激活后的环境变量"""
+        if not settings.REMOTE_CONDA_ENV or not os.path.isfile(settings.CONDA_PROFILE):
+            logger.warning(f"[{self.name}] 未找到 conda 初始化脚本 {settings.CONDA_PROFILE}，使用当前进程的环境变量")
+            return dict(os.environ)
+        
+        # 路径与环境名作为位置参数传入，不拼接到命令中
+        result = subprocess.run(
+            ["bash", "-c", 'source "$0" && conda activate "$1" && env -0',
+             settings.CONDA_PROFILE, settings.REMOTE_CONDA_ENV],
+            capture_output=True,
+            timeout=settings.SSH_LIST_TIMEOUT
+        )
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"conda 环境 {settings.REMOTE_CONDA_ENV} 激活失败: {result.stderr.decode(errors='replace')[-500:]}"
+            )
+        env = dict(
+            item.split("=", 1) for item in result.stdout.decode(errors="replace").split("\0") if "=" in item
+        )
+        logger.info(f"[{self.name}] 已解析 conda 环境 {settings.REMOTE_CONDA_ENV}（{len(env)} 个环境变量）")
+        return env
+    
+    def connect(self) -> bool:
+        """检查推理脚本存在且 conda 环境可以激活"""
+        script = Path(settings.REMOTE_WORK_DIR) / settings.REMOTE_SCRIPT
+        try:
+            if not script.is_file():
+                raise FileNotFoundError(f"推理脚本不存在: {script}")
+            self._resolve_env()
+        except Exception as e:
+            logger.error(f"本机推理环境检查失败: {self.name}, {e}")
+            self.breaker.record_failure()
+            self._connected = False
+            return False
+        self.breaker.record_success()
+        self._connected = True
+        logger.info(f"本机推理环境检查成功: {self.name}")
+        return True
+    
+    def disconnect(self):
+        self._connected = False
+        logger.info("本机推理服务已停止")
+    
+    async def run_inference(
+        self,
+        index: int,
+        subfolder: str,
+        timer: Optional[PhaseTimer] = None,
+        task_id: Optional[str] = None,
+        output: Optional[OutputBuffer] = None
+    ) -> dict:
+        """
+        在本机执行模型推理，参数与返回值同 SSHService.run_inference
+        
+        远程时间戳标记由本进程写入：shell_ready 为环境就绪，env_ready 为脚本启动，script_end 为脚本结束
+        """
+        output = output if output is not None else OutputBuffer()
+        start_time = time.time()
+        if timer:
+            timer.mark("remote_start", start_time)
+        
+        if not self.breaker.allow():
+            output.feed("stderr", f"推理主机 {self.name} 熔断中，{self.breaker.retry_after:.0f}s 后重试")
+            exit_code = SSH_TRANSPORT_ERROR
+        else:
+            exit_code = await self._run_script(index, subfolder, task_id, output)
+            if exit_code == 0:
+                exit_code = await asyncio.to_thread(self._publish, task_id, output)
+            if exit_code == COMMAND_FAILED:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        
+        if exit_code == 0 and settings.RESULT_MANIFEST:
+            # 结果文件在本机，直接生成结果清单（大小、哈希），不再扫描目录
+            await asyncio.to_thread(self._build_manifest, subfolder, output.manifest, task_id)
+        
+        inference_time = time.time() - start_time
+        if timer:
+            timer.mark("remote_end")
+            timer.add_remote_markers(output.markers)
+        
+        if exit_code != 0:
+            return {
+                "success": False,
+                "error": output.stderr_tail() or "\n".join(item["line"] for item in output.tail(20)) or "命令执行失败",
+                "exit_code": exit_code,
+                "inference_time": round(inference_time, 2)
+            }
+        
+        return {
+            "success": True,
+            "message": "推理完成",
+            "inference_time": round(inference_time, 2),
+            "result_dir": task_result_base(task_id),
+            "manifest": output.manifest if output.manifest.complete else None
+        }
+    
+    async def _run_script(self, index: int, subfolder: str, task_id: Optional[str], output: OutputBuffer) -> int:
+        """启动推理脚本并流式读取输出，返回退出码"""
+        try:
+            env = await asyncio.to_thread(self._resolve_env)
+            output.feed("stdout", f"@@TS:shell_ready:{time.time():.6f}")
+            result_base = task_result_base(task_id)
+            if result_base != settings.REMOTE_RESULT_DIR:
+                # 任务独立输出目录：脚本写入临时目录，成功后整体重命名发布
+                staging = Path(f"{result_base}{STAGING_SUFFIX}") / f"sample_{subfolder}"
+                await asyncio.to_thread(shutil.rmtree, staging.parent, True)
+                staging.mkdir(parents=True)
+                env = {**env, OUTPUT_DIR_ENV: str(staging)}
+            process = await asyncio.create_subprocess_exec(
+                "bash", settings.REMOTE_SCRIPT, str(index), subfolder,
+                cwd=settings.REMOTE_WORK_DIR,
+                env=env,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True  # 独立进程组，取消或超时时连同脚本启动的子进程一起结束
+            )
+        except Exception as e:
+            output.feed("stderr", str(e))
+            return COMMAND_FAILED
+        
+        output.feed("stdout", f"@@TS:env_ready:{time.time():.6f}")
+        logger.info(f"[{self.name}] 执行推理脚本: {settings.REMOTE_SCRIPT} {index} {subfolder}, PID: {process.pid}")
+        if task_id:
+            self._processes[task_id] = process
+        try:
+            exit_code = await self._stream_process(process, settings.TASK_TIMEOUT, output)
+        finally:
+            if task_id:
+                self._processes.pop(task_id, None)
+        
+        if exit_code == 0:
+            output.feed("stdout", f"@@TS:script_end:{time.time():.6f}")
+        logger.info(f"命令执行完成，退出码: {exit_code}，输出 {output.total_lines} 行")
+        if exit_code != 0:
+            logger.warning(f"stderr: {output.stderr_tail(10)[-500:]}")
+        return exit_code
+    
+    def _publish(self, task_id: Optional[str], output: OutputBuffer) -> int:
+        """将任务的临时输出目录重命名为正式目录（同一文件系统内的原子操作），未开启 TASK_OUTPUT_DIRS 时不处理"""
+        result_base = task_result_base(task_id)
+        if result_base == settings.REMOTE_RESULT_DIR:
+            return 0
+        try:
+            shutil.rmtree(result_base, ignore_errors=True)
+            os.rename(f"{result_base}{STAGING_SUFFIX}", result_base)
+        except OSError as e:
+            output.feed("stderr", f"发布任务输出目录失败: {e}")
+            return 1
+        return 0
+    
+    def _build_manifest(self, subfolder: str, manifest: ResultManifest, task_id: Optional[str] = None):
+        """按 sample_{subfolder} 目录中的结果文件生成结果清单"""
+        for path in self.list_result_files(subfolder, task_id):
+            try:
+                stat = os.stat(path)
+                manifest.files[path] = ResultFile(path, stat.st_size, int(stat.st_mtime), file_sha256(Path(path)))
+            except OSError as e:
+                logger.warning(f"读取结果文件失败: {path}, {e}")
+        manifest.complete = True
+    
+    def list_result_files(self, subfolder: str = None, task_id: Optional[str] = None) -> List[str]:
+        """列出结果目录中的结果文件（指定 subfolder 时只列 sample_{subfolder} 最外层的 gif 文件）"""
+        if subfolder:
+            target_dir = Path(task_result_base(task_id)) / f"sample_{subfolder}"
+            if not target_dir.is_dir():
+                return []
+            return sorted(
+                str(path) for path in target_dir.iterdir() if path.is_file() and path.suffix.lower() == ".gif"
+            )
+        return sorted(
+            str(path) for path in Path(settings.REMOTE_RESULT_DIR).rglob("*")
+            if path.is_file() and path.suffix.lower() in IMAGE_SUFFIXES
+        )
+    
+    def download_results(
+        self,
+        subfolder: str,
+        local_dir: str,
+        timer: Optional[PhaseTimer] = None,
+        manifest: Optional[ResultManifest] = None,
+        report: Optional[dict] = None,
+        task_id: Optional[str] = None
+    ) -> List[str]:
+        """
+        将结果文件放入本地目录（LOCAL_MODE 关闭时使用），同一文件系统时使用硬链接，否则复制
+        
+        参数与返回值同 SSHService.download_results
+        """
+        report = report if report is not None else {}
+        for key in ("transferred_bytes", "saved_bytes", "resumed_bytes", "reused_files"):
+            report.setdefault(key, 0)
+        
+        if manifest is not None and manifest.complete:
+            paths = [entry.path for entry in manifest.entries]
+        else:
+            if timer:
+                timer.mark("listing_start")
+            paths = self.list_result_files(subfolder, task_id)
+            if timer:
+                timer.mark("listing_end")
+        
+        files = []
+        result_base = task_result_base(task_id)
+        if timer:
+            timer.mark("download_start")
+        for path in paths:
+            local_path = Path(local_dir) / path.replace(result_base + "/", "")
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                if local_path.exists():
+                    local_path.unlink()
+                try:
+                    os.link(path, local_path)
+                    report["saved_bytes"] += local_path.stat().st_size
+                except OSError:
+                    shutil.copy2(path, local_path)
+                    report["transferred_bytes"] += local_path.stat().st_size
+            except OSError as e:
+                logger.error(f"结果文件复制失败: {path}, {e}")
+                continue
+            files.append(str(local_path))
+        if timer:
+            timer.mark("download_end")
+        return files
+    
+    def kill_remote(self, task_id: str) -> bool:
+        """终止任务的推理进程组；进程已结束时视为成功"""
+        process = self._processes.get(task_id)
+        if process is None or process.returncode is not None:
+            return True
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return True
+        except OSError as e:
+            logger.warning(f"[{self.name}] 终止推理进程失败: {task_id}, {e}")
+            return False
+        logger.info(f"[{self.name}] 已终止推理进程: {task_id}")
+        return True
+    
+    def remove_output(self, task_id: str):
+        """删除任务的独立输出目录，同时清理超过 2 倍 TASK_TIMEOUT 未修改的临时目录"""
+        if not settings.TASK_OUTPUT_DIRS:
+            return
+        result_base = task_result_base(task_id)
+        for path in (result_base, f"{result_base}{STAGING_SUFFIX}"):
+            shutil.rmtree(path, ignore_errors=True)
+        cutoff = time.time() - settings.TASK_TIMEOUT * 2
+        for path in Path(settings.REMOTE_RESULT_DIR, TASK_OUTPUT_SUBDIR).glob(f"*{STAGING_SUFFIX}"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+    
+    def probe_gpu_load(self) -> Optional[dict]:
+        """通过本机 nvidia-smi 探测 GPU 负载，返回值同 SSHService.probe_gpu_load"""
+        try:
+            result = subprocess.run(
+                GPU_QUERY_COMMAND, capture_output=True, text=True, timeout=settings.SSH_LIST_TIMEOUT
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        return parse_gpu_load(result.stdout)
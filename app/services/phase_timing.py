@@ -0,0 +1,136 @@
+"""任务阶段耗时记录 - 拆分推理任务各阶段的时间开销"""
+import json
+import re
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+# 远程时间戳标记格式: @@TS:<阶段名>:<unix时间戳>
+# 远程脚本可通过 `date +@@TS:model_loaded:%s.%N` 输出自定义阶段
+REMOTE_MARKER_PATTERN = re.compile(r"^@@TS:([A-Za-z0-9_]+):(\d+(?:\.\d+)?)\s*$")
+
+# 本地阶段（按发生顺序）
+PHASES = (
+    "queued",           # 任务入队
+    "picked_up",        # Worker 取出任务
+    "status_committed", # 处理中状态已提交数据库
+    "remote_start",     # 开始执行远程命令
+    "remote_end",       # 远程命令返回
+    "listing_start",    # 开始列出结果文件
+    "listing_end",      # 结果文件列表获取完成
+    "download_start",   # 开始下载结果
+    "download_end",     # 结果下载完成
+    "finalize",         # 开始写入最终状态
+)
+
+# 汇总报表中的区间: 名称 -> (起始阶段, 结束阶段)
+SEGMENTS = {
+    "queue_wait": ("queued", "picked_up"),
+    "status_commit": ("picked_up", "status_committed"),
+    "remote_total": ("remote_start", "remote_end"),
+    "listing": ("listing_start", "listing_end"),
+    "download": ("download_start", "download_end"),
+    "end_to_end": ("queued", "finalize"),
+}
+
+
+class PhaseTimer:
+    """记录单个任务的阶段时间点"""
+    
+    def __init__(self, origin: Optional[float] = None):
+        self.origin = origin if origin is not None else time.time()
+        self.marks: Dict[str, float] = {}
+        self.remote: Dict[str, float] = {}
+    
+    def mark(self, phase: str, timestamp: Optional[float] = None):
+        """记录阶段时间点（默认当前时间）"""
+        self.marks[phase] = timestamp if timestamp is not None else time.time()
+    
+    def add_remote_markers(self, markers: Dict[str, float]):
+        """合并远程时间戳标记"""
+        self.remote.update(markers)
+    
+    def to_json(self) -> str:
+        """
+        紧凑序列化
+        
+        本地阶段存储为相对 origin 的毫秒偏移，远程阶段存储为相对
+        第一个远程标记的毫秒偏移（避免两端时钟不一致）
+        """
+        data = {
+            "t": {
+                phase: int(round((ts - self.origin) * 1000))
+                for phase, ts in self.marks.items()
+            }
+        }
+        if self.remote:
+            ordered = sorted(self.remote.items(), key=lambda item: item[1])
+            first = ordered[0][1]
+            data["r"] = [[name, int(round((ts - first) * 1000))] for name, ts in ordered]
+        return json.dumps(data, separators=(",", ":"))
+
+
+def segment_durations(raw: str) -> Dict[str, float]:
+    """
+    将存储的阶段时间点转换为各区间耗时（秒）
+    
+    除 SEGMENTS 中的本地区间外，还包含:
+    - remote.<前一标记>-><后一标记>: 远程相邻标记之间的耗时
+    - ssh_overhead: 远程命令总耗时减去远程标记覆盖的时间（握手、登录等）
+    """
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+    
+    local = data.get("t", {})
+    durations = {}
+    for name, (start, end) in SEGMENTS.items():
+        if start in local and end in local:
+            durations[name] = (local[end] - local[start]) / 1000
+    
+    remote = data.get("r", [])
+    for (prev_name, prev_ms), (name, ms) in zip(remote, remote[1:]):
+        durations[f"remote.{prev_name}->{name}"] = (ms - prev_ms) / 1000
+    if len(remote) >= 2 and "remote_total" in durations:
+        remote_span = (remote[-1][1] - remote[0][1]) / 1000
+        durations["ssh_overhead"] = max(durations["remote_total"] - remote_span, 0.0)
+    
+    return durations
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def aggregate_phase_report(rows: Iterable[str]) -> dict:
+    """聚合多个任务的阶段耗时，输出各区间的百分位报表"""
+    samples: Dict[str, List[float]] = {}
+    task_count = 0
+    for raw in rows:
+        durations = segment_durations(raw)
+        if not durations:
+            continue
+        task_count += 1
+        for name, value in durations.items():
+            samples.setdefault(name, []).append(value)
+    
+    segments = {}
+    for name, values in samples.items():
+        values.sort()
+        segments[name] = {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 3),
+            "p50": round(percentile(values, 50), 3),
+            "p90": round(percentile(values, 90), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(values[-1], 3),
+        }
+    
+    return {"tasks": task_count, "segments": segments}
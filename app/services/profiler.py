@@ -0,0 +1,293 @@
+"""运行时诊断 - 事件循环延迟监控与阻塞调用栈采集、按需采样分析（输出 flamegraph 折叠栈格式）"""
+import asyncio
+import hmac
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set
+
+from loguru import logger
+
+from app.config import settings
+
+
+# 延迟分位数的统计窗口（秒）
+LAG_WINDOW_SECONDS = 60
+
+# 线程空闲时所在的函数（调用栈最内层），采样分析默认不计入
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def admin_authorized(token: Optional[str]) -> bool:
+    """管理令牌校验（未配置 ADMIN_TOKEN 时一律拒绝）"""
+    if not settings.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode())
+
+
+class ProfileSession:
+    """一次采样分析：按折叠后的调用栈计数"""
+    
+    def __init__(self, thread_ids: Optional[Set[int]], idle: bool):
+        self.thread_ids = thread_ids  # 只采样这些线程，None 表示所有线程（调用栈前加线程名）
+        self.idle = idle  # 是否计入空闲线程的样本
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started_at = time.perf_counter()
+        self.seconds = 0.0
+    
+    def folded(self) -> str:
+        """flamegraph 折叠栈格式（每行: 根;...;叶 样本数），可直接用于 flamegraph.pl / speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class SamplingProfiler:
+    """
+    采样分析器：后台线程按 PROFILE_SAMPLE_INTERVAL 读取各线程的调用栈（sys._current_frames）
+    
+    采样线程只在有分析会话时运行，多个会话（按需分析、请求追踪）共享同一次采样；
+    没有会话时不产生任何开销
+    """
+    
+    def __init__(self):
+        self._sessions: Set[ProfileSession] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[tuple, str] = {}  # (代码对象, 行号) -> 栈帧名称
+        self._prefixes: Optional[List[str]] = None
+        self.on_demand: Optional[ProfileSession] = None  # 正在进行的按需分析
+    
+    def start_session(self, thread_ids: Optional[Set[int]] = None, idle: bool = False) -> ProfileSession:
+        session = ProfileSession(thread_ids, idle)
+        with self._lock:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return session
+    
+    def stop_session(self, session: ProfileSession) -> ProfileSession:
+        with self._lock:
+            self._sessions.discard(session)
+        session.seconds = time.perf_counter() - session.started_at
+        return session
+    
+    async def profile(self, seconds: float, thread_ids: Optional[Set[int]], idle: bool) -> ProfileSession:
+        """按需采样分析 seconds 秒（同一时间只允许一个），期间事件循环照常处理请求"""
+        if self.on_demand is not None:
+            raise RuntimeError("已有采样分析正在进行")
+        self.on_demand = session = self.start_session(thread_ids, idle)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.stop_session(session)
+            self.on_demand = None
+        logger.info(f"采样分析完成: {session.seconds:.1f}s, {session.samples} 个样本")
+        return session
+    
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = {}
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                stacks[thread_id] = (self._fold(frame), self._is_idle(frame))
+            del frames
+            for session in sessions:
+                session.samples += 1
+                for thread_id, (stack, idle) in stacks.items():
+                    if session.thread_ids is not None and thread_id not in session.thread_ids:
+                        continue
+                    if idle:
+                        session.idle_samples += 1
+                        if not session.idle:
+                            continue
+                    if session.thread_ids is None:
+                        stack = f"{names.get(thread_id, thread_id)};{stack}"
+                    session.stacks[stack] += 1
+            time.sleep(settings.PROFILE_SAMPLE_INTERVAL)
+    
+    def _fold(self, frame) -> str:
+        """调用栈折叠为一行（根在前，分号分隔，最多 PROFILE_STACK_DEPTH 层）"""
+        labels = []
+        while frame is not None and len(labels) < settings.PROFILE_STACK_DEPTH:
+            key = (frame.f_code, frame.f_lineno)
+            label = self._labels.get(key)
+            if label is None:
+                code = frame.f_code
+                label = f"{code.co_qualname} ({self._short_path(code.co_filename)}:{frame.f_lineno})"
+                label = self._labels[key] = label.replace(";", ":")
+            labels.append(label)
+            frame = frame.f_back
+        labels.reverse()
+        return ";".join(labels)
+    
+    def _short_path(self, filename: str) -> str:
+        """去掉项目目录与 sys.path 前缀，缩短文件路径"""
+        if self._prefixes is None:
+            paths = {str(settings.BASE_DIR)} | {path for path in sys.path if path}
+            self._prefixes = sorted((path.rstrip("/") + "/" for path in paths), key=len, reverse=True)
+        for prefix in self._prefixes:
+            if filename.startswith(prefix):
+                return filename[len(prefix):]
+        return filename
+    
+    @staticmethod
+    def _is_idle(frame) -> bool:
+        code = frame.f_code
+        return (code.co_filename.rsplit("/", 1)[-1], code.co_name) in IDLE_FRAMES
+
+
+class LoopMonitor:
+    """
+    事件循环延迟监控
+    
+    - 事件循环中的定时任务每 LOOP_MONITOR_INTERVAL 秒测量一次调度延迟（实际唤醒时间 - 预期唤醒时间）
+    - 看门狗线程发现事件循环超过 LOOP_SLOW_THRESHOLD 秒未唤醒时，立即采集事件循环线程的调用栈并记录日志，
+      即阻塞事件循环的同步调用（scp 下载、PIL 渲染、日志写入、SQLite 提交等）
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self.loop_thread_id: Optional[int] = None
+        self._beat = 0.0  # 最近一次唤醒的时间（perf_counter）
+        self._captured: Optional[dict] = None  # 看门狗在本次阻塞中采集的调用栈
+        self._lags: Deque[float] = deque()
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalls: Deque[dict] = deque(maxlen=settings.LOOP_STALL_HISTORY)
+    
+    async def start(self):
+        """启动延迟监控与看门狗线程（未开启时不启动）"""
+        if not settings.LOOP_MONITOR_ENABLED:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._lags = deque(maxlen=max(int(LAG_WINDOW_SECONDS / settings.LOOP_MONITOR_INTERVAL), 1))
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"事件循环监控已开启，阻塞阈值: {settings.LOOP_SLOW_THRESHOLD * 1000:.0f}ms")
+    
+    async def stop(self):
+        """停止延迟监控"""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+    
+    async def _tick(self):
+        interval = settings.LOOP_MONITOR_INTERVAL
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            lag = max(now - started - interval, 0.0)
+            self._beat = now
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= settings.LOOP_SLOW_THRESHOLD:
+                self._record_stall(lag)
+    
+    def _record_stall(self, lag: float):
+        """记录一次阻塞（附带看门狗在阻塞期间采集的调用栈）"""
+        captured, self._captured = self._captured, None
+        self.stall_count += 1
+        self.stalls.append({
+            "at": datetime.utcnow().isoformat(),
+            "lag_ms": round(lag * 1000, 1),
+            "stack": captured["stack"] if captured else None,
+        })
+        if captured:
+            logger.warning(f"事件循环阻塞结束，共 {lag * 1000:.0f}ms")
+        else:
+            logger.warning(f"事件循环阻塞 {lag * 1000:.0f}ms（未采集到调用栈）")
+    
+    def _watch(self):
+        """看门狗线程：事件循环阻塞期间采集其调用栈（每次阻塞只采集一次）"""
+        check_interval = max(settings.LOOP_SLOW_THRESHOLD / 2, 0.01)
+        while not self._stopped.wait(check_interval):
+            beat = self._beat
+            blocked = time.perf_counter() - beat - settings.LOOP_MONITOR_INTERVAL
+            if blocked < settings.LOOP_SLOW_THRESHOLD:
+                continue
+            if self._captured is not None and self._captured["beat"] == beat:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame, limit=settings.PROFILE_STACK_DEPTH))
+            del frame
+            self._captured = {"beat": beat, "stack": stack}
+            logger.warning(f"事件循环已阻塞 {blocked * 1000:.0f}ms，事件循环线程当前调用栈:\n{stack}")
+    
+    @property
+    def stats(self) -> dict:
+        """最近 LAG_WINDOW_SECONDS 秒的调度延迟分位数与阻塞次数"""
+        lags = sorted(self._lags)
+        
+        def percentile(q: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(int(q * len(lags)), len(lags) - 1)] * 1000, 1)
+        
+        return {
+            "enabled": settings.LOOP_MONITOR_ENABLED,
+            "threshold_ms": settings.LOOP_SLOW_THRESHOLD * 1000,
+            "lag_ms": {"p50": percentile(0.5), "p99": percentile(0.99), "max": percentile(1.0)},
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls_total": self.stall_count,
+            "last_stall_at": self.stalls[-1]["at"] if self.stalls else None,
+        }
+
+
+class TraceStore:
+    """最近 TRACE_KEEP 个请求追踪（X-Trace 请求头）的结果"""
+    
+    def __init__(self):
+        self._traces: "OrderedDict[str, dict]" = OrderedDict()
+    
+    def save(self, trace: dict):
+        self._traces[trace["trace_id"]] = trace
+        while len(self._traces) > settings.TRACE_KEEP:
+            self._traces.popitem(last=False)
+    
+    def get(self, trace_id: str) -> Optional[dict]:
+        return self._traces.get(trace_id)
+    
+    def list(self) -> List[dict]:
+        """追踪摘要（不含调用栈），最新的在前"""
+        return [
+            {key: value for key, value in trace.items() if key != "session"}
+            for trace in reversed(self._traces.values())
+        ]
+
+
+# 全局实例
+sampling_profiler = SamplingProfiler()
+loop_monitor = LoopMonitor()
+trace_store = TraceStore()
@@ -0,0 +1,206 @@
+"""按客户端限流 - 令牌桶（每次请求 O(1)），提交与查询接口分别限流，可通过 SQLite 在多个 Worker 进程间共享"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+# 清除空闲令牌桶的间隔（秒）
+SWEEP_INTERVAL = 60
+
+
+@dataclass
+class RateLimit:
+    """限流规则：每秒补充 rate 个令牌，最多累积 burst 个"""
+    name: str
+    rate: float
+    burst: int
+    
+    @property
+    def full_after(self) -> float:
+        """空桶补满所需的时间（秒），空闲超过该时间的桶已满，清除后不影响限流结果"""
+        return self.burst / self.rate
+
+
+@dataclass
+class RateLimitDecision:
+    """限流判断结果"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # 下一个令牌的等待时间（秒），允许时为 0
+    reset: float        # 令牌桶补满的等待时间（秒）
+
+
+class MemoryBuckets:
+    """进程内令牌桶（每个 Worker 进程独立计数）"""
+    
+    def __init__(self):
+        self._buckets: Dict[str, List[float]] = {}  # key -> [令牌数, 更新时间]
+    
+    def take(self, rule: RateLimit, key: str, now: float) -> tuple:
+        """取一个令牌，返回 (是否允许, 剩余令牌数)"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(rule.burst)
+        else:
+            tokens = min(rule.burst, bucket[0] + max(now - bucket[1], 0) * rule.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = [tokens, now]
+        return allowed, tokens
+    
+    def sweep(self, before: float) -> int:
+        """清除 before 之前未使用的令牌桶"""
+        idle = [key for key, bucket in self._buckets.items() if bucket[1] < before]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class SQLiteBuckets:
+    """
+    SQLite 中的令牌桶，同一主机的多个 Worker 进程共享
+    
+    每次请求执行一条 UPSERT 语句（本地文件、WAL、不同步落盘，耗时在毫秒以下）；
+    连接在首次使用时按进程创建，gunicorn 预加载后 fork 的子进程不共享连接
+    """
+    
+    # 补充令牌并尝试取一个令牌；SET 中的列引用均为更新前的值
+    _TAKE = """
+        INSERT INTO buckets (key, tokens, updated, allowed) VALUES (:key, :burst - 1, :now, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            tokens = MIN(:burst, tokens + MAX(:now - updated, 0) * :rate)
+                - (MIN(:burst, tokens + MAX(:now - updated, 0) * :rate) >= 1),
+            allowed = MIN(:burst, tokens + MAX(:now - updated, 0) * :rate) >= 1,
+            updated = :now
+        RETURNING allowed, tokens
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=1.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, allowed INTEGER NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+    
+    def take(self, rule: RateLimit, key: str, now: float) -> tuple:
+        with self._lock:
+            allowed, tokens = self._connection().execute(
+                self._TAKE, {"key": key, "burst": rule.burst, "rate": rule.rate, "now": now}
+            ).fetchone()
+        return bool(allowed), tokens
+    
+    def sweep(self, before: float) -> int:
+        with self._lock:
+            return self._connection().execute("DELETE FROM buckets WHERE updated < ?", (before,)).rowcount
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+class RateLimiter:
+    """按客户端限流（提交接口与查询接口使用不同的规则）"""
+    
+    def __init__(self):
+        self.rules = {
+            "submit": RateLimit("submit", settings.RATE_LIMIT_SUBMIT_RATE, settings.RATE_LIMIT_SUBMIT_BURST),
+            "poll": RateLimit("poll", settings.RATE_LIMIT_POLL_RATE, settings.RATE_LIMIT_POLL_BURST),
+        }
+        if settings.RATE_LIMIT_BACKEND == "sqlite":
+            self.store = SQLiteBuckets(str(settings.RATE_LIMIT_DB))
+        else:
+            self.store = MemoryBuckets()
+        self._swept_at = time.time()
+        self.limited_count = {name: 0 for name in self.rules}
+        self.error_count = 0
+    
+    def check(self, rule_name: str, client: str) -> RateLimitDecision:
+        """
+        客户端在 rule_name 规则下取一个令牌
+        
+        共享存储不可用时放行（限流失败不应导致接口不可用）
+        """
+        rule = self.rules[rule_name]
+        now = time.time()
+        if now - self._swept_at >= SWEEP_INTERVAL:
+            self._sweep(now)
+        
+        try:
+            allowed, tokens = self.store.take(rule, f"{rule.name}:{client}", now)
+        except sqlite3.Error as e:
+            self.error_count += 1
+            logger.warning(f"限流存储不可用，放行请求: {e}")
+            return RateLimitDecision(True, rule.burst, rule.burst, 0, 0)
+        
+        if not allowed:
+            self.limited_count[rule.name] += 1
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=rule.burst,
+            remaining=int(tokens),
+            retry_after=0 if allowed else (1 - tokens) / rule.rate,
+            reset=(rule.burst - tokens) / rule.rate,
+        )
+    
+    def _sweep(self, now: float):
+        """清除已补满的令牌桶（按补满最慢的规则计算）"""
+        self._swept_at = now
+        try:
+            removed = self.store.sweep(now - max(rule.full_after for rule in self.rules.values()))
+        except sqlite3.Error as e:
+            logger.warning(f"清除空闲令牌桶失败: {e}")
+            return
+        if removed:
+            logger.debug(f"已清除 {removed} 个空闲令牌桶")
+    
+    @property
+    def stats(self) -> dict:
+        """限流统计"""
+        try:
+            buckets = len(self.store)
+        except sqlite3.Error:
+            buckets = None
+        return {
+            "enabled": settings.RATE_LIMIT_ENABLED,
+            "backend": settings.RATE_LIMIT_BACKEND,
+            "rules": {
+                name: {"rate": rule.rate, "burst": rule.burst} for name, rule in self.rules.items()
+            },
+            "buckets": buckets,
+            "limited_total": dict(self.limited_count),
+            "errors": self.error_count,
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After 响应头（向上取整，至少 1 秒）"""
+    return str(max(int(math.ceil(seconds)), 1))
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
@@ -0,0 +1,154 @@
+"""启动与就绪状态 - 慢依赖（主机探测、数据迁移、缓存预热）在后台执行，/api/ready 报告各依赖的就绪情况"""
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+
+# 依赖状态
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+def _process_start_time() -> float:
+    """进程启动时间（含解释器启动与模块导入），无法读取 /proc 时使用当前时间"""
+    try:
+        with open("/proc/self/stat") as f:
+            # 进程名可能包含空格，从最后一个右括号之后按字段切分；starttime 为第 22 个字段
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+@dataclass
+class Dependency:
+    """一项启动依赖"""
+    name: str
+    required: bool  # 必需依赖未就绪时 /api/ready 返回 503，非必需依赖失败时为 degraded
+    state: str = PENDING
+    started_at: float = 0.0
+    finished_at: Optional[float] = None
+    detail: Optional[str] = None
+    
+    @property
+    def stats(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "required": self.required,
+            "seconds": round(end - self.started_at, 3),
+            "detail": self.detail,
+        }
+
+
+class Readiness:
+    """启动依赖的就绪状态与启动耗时"""
+    
+    def __init__(self):
+        self.dependencies: Dict[str, Dependency] = {}
+        self.process_started_at = _process_start_time()
+        self.serving_at: Optional[float] = None  # 开始接收请求的时间
+        self.first_request_at: Optional[float] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    def begin(self, name: str, required: bool = True) -> Dependency:
+        """登记一项依赖（状态为 pending）"""
+        dependency = Dependency(name, required, started_at=time.time())
+        self.dependencies[name] = dependency
+        return dependency
+    
+    def finish(self, name: str, ok: bool = True, detail: Optional[str] = None):
+        """更新依赖状态"""
+        dependency = self.dependencies.get(name) or self.begin(name)
+        dependency.state = READY if ok else FAILED
+        dependency.finished_at = time.time()
+        dependency.detail = detail
+    
+    def run_in_background(
+        self, name: str, check: Callable[[], Awaitable[Optional[str]]], required: bool = False
+    ):
+        """
+        在后台执行依赖检查，不阻塞启动
+        
+        check 返回说明文字（可为 None）表示就绪，抛出异常表示失败
+        """
+        self.begin(name, required)
+        self._tasks[name] = asyncio.create_task(self._run(name, check))
+    
+    async def _run(self, name: str, check: Callable[[], Awaitable[Optional[str]]]):
+        try:
+            detail = await check()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.finish(name, False, str(e) or type(e).__name__)
+            logger.warning(f"启动依赖 {name} 未就绪: {e}")
+            return
+        self.finish(name, True, detail)
+        logger.info(f"启动依赖 {name} 就绪，耗时 {self.dependencies[name].stats['seconds']}s")
+    
+    async def stop(self):
+        """取消尚未完成的后台检查"""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+    
+    def mark_serving(self):
+        """启动完成，开始接收请求"""
+        self.serving_at = time.time()
+    
+    def mark_first_request(self):
+        """记录首个请求（由请求中间件调用）"""
+        if self.first_request_at is not None:
+            return
+        self.first_request_at = time.time()
+        logger.info(f"首个请求距进程启动 {self.first_request_at - self.process_started_at:.2f}s")
+    
+    @property
+    def status(self) -> str:
+        """
+        整体状态:
+        - starting:    必需依赖尚未就绪
+        - unavailable: 必需依赖失败
+        - degraded:    必需依赖就绪，非必需依赖失败
+        - ready:       全部就绪（非必需依赖可以仍在检查中）
+        """
+        if self.serving_at is None:
+            return "starting"
+        required = [d for d in self.dependencies.values() if d.required]
+        if any(d.state == FAILED for d in required):
+            return "unavailable"
+        if any(d.state == PENDING for d in required):
+            return "starting"
+        if any(d.state == FAILED for d in self.dependencies.values()):
+            return "degraded"
+        return "ready"
+    
+    @property
+    def is_ready(self) -> bool:
+        """是否可以接收流量"""
+        return self.status in ("ready", "degraded")
+    
+    @property
+    def stats(self) -> dict:
+        def since_start(moment: Optional[float]) -> Optional[float]:
+            return round(moment - self.process_started_at, 3) if moment else None
+        
+        return {
+            "status": self.status,
+            "startup_seconds": since_start(self.serving_at),
+            "time_to_first_request": since_start(self.first_request_at),
+            "dependencies": {name: d.stats for name, d in self.dependencies.items()},
+        }
+
+
+# 全局就绪状态实例
+readiness = Readiness()
@@ -0,0 +1,151 @@
+"""远程调用容错策略 - 指数退避重试与熔断器"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+class RetryPolicy:
+    """
+    指数退避重试策略（仅用于幂等操作）
+    
+    第 n 次重试前等待 base_delay * 2^(n-1) 秒（不超过 max_delay），并加入 ±20% 抖动，
+    避免多个 Worker 同时重试
+    """
+    
+    def __init__(self, attempts: int = None, base_delay: float = None, max_delay: float = None):
+        self.attempts = max(attempts or settings.SSH_RETRY_ATTEMPTS, 1)
+        self.base_delay = base_delay if base_delay is not None else settings.SSH_RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else settings.SSH_RETRY_MAX_DELAY
+    
+    def delay(self, retry: int) -> float:
+        """第 retry 次重试前的等待时间（秒），retry 从 1 开始"""
+        delay = min(self.base_delay * (2 ** (retry - 1)), self.max_delay)
+        return delay * random.uniform(0.8, 1.2)
+    
+    def run(self, operation: str, func: Callable[[], Any], should_retry: Callable[[Any], bool]) -> Any:
+        """同步执行 func，结果满足 should_retry 时退避重试，返回最后一次结果"""
+        for attempt in range(1, self.attempts + 1):
+            result = func()
+            if attempt == self.attempts or not should_retry(result):
+                return result
+            delay = self.delay(attempt)
+            logger.warning(f"{operation} 失败，{delay:.1f}s 后重试 ({attempt}/{self.attempts - 1})")
+            time.sleep(delay)
+    
+    async def run_async(
+        self, operation: str, func: Callable[[], Awaitable[Any]], should_retry: Callable[[Any], bool]
+    ) -> Any:
+        """异步版本的 run"""
+        for attempt in range(1, self.attempts + 1):
+            result = await func()
+            if attempt == self.attempts or not should_retry(result):
+                return result
+            delay = self.delay(attempt)
+            logger.warning(f"{operation} 失败，{delay:.1f}s 后重试 ({attempt}/{self.attempts - 1})")
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """
+    熔断器（线程安全，SSH 调用在线程池中执行）
+    
+    - closed: 正常放行，连续失败达到 failure_threshold 次后转为 open
+    - open: 直接拒绝调用，recovery_timeout 秒后转为 half_open
+    - half_open: 只放行一个试探调用，成功则恢复 closed，失败则重新 open
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int = None, recovery_timeout: float = None):
+        self.name = name
+        self.failure_threshold = max(failure_threshold or settings.BREAKER_FAILURE_THRESHOLD, 1)
+        self.recovery_timeout = (
+            recovery_timeout if recovery_timeout is not None else settings.BREAKER_RECOVERY_TIMEOUT
+        )
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.open_count = 0
+        self.rejected_count = 0
+    
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.time() - self._opened_at >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    @property
+    def state(self) -> str:
+        """当前状态"""
+        with self._lock:
+            return self._state()
+    
+    @property
+    def retry_after(self) -> float:
+        """距离允许试探调用的剩余秒数，未熔断时为 0"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(self.recovery_timeout - (time.time() - self._opened_at), 0.0)
+    
+    def allow(self) -> bool:
+        """是否放行本次调用（half_open 时只放行一个试探调用）"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected_count += 1
+            return False
+    
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"熔断器 {self.name} 已恢复")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        """记录一次失败调用"""
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (
+                self._opened_at is None and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.time()
+                self._trial_in_flight = False
+                self.open_count += 1
+                logger.warning(
+                    f"熔断器 {self.name} 已打开（连续失败 {self._failures} 次），"
+                    f"{self.recovery_timeout}s 后试探恢复"
+                )
+    
+    @property
+    def stats(self) -> dict:
+        """熔断器状态"""
+        with self._lock:
+            state = self._state()
+            failures = self._failures
+            opened_at = self._opened_at
+        retry_after = max(self.recovery_timeout - (time.time() - opened_at), 0.0) if opened_at else 0.0
+        return {
+            "state": state,
+            "consecutive_failures": failures,
+            "retry_after": round(retry_after, 1),
+            "open_count": self.open_count,
+            "rejected": self.rejected_count,
+        }
@@ -0,0 +1,206 @@
+"""结果文件索引 - 结果文件按 (目录, 文件名) 存入 task_files 表，目录存入 path_prefixes 表共享"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from loguru import logger
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import PathPrefix, Task, TaskFile
+from app.services.executor import task_result_base
+from app.services.result_manifest import ResultManifest
+
+
+# 扩展名 -> (文件类型, MIME 类型)
+MEDIA_TYPES = {
+    ".jpg": ("image", "image/jpeg"),
+    ".jpeg": ("image", "image/jpeg"),
+    ".png": ("image", "image/png"),
+    ".bmp": ("image", "image/bmp"),
+    ".gif": ("image", "image/gif"),
+    ".mp4": ("video", "video/mp4"),
+    ".avi": ("video", "video/x-msvideo"),
+    ".mov": ("video", "video/quicktime"),
+}
+DEFAULT_MEDIA_TYPE = ("other", "application/octet-stream")
+
+# 目录 -> path_prefixes.id（目录只增不删，进程内缓存已提交的记录）
+_prefix_cache: Dict[str, int] = {}
+
+
+def media_kind(name: str) -> str:
+    """按扩展名判断文件类型: image / video / other"""
+    return MEDIA_TYPES.get(os.path.splitext(name)[1].lower(), DEFAULT_MEDIA_TYPE)[0]
+
+
+def mime_type(name: str) -> str:
+    """按扩展名获取 MIME 类型"""
+    return MEDIA_TYPES.get(os.path.splitext(name)[1].lower(), DEFAULT_MEDIA_TYPE)[1]
+
+
+def result_root(task_id: str) -> Path:
+    """结果文件根目录：本地模式为 LOCAL_RESULT_DIR，远程模式为任务下载目录"""
+    if settings.LOCAL_MODE:
+        return Path(settings.LOCAL_RESULT_DIR)
+    return settings.RESULTS_DIR / task_id
+
+
+def _relative_path(task_id: str, path: str) -> str:
+    """本地文件路径转为相对结果根目录的路径（两种模式的根目录都尝试，不在根目录下时保留绝对路径）"""
+    for root in (settings.RESULTS_DIR / task_id, Path(settings.LOCAL_RESULT_DIR)):
+        try:
+            return Path(path).relative_to(root).as_posix()
+        except ValueError:
+            continue
+    return path
+
+
+def build_file_records(
+    task_id: str, files: Iterable[str], manifest: Optional[ResultManifest] = None
+) -> List[dict]:
+    """
+    根据结果文件的本地路径生成 task_files 记录
+    
+    有结果清单时使用清单中的大小与哈希，否则读取本地文件大小
+    """
+    hashed = {}
+    if manifest is not None:
+        # 清单中的远程路径转为与本地文件相同的相对路径（远程模式下任务独立目录中的结果下载到任务目录根下）
+        remote_root = settings.REMOTE_RESULT_DIR if settings.LOCAL_MODE else task_result_base(task_id)
+        for entry in manifest.entries:
+            relative = entry.path.replace(remote_root + "/", "", 1)
+            hashed[relative] = entry
+    
+    records = []
+    for path in files:
+        relative = _relative_path(task_id, path)
+        entry = hashed.get(relative)
+        size = entry.size if entry else None
+        if size is None:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                pass
+        directory, _, name = relative.rpartition("/")
+        records.append({
+            "directory": directory,
+            "name": name,
+            "size": size,
+            "sha256": entry.sha256 if entry else None,
+            "media_type": media_kind(name),
+        })
+    return records
+
+
+async def _prefix_ids(session: AsyncSession, directories: set) -> Dict[str, int]:
+    """获取目录对应的 id，不存在时创建"""
+    ids = {path: _prefix_cache[path] for path in directories if path in _prefix_cache}
+    missing = [path for path in directories if path not in ids]
+    if missing:
+        result = await session.execute(
+            select(PathPrefix.path, PathPrefix.id).where(PathPrefix.path.in_(missing))
+        )
+        existing = dict(result.all())
+        _prefix_cache.update(existing)
+        ids.update(existing)
+        for path in missing:
+            if path in ids:
+                continue
+            # 新建的目录在事务提交前不放入缓存，避免事务回滚后缓存失效的 id
+            try:
+                async with session.begin_nested():
+                    prefix = PathPrefix(path=path)
+                    session.add(prefix)
+                ids[path] = prefix.id
+            except IntegrityError:
+                # 并发写入了同一目录
+                result = await session.execute(select(PathPrefix.id).where(PathPrefix.path == path))
+                ids[path] = result.scalar_one()
+    return ids
+
+
+async def save_task_files(session: AsyncSession, task_pk: int, records: List[dict]):
+    """写入任务结果文件记录（task_pk 为 tasks.id，随调用方的事务提交）"""
+    if not records:
+        return
+    prefix_ids = await _prefix_ids(session, {record["directory"] for record in records})
+    session.add_all([
+        TaskFile(
+            task_pk=task_pk,
+            prefix_id=prefix_ids[record["directory"]],
+            name=record["name"],
+            size=record["size"],
+            sha256=bytes.fromhex(record["sha256"]) if record["sha256"] else None,
+            media_type=record["media_type"],
+        )
+        for record in records
+    ])
+
+
+async def load_task_files(session: AsyncSession, task_pk: int) -> List[dict]:
+    """读取任务结果文件（task_pk 为 tasks.id），path 为相对结果根目录的路径"""
+    result = await session.execute(
+        select(PathPrefix.path, TaskFile.name, TaskFile.size, TaskFile.sha256, TaskFile.media_type)
+        .join(PathPrefix, TaskFile.prefix_id == PathPrefix.id)
+        .where(TaskFile.task_pk == task_pk)
+        .order_by(TaskFile.id)
+    )
+    return [
+        {
+            "path": f"{directory}/{name}" if directory else name,
+            "name": name,
+            "size": size,
+            "sha256": sha256.hex() if sha256 else None,
+            "media_type": media_type,
+        }
+        for directory, name, size, sha256, media_type in result.all()
+    ]
+
+
+async def migrate_legacy_results(batch_size: int = 500) -> int:
+    """
+    将旧版 Task.result 中的文件列表（{"files": [...], "remote_dir": ...}）迁移到 task_files 表
+    
+    按 id 分批处理，迁移后 result 只保留其余字段；可重复执行，返回迁移的任务数
+    """
+    migrated = 0
+    last_id = 0
+    while True:
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(Task.id, Task.task_id, Task.result)
+                .where(Task.id > last_id, Task.result.like('%"files"%'))
+                .order_by(Task.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            
+            for row_id, task_id, raw in rows:
+                last_id = row_id
+                try:
+                    data = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(data, dict) or "files" not in data:
+                    continue
+                files = data.pop("files") or []
+                data.pop("remote_dir", None)
+                await save_task_files(session, row_id, build_file_records(task_id, files))
+                await session.execute(
+                    update(Task)
+                    .where(Task.id == row_id)
+                    .values(result=json.dumps(data, ensure_ascii=False) if data else None)
+                )
+                migrated += 1
+            await session.commit()
+    
+    if migrated:
+        logger.info(f"已将 {migrated} 个任务的结果文件列表迁移到 task_files 表")
+    return migrated
@@ -0,0 +1,82 @@
+"""结果清单 - 推理结束时由远程输出结果文件列表（大小、修改时间、哈希），省去单独的列目录请求"""
+import hashlib
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# 清单行格式（远程脚本也可以自行输出）:
+#   @@STAT:<字节数>:<修改时间>:<路径>
+#   @@SHA256:<sha256>  <路径>
+#   @@MANIFEST:end        清单结束标记，没有该标记时视为清单不完整
+STAT_PATTERN = re.compile(r"^@@STAT:(\d+):(\d+):(.+)$")
+SHA256_PATTERN = re.compile(r"^@@SHA256:([0-9a-f]{64})\s+\*?(.+)$")
+MANIFEST_END = "@@MANIFEST:end"
+
+
+@dataclass
+class ResultFile:
+    """远程结果文件"""
+    path: str
+    size: Optional[int] = None
+    mtime: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+class ResultManifest:
+    """从远程输出中解析的结果清单"""
+    
+    def __init__(self):
+        self.files: Dict[str, ResultFile] = {}
+        self.complete = False
+    
+    def feed(self, line: str) -> bool:
+        """解析一行输出，是清单行时返回 True"""
+        if line == MANIFEST_END:
+            self.complete = True
+            return True
+        
+        match = STAT_PATTERN.match(line)
+        if match:
+            entry = self.files.setdefault(match.group(3), ResultFile(match.group(3)))
+            entry.size = int(match.group(1))
+            entry.mtime = int(match.group(2))
+            return True
+        
+        match = SHA256_PATTERN.match(line)
+        if match:
+            entry = self.files.setdefault(match.group(2), ResultFile(match.group(2)))
+            entry.sha256 = match.group(1)
+            return True
+        
+        return False
+    
+    @property
+    def entries(self) -> List[ResultFile]:
+        """按路径排序的文件列表"""
+        return [self.files[path] for path in sorted(self.files)]
+
+
+def manifest_command(target_dir: str, pattern: str = "*.gif") -> str:
+    """
+    生成在远程输出结果清单的命令（拼接在推理命令之后，外层为双引号 + bash -c 单引号）
+    
+    目录不存在时输出空清单
+    """
+    name = pattern.replace("*", "\\\\*")
+    find = f"find {target_dir} -maxdepth 1 -type f -name {name}"
+    return (
+        f"{{ {find} -exec stat -c @@STAT:%s:%Y:%n {{}} + 2>/dev/null; "
+        f"{find} -exec sha256sum {{}} + 2>/dev/null | sed s/^/@@SHA256:/; "
+        f"echo {MANIFEST_END}; }}"
+    )
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """计算本地文件的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
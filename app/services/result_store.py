@@ -0,0 +1,71 @@
+"""结果内容存储 - 按 sha256 存放结果文件，任务目录通过硬链接引用，相同内容只下载一次"""
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+
+from app.config import settings
+
+
+class ResultStore:
+    """
+    内容寻址存储
+    
+    目录结构: RESULTS_DIR/.store/<sha256前2位>/<sha256>，下载中的文件为同目录下的 <sha256>.part，
+    中断后下次下载从 .part 已有的字节处续传
+    """
+    
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root or settings.RESULTS_DIR / ".store"
+        # 分段锁：同一内容同时只由一个任务下载，锁数量固定
+        self._locks = [threading.Lock() for _ in range(64)]
+    
+    def lock(self, sha256: str) -> threading.Lock:
+        """获取内容对应的下载锁"""
+        return self._locks[int(sha256[:2], 16) % len(self._locks)]
+    
+    def path_for(self, sha256: str) -> Path:
+        """内容文件路径"""
+        return self.root / sha256[:2] / sha256
+    
+    def partial_path(self, sha256: str) -> Path:
+        """下载中的临时文件路径"""
+        return self.root / sha256[:2] / f"{sha256}.part"
+    
+    def has(self, sha256: str, size: Optional[int] = None) -> bool:
+        """存储中是否已有该内容（提供 size 时同时校验大小）"""
+        path = self.path_for(sha256)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return False
+        return size is None or st.st_size == size
+    
+    def prepare(self, sha256: str) -> Path:
+        """创建内容目录，返回临时文件路径"""
+        partial = self.partial_path(sha256)
+        partial.parent.mkdir(parents=True, exist_ok=True)
+        return partial
+    
+    def commit(self, sha256: str):
+        """临时文件下载并校验完成后移入存储"""
+        os.replace(self.partial_path(sha256), self.path_for(sha256))
+    
+    def link(self, sha256: str, dest: Path):
+        """将内容硬链接到任务目录（跨文件系统或不支持硬链接时复制）"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        source = self.path_for(sha256)
+        try:
+            os.link(source, dest)
+        except OSError as e:
+            logger.debug(f"硬链接失败，改为复制: {dest}, {e}")
+            shutil.copy2(source, dest)
+
+
+# 全局结果存储实例
+result_store = ResultStore()
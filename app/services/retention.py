@@ -0,0 +1,434 @@
+"""结果保留策略 - 后台按时间、总容量与客户端配额清理结果文件，归档并压缩历史任务记录"""
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import and_, delete, or_, select, update
+
+from app.config import settings
+from app.models.database import async_session_factory, engine
+from app.models.task import Task, TaskFile, TaskStatus
+from app.services.executor import TASK_OUTPUT_SUBDIR, task_result_base
+from app.services.result_index import load_task_files
+from app.services.result_store import result_store
+
+
+# 只清理已结束的任务，排队和执行中的任务不受影响
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED, TaskStatus.EXPIRED)
+
+# 下载中断后超过该时间未续传的 .part 文件视为废弃（秒）
+STALE_PARTIAL_AGE = 24 * 3600
+
+
+@dataclass
+class ResultDir:
+    """任务结果目录"""
+    task_id: str
+    mtime: float
+    bytes: int            # 目录内文件总大小
+    exclusive_bytes: int  # 删除后可回收的大小（不含与其他任务共享的内容）
+    task_pk: Optional[int] = None  # tasks.id，孤立目录为 None
+    client: Optional[str] = None
+    finished_at: Optional[float] = None
+
+
+def _lower_priority():
+    """清理线程以最低 CPU 优先级运行（Linux 下 nice 值按线程生效）"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+class RetentionService:
+    """
+    结果保留服务
+    
+    每 RETENTION_INTERVAL 秒执行一次，按以下顺序清理:
+    1. 结果文件: 超过 RETENTION_RESULT_DAYS 天 -> 超出单客户端配额 -> 超出总容量，依次从最旧的任务删除，
+       然后回收内容存储中不再被引用的文件
+    2. 任务记录: 结束超过 RETENTION_TASK_DAYS 天的记录分批归档并删除，最后增量 VACUUM 回收数据库空间
+    
+    文件操作在单独的低优先级线程中执行，数据库删除分批提交，避免影响推理任务
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = asyncio.Lock()
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self.rows_deleted_at: Optional[datetime] = None  # 最近一次删除任务记录的时间（UTC，任务列表的 Last-Modified）
+        self.last_report: dict = {}
+        self._vacuum_skip_logged = False
+        self._local_skip_logged = False
+        self.totals = {"evicted_dirs": 0, "reclaimed_bytes": 0, "archived_rows": 0, "deleted_rows": 0}
+    
+    async def start(self):
+        """启动清理循环（未开启时不启动）"""
+        if not settings.RETENTION_ENABLED:
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"结果保留策略已开启，清理周期: {settings.RETENTION_INTERVAL}s")
+    
+    async def stop(self):
+        """停止清理循环"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"结果清理失败: {e}")
+            await asyncio.sleep(settings.RETENTION_INTERVAL)
+    
+    async def _in_background(self, func, *args):
+        """在低优先级线程中执行阻塞操作"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="retention", initializer=_lower_priority
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+    
+    async def run_once(self) -> dict:
+        """执行一次清理，返回清理报告"""
+        async with self._lock:
+            start = time.time()
+            report = {"evicted_dirs": 0, "reclaimed_bytes": 0, "archived_rows": 0, "deleted_rows": 0}
+            
+            await self._compact_tasks(report)
+            await self._evict_results(report)
+            report["vacuum_freed_bytes"] = await self._incremental_vacuum()
+            report["disk_usage_bytes"] = await self._in_background(self._disk_usage)
+            report["duration"] = round(time.time() - start, 3)
+            
+            self.runs += 1
+            self.last_run_at = start
+            self.last_report = report
+            for key in self.totals:
+                self.totals[key] += report[key]
+            logger.info(
+                f"结果清理完成: 删除 {report['evicted_dirs']} 个结果目录，回收 {report['reclaimed_bytes']} 字节，"
+                f"归档 {report['archived_rows']} 条、删除 {report['deleted_rows']} 条任务记录，"
+                f"数据库回收 {report['vacuum_freed_bytes']} 字节，耗时 {report['duration']}s"
+            )
+            return report
+    
+    async def _compact_tasks(self, report: dict):
+        """分批归档并删除过期的任务记录，同时删除其结果目录"""
+        if settings.RETENTION_TASK_DAYS <= 0:
+            return
+        cutoff = datetime.utcnow() - timedelta(days=settings.RETENTION_TASK_DAYS)
+        while True:
+            async with async_session_factory() as session:
+                result = await session.execute(
+                    select(Task)
+                    .where(
+                        Task.status.in_(FINISHED_STATUSES),
+                        # 按结束时间计算；旧版本遗留的无结束时间的记录按创建时间
+                        or_(Task.completed_at < cutoff, and_(Task.completed_at.is_(None), Task.created_at < cutoff)),
+                    )
+                    .order_by(Task.id)
+                    .limit(settings.RETENTION_BATCH_SIZE)
+                )
+                tasks = result.scalars().all()
+                if not tasks:
+                    return
+                
+                if settings.RETENTION_ARCHIVE:
+                    rows = []
+                    for task in tasks:
+                        row = {column.name: getattr(task, column.name) for column in Task.__table__.columns}
+                        # 文件列表只保存在 task_files 表中，随记录一起归档
+                        row["files"] = [
+                            {key: entry[key] for key in ("path", "size", "sha256", "media_type")}
+                            for entry in await load_task_files(session, task.id)
+                        ]
+                        rows.append(row)
+                    await self._in_background(self._archive_rows, rows)
+                    report["archived_rows"] += len(rows)
+                
+                await session.execute(delete(TaskFile).where(TaskFile.task_pk.in_([task.id for task in tasks])))
+                await session.execute(delete(Task).where(Task.id.in_([task.id for task in tasks])))
+                await session.commit()
+                self.rows_deleted_at = datetime.utcnow()
+                report["deleted_rows"] += len(tasks)
+            
+            removed, reclaimed = await self._in_background(
+                self._remove_dirs, [task.task_id for task in tasks]
+            )
+            report["evicted_dirs"] += removed
+            report["reclaimed_bytes"] += reclaimed
+            # 批次之间让出数据库，避免长时间占用写锁
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE)
+    
+    def _archive_rows(self, rows: List[dict]):
+        """追加写入按天切分的归档文件（gzip 压缩的 JSON Lines）"""
+        settings.ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        path = settings.ARCHIVE_DIR / f"tasks-{datetime.utcnow():%Y%m%d}.jsonl.gz"
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+    
+    async def _incremental_vacuum(self) -> int:
+        """增量 VACUUM，回收删除记录后的空闲页（仅 SQLite），返回回收的字节数"""
+        if engine.dialect.name != "sqlite" or settings.RETENTION_VACUUM_PAGES <= 0:
+            return 0
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+            if mode != 2:
+                # 已有数据库需执行一次完整 VACUUM 才能切换为增量模式，期间阻塞所有写入，需显式开启
+                if not settings.RETENTION_VACUUM_CONVERT:
+                    if not self._vacuum_skip_logged:
+                        self._vacuum_skip_logged = True
+                        logger.warning(
+                            "数据库未使用增量 VACUUM 模式，跳过空间回收"
+                            "（设置 RETENTION_VACUUM_CONVERT=true 在下次清理时执行一次完整 VACUUM 切换模式）"
+                        )
+                    return 0
+                logger.info("数据库切换为增量 VACUUM 模式（执行一次完整 VACUUM）")
+                await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                await conn.exec_driver_sql("VACUUM")
+            page_size = (await conn.exec_driver_sql("PRAGMA page_size")).scalar()
+            before = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+            await conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(settings.RETENTION_VACUUM_PAGES)})")
+            after = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+        return max(before - after, 0) * page_size
+    
+    async def _evict_results(self, report: dict):
+        """按时间、客户端配额、总容量依次删除最旧的结果目录，再回收内容存储"""
+        dirs = await self._in_background(self._scan_result_dirs)
+        if dirs:
+            await self._attach_task_info(dirs)
+            evict = self._select_evictions(dirs, await self._in_background(self._disk_usage))
+            if evict:
+                for offset in range(0, len(evict), settings.RETENTION_BATCH_SIZE):
+                    batch = evict[offset:offset + settings.RETENTION_BATCH_SIZE]
+                    removed, reclaimed = await self._in_background(
+                        self._remove_dirs, [entry.task_id for entry in batch]
+                    )
+                    # 结果文件已删除，同时删除文件记录（并更新任务的 updated_at，使结果接口的 ETag 失效）
+                    task_pks = [entry.task_pk for entry in batch if entry.task_pk is not None]
+                    async with async_session_factory() as session:
+                        await session.execute(delete(TaskFile).where(TaskFile.task_pk.in_(task_pks)))
+                        await session.execute(
+                            update(Task).where(Task.id.in_(task_pks)).values(updated_at=datetime.utcnow())
+                        )
+                        await session.commit()
+                    report["evicted_dirs"] += removed
+                    report["reclaimed_bytes"] += reclaimed
+        report["reclaimed_bytes"] += await self._in_background(self._gc_store)
+    
+    async def _attach_task_info(self, dirs: Dict[str, ResultDir]):
+        """从数据库补充客户端与结束时间；未结束任务的目录不参与清理，无记录的目录视为孤立目录"""
+        task_ids = list(dirs)
+        found = set()
+        async with async_session_factory() as session:
+            for offset in range(0, len(task_ids), settings.RETENTION_BATCH_SIZE):
+                chunk = task_ids[offset:offset + settings.RETENTION_BATCH_SIZE]
+                result = await session.execute(
+                    select(Task.id, Task.task_id, Task.status, Task.client_ip, Task.completed_at)
+                    .where(Task.task_id.in_(chunk))
+                )
+                for task_pk, task_id, status, client_ip, completed_at in result.all():
+                    found.add(task_id)
+                    if status not in FINISHED_STATUSES:
+                        del dirs[task_id]
+                        continue
+                    entry = dirs[task_id]
+                    entry.task_pk = task_pk
+                    entry.client = client_ip
+                    if completed_at:
+                        # 数据库时间为 UTC
+                        entry.finished_at = (completed_at - datetime(1970, 1, 1)).total_seconds()
+        for task_id in set(task_ids) - found:
+            # 孤立目录（记录已删除）直接清理
+            dirs[task_id].finished_at = 0
+    
+    def _select_evictions(self, dirs: Dict[str, ResultDir], usage: int) -> List[ResultDir]:
+        """分层选择需要删除的结果目录（从旧到新）"""
+        candidates = sorted(
+            dirs.values(),
+            key=lambda entry: entry.finished_at if entry.finished_at is not None else entry.mtime
+        )
+        evict: Dict[str, ResultDir] = {}
+        
+        # 1. 超过保留天数（孤立目录 finished_at 为 0，总是删除）
+        if settings.RETENTION_RESULT_DAYS > 0:
+            cutoff = time.time() - settings.RETENTION_RESULT_DAYS * 86400
+        else:
+            cutoff = 0
+        for entry in candidates:
+            age_ref = entry.finished_at if entry.finished_at is not None else entry.mtime
+            if entry.finished_at == 0 or age_ref < cutoff:
+                evict[entry.task_id] = entry
+        
+        # 2. 单客户端配额
+        if settings.RETENTION_CLIENT_QUOTA_BYTES > 0:
+            per_client: Dict[Optional[str], int] = {}
+            for entry in candidates:
+                if entry.task_id not in evict:
+                    per_client[entry.client] = per_client.get(entry.client, 0) + entry.bytes
+            for entry in candidates:
+                if entry.task_id in evict:
+                    continue
+                if per_client[entry.client] > settings.RETENTION_CLIENT_QUOTA_BYTES:
+                    per_client[entry.client] -= entry.bytes
+                    evict[entry.task_id] = entry
+        
+        # 3. 总容量（按删除后可回收的大小估算）
+        if settings.RETENTION_MAX_BYTES > 0:
+            usage -= sum(entry.exclusive_bytes for entry in evict.values())
+            for entry in candidates:
+                if usage <= settings.RETENTION_MAX_BYTES:
+                    break
+                if entry.task_id not in evict:
+                    usage -= entry.exclusive_bytes
+                    evict[entry.task_id] = entry
+        
+        return list(evict.values())
+    
+    def _result_roots(self) -> List[Path]:
+        """
+        存放任务结果目录的根目录: RESULTS_DIR，本地模式开启 TASK_OUTPUT_DIRS 时还包括 LOCAL_RESULT_DIR 下的任务独立目录
+        
+        本地模式未开启 TASK_OUTPUT_DIRS 时结果写入推理脚本的共享目录，无法按任务清理
+        """
+        roots = [settings.RESULTS_DIR]
+        if settings.LOCAL_MODE:
+            if settings.TASK_OUTPUT_DIRS:
+                roots.append(Path(settings.LOCAL_RESULT_DIR) / TASK_OUTPUT_SUBDIR)
+            elif not self._local_skip_logged:
+                self._local_skip_logged = True
+                logger.warning("本地模式未开启 TASK_OUTPUT_DIRS，LOCAL_RESULT_DIR 中的结果文件不参与清理")
+        return roots
+    
+    def _scan_result_dirs(self) -> Dict[str, ResultDir]:
+        """扫描各结果根目录下的任务结果目录（跳过 . 开头的内容存储等目录），同一任务的多个目录合并计算"""
+        dirs = {}
+        for result_root in self._result_roots():
+            if not result_root.is_dir():
+                continue
+            with os.scandir(result_root) as it:
+                for item in it:
+                    if item.name.startswith(".") or not item.is_dir(follow_symlinks=False):
+                        continue
+                    total = exclusive = 0
+                    for root, _, files in os.walk(item.path):
+                        for name in files:
+                            try:
+                                stat = os.lstat(os.path.join(root, name))
+                            except FileNotFoundError:
+                                continue
+                            total += stat.st_size
+                            # 链接数不超过 2（本目录 + 内容存储）时，删除后内容可回收
+                            if stat.st_nlink <= 2:
+                                exclusive += stat.st_size
+                    entry = dirs.get(item.name)
+                    if entry is None:
+                        dirs[item.name] = ResultDir(item.name, item.stat().st_mtime, total, exclusive)
+                    else:
+                        entry.mtime = max(entry.mtime, item.stat().st_mtime)
+                        entry.bytes += total
+                        entry.exclusive_bytes += exclusive
+        return dirs
+    
+    def _remove_dirs(self, task_ids: List[str]) -> Tuple[int, int]:
+        """删除任务结果目录，返回 (删除的目录数, 立即回收的字节数)，硬链接到内容存储的文件在存储回收时计入"""
+        removed = reclaimed = 0
+        for task_id in task_ids:
+            paths = [settings.RESULTS_DIR / task_id]
+            if settings.LOCAL_MODE and settings.TASK_OUTPUT_DIRS:
+                # 本地模式下任务独立输出目录由后端管理，随任务一起删除
+                paths.append(Path(task_result_base(task_id, settings.LOCAL_RESULT_DIR)))
+            for path in paths:
+                if not path.is_dir():
+                    continue
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        try:
+                            stat = os.lstat(os.path.join(root, name))
+                        except FileNotFoundError:
+                            continue
+                        if stat.st_nlink == 1:
+                            reclaimed += stat.st_size
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed, reclaimed
+    
+    def _gc_store(self) -> int:
+        """删除内容存储中已无任务引用的文件和废弃的临时文件，返回回收的字节数"""
+        root = result_store.root
+        if not root.exists():
+            return 0
+        reclaimed = 0
+        now = time.time()
+        for path in root.glob("*/*"):
+            try:
+                stat = path.stat()
+                if path.suffix == ".part":
+                    if now - stat.st_mtime < STALE_PARTIAL_AGE:
+                        continue
+                elif stat.st_nlink > 1:
+                    continue
+                with result_store.lock(path.name):
+                    # 加锁后再确认，避免与正在链接该内容的下载冲突
+                    if path.suffix != ".part" and path.stat().st_nlink > 1:
+                        continue
+                    path.unlink()
+                reclaimed += stat.st_size
+            except FileNotFoundError:
+                continue
+        return reclaimed
+    
+    def _disk_usage(self) -> int:
+        """各结果根目录的实际占用（硬链接只计一次）"""
+        seen = set()
+        usage = 0
+        for result_root in self._result_roots():
+            for root, _, files in os.walk(result_root):
+                for name in files:
+                    try:
+                        stat = os.lstat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    if (stat.st_dev, stat.st_ino) in seen:
+                        continue
+                    seen.add((stat.st_dev, stat.st_ino))
+                    usage += stat.st_size
+        return usage
+    
+    @property
+    def stats(self) -> dict:
+        """清理统计"""
+        return {
+            "enabled": settings.RETENTION_ENABLED,
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_report": self.last_report,
+            "totals": self.totals,
+        }
+
+
+# 全局结果保留服务实例
+retention_service = RetentionService()
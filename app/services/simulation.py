@@ -0,0 +1,271 @@
+"""推理模拟 - 按可配置的耗时分布、失败率与多文件 GIF 输出模拟推理，用于压测与容量规划"""
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.services.executor import OUTPUT_DIR_ENV
+from app.services.task_output import OutputBuffer
+
+
+# 模拟结果的类型
+OUTCOME_SUCCESS = "success"
+OUTCOME_FAILURE = "failure"            # 推理脚本报错退出
+OUTCOME_TIMEOUT = "timeout"            # 推理卡住直到超时
+OUTCOME_TRANSPORT = "transport_error"  # 连接失败（仅 MOCK_MODE，fake_ssh 使用 FAKE_SSH_ERROR_RATE）
+
+# 进度输出的步数
+PROGRESS_STEPS = 10
+
+
+class LatencyModel:
+    """
+    推理耗时分布，由 MOCK_LATENCY 描述:
+    - uniform:<最小>:<最大>
+    - lognormal:<中位数>:<sigma>
+    - empirical:<文件>  从记录的生产耗时中重采样，文件为秒数的 JSON 列表，
+      或生产数据库（.db，读取已完成任务的 inference_time）
+    """
+    
+    def __init__(self, spec: str, scale: float = 1.0):
+        self.spec = spec
+        self.scale = scale
+        self._sample = self._parse(spec)
+    
+    def _parse(self, spec: str) -> Callable[[], float]:
+        kind, _, args = spec.partition(":")
+        if kind == "uniform":
+            low, high = (float(v) for v in args.split(":"))
+            return lambda: random.uniform(low, high)
+        if kind == "lognormal":
+            median, sigma = (float(v) for v in args.split(":"))
+            return lambda: random.lognormvariate(math.log(median), sigma)
+        if kind == "empirical":
+            samples = self._load_samples(args)
+            if not samples:
+                raise ValueError(f"耗时样本为空: {args}")
+            logger.info(f"[MOCK] 加载 {len(samples)} 个推理耗时样本: {args}")
+            return lambda: random.choice(samples)
+        raise ValueError(f"无法识别的耗时分布: {spec}")
+    
+    @staticmethod
+    def _load_samples(path: str) -> List[float]:
+        if path.endswith(".db"):
+            with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+                rows = conn.execute(
+                    "SELECT inference_time FROM tasks WHERE status = 'COMPLETED' AND inference_time > 0"
+                ).fetchall()
+            return [row[0] for row in rows]
+        with open(path, encoding="utf-8") as f:
+            return [float(v) for v in json.load(f) if float(v) > 0]
+    
+    def sample(self) -> float:
+        """采样一次推理耗时（秒，已缩放）"""
+        return max(self._sample(), 0.0) * self.scale
+
+
+class GifPool:
+    """预生成的多帧 GIF 结果池，模拟推理直接复用，避免每个任务都绘制图片"""
+    
+    def __init__(self, root: Path, size: int, frames: int):
+        self.root = root
+        self.size = max(size, 1)
+        self.frames = max(frames, 1)
+        self._files: List[Path] = []
+        # 启动预热与任务的 materialize 在不同线程中调用 ensure，加锁使后到者等待而不是重复生成
+        self._lock = threading.Lock()
+    
+    def ensure(self) -> List[Path]:
+        """生成缺少的 GIF（阻塞操作，调用方放在线程中执行）"""
+        if len(self._files) == self.size:
+            return self._files
+        with self._lock:
+            if len(self._files) == self.size:
+                return self._files
+            self.root.mkdir(parents=True, exist_ok=True)
+            files = []
+            for i in range(self.size):
+                path = self.root / f"pool_{i}_{self.frames}.gif"
+                if not path.exists():
+                    # 多个模拟进程可能同时生成，临时文件名唯一，生成完成后原子替换
+                    fd, partial = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                    try:
+                        with os.fdopen(fd, "wb") as f:
+                            self._draw(i).save(f)
+                        os.replace(partial, path)
+                    except BaseException:
+                        Path(partial).unlink(missing_ok=True)
+                        raise
+                files.append(path)
+            self._files = files
+            return files
+    
+    def _draw(self, seed: int) -> "_AnimatedGif":
+        """绘制一个检测框随帧移动的动图"""
+        # PIL 只在生成模拟结果时需要，延迟导入以加快启动
+        from PIL import Image, ImageDraw
+        
+        rng = random.Random(seed)
+        width, height = 320, 240
+        boxes = [
+            (rng.randint(0, width - 60), rng.randint(20, height - 50), rng.randint(-6, 6), rng.randint(-3, 3),
+             rng.choice([(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]))
+            for _ in range(rng.randint(2, 5))
+        ]
+        frames = []
+        for frame in range(self.frames):
+            img = Image.new("RGB", (width, height), color=(30, 30, 30))
+            draw = ImageDraw.Draw(img)
+            for x, y, dx, dy, color in boxes:
+                x1 = (x + dx * frame) % (width - 60)
+                y1 = 20 + (y + dy * frame) % (height - 70)
+                draw.rectangle([x1, y1, x1 + 60, y1 + 40], outline=color, width=2)
+            draw.text((10, 5), f"[MOCK] sample {seed} frame {frame + 1}/{self.frames}", fill=(255, 255, 255))
+            frames.append(img.convert("P", palette=Image.ADAPTIVE))
+        return _AnimatedGif(frames)
+    
+    def materialize(self, target_dir: Path, count: int, unique: bool = False) -> List[str]:
+        """从池中取 count 个 GIF 写入目标目录（unique 时复制并追加随机字节，使每次输出的哈希不同）"""
+        pool = self.ensure()
+        target_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for i in range(count):
+            source = random.choice(pool)
+            target = target_dir / f"result_{i}.gif"
+            if target.exists():
+                target.unlink()
+            if unique:
+                shutil.copyfile(source, target)
+                with open(target, "ab") as f:
+                    f.write(os.urandom(16))  # GIF 结束符之后的字节会被解码器忽略
+            else:
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copyfile(source, target)
+            files.append(str(target))
+        return files
+
+
+class _AnimatedGif:
+    """多帧图像的保存包装"""
+    
+    def __init__(self, frames: list):
+        self.frames = frames
+    
+    def save(self, target):
+        self.frames[0].save(
+            target, format="GIF", save_all=True, append_images=self.frames[1:], duration=100, loop=0
+        )
+
+
+class MockEngine:
+    """模拟推理引擎（MOCK_MODE 使用，scripts/mock_remote.py 作为远程推理脚本时也使用）"""
+    
+    def __init__(self):
+        self._latency: Optional[LatencyModel] = None
+        self.pool = GifPool(settings.RESULTS_DIR / ".mock_pool", settings.MOCK_POOL_SIZE, settings.MOCK_GIF_FRAMES)
+    
+    @property
+    def latency(self) -> LatencyModel:
+        if self._latency is None:
+            self._latency = LatencyModel(settings.MOCK_LATENCY, settings.MOCK_LATENCY_SCALE)
+        return self._latency
+    
+    def draw_outcome(self, transport_errors: bool = True) -> str:
+        """按配置的概率抽取本次推理的结果"""
+        roll = random.random()
+        for outcome, rate in (
+            (OUTCOME_TRANSPORT, settings.MOCK_TRANSPORT_ERROR_RATE if transport_errors else 0),
+            (OUTCOME_TIMEOUT, settings.MOCK_TIMEOUT_RATE),
+            (OUTCOME_FAILURE, settings.MOCK_FAILURE_RATE),
+        ):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return OUTCOME_SUCCESS
+    
+    def progress_lines(self, step: int) -> str:
+        """第 step 步的进度输出"""
+        return f"@@PROGRESS:{step}/{PROGRESS_STEPS}\n[MOCK] processed frame {step}/{PROGRESS_STEPS}\n"
+    
+    def materialize(self, target_dir: str, unique: bool = False) -> List[str]:
+        """生成一次推理的结果文件（阻塞操作）"""
+        return self.pool.materialize(Path(target_dir), settings.MOCK_RESULT_FILES, unique)
+    
+    async def prepare(self):
+        """在线程中预生成 GIF 池，避免首个任务下载时才绘制"""
+        await asyncio.to_thread(self.pool.ensure)
+    
+    async def run(self, index: int, output: OutputBuffer) -> str:
+        """
+        模拟一次远程推理：按耗时分布逐帧输出进度与远程时间戳标记
+        
+        Returns:
+            推理结果类型（OUTCOME_*），由调用方转换为退出码
+        """
+        outcome = self.draw_outcome()
+        if outcome == OUTCOME_TRANSPORT:
+            # 连接阶段失败，远程命令未开始
+            await asyncio.sleep(min(self.latency.sample() * 0.05, 1.0))
+            output.feed("stderr", "ssh: connect to host mock: Connection refused")
+            return outcome
+        
+        output.feed("stdout", f"@@TS:shell_ready:{time.time():.6f}")
+        output.feed("stdout", f"@@TS:env_ready:{time.time():.6f}")
+        if outcome == OUTCOME_TIMEOUT:
+            await asyncio.sleep(settings.TASK_TIMEOUT)
+            output.feed("stderr", "命令执行超时")
+            return outcome
+        
+        step_time = self.latency.sample() / PROGRESS_STEPS
+        for step in range(1, PROGRESS_STEPS + 1):
+            await asyncio.sleep(step_time)
+            output.write("stdout", self.progress_lines(step))
+            if outcome == OUTCOME_FAILURE and step == PROGRESS_STEPS // 2:
+                output.feed("stderr", f"[MOCK] RuntimeError: CUDA out of memory (index={index})")
+                return outcome
+        output.feed("stdout", f"@@TS:script_end:{time.time():.6f}")
+        return outcome
+
+
+def run_remote(index: int, subfolder: str) -> int:
+    """
+    作为远程推理脚本运行（scripts/mock_demo.sh 调用），行为与 demo.sh 一致：
+    逐帧输出进度，结束后将结果 GIF 写入 REMOTE_RESULT_DIR/sample_<subfolder>
+    （设置了 RESULT_OUTPUT_DIR 时写入该目录），返回退出码
+    """
+    engine = MockEngine()
+    outcome = engine.draw_outcome(transport_errors=False)
+    duration = engine.latency.sample()
+    if outcome == OUTCOME_TIMEOUT:
+        # 卡住直到调用方超时终止
+        duration = settings.TASK_TIMEOUT * 2
+    
+    for step in range(1, PROGRESS_STEPS + 1):
+        time.sleep(duration / PROGRESS_STEPS)
+        sys.stdout.write(engine.progress_lines(step))
+        sys.stdout.flush()
+        if outcome == OUTCOME_FAILURE and step == PROGRESS_STEPS // 2:
+            sys.stderr.write(f"[MOCK] RuntimeError: CUDA out of memory (index={index})\n")
+            return 1
+    
+    target_dir = os.environ.get(OUTPUT_DIR_ENV) or f"{settings.REMOTE_RESULT_DIR}/sample_{subfolder}"
+    engine.materialize(target_dir, settings.MOCK_UNIQUE_OUTPUTS)
+    return 0
+
+
+# 全局模拟引擎实例
+mock_engine = MockEngine()
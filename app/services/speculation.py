@@ -0,0 +1,228 @@
+"""推测执行 - 识别客户端在同一 subfolder 内按序号依次提交的模式，在 Worker 空闲时预先执行后续序号"""
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import Task, TaskStatus
+from app.services.admission import admission_controller
+from app.services.task_queue import task_queue
+
+
+# 可被认领的推测任务状态
+CLAIMABLE_STATUSES = (TaskStatus.PENDING, TaskStatus.PROCESSING, TaskStatus.COMPLETED)
+
+
+@dataclass
+class SpeculativeTask:
+    """未被认领的推测任务"""
+    task_id: str
+    created_at: float
+    finished_at: Optional[float] = None
+    seconds: float = 0.0  # 占用 Worker 的时间（秒）
+
+
+@dataclass
+class Streak:
+    """客户端在一个 subfolder 内连续递增提交的序号"""
+    last_index: int
+    length: int
+    seen_at: float
+
+
+class Speculator:
+    """
+    推测执行调度
+    
+    - 客户端在同一 subfolder 内连续 SPECULATIVE_MIN_STREAK 次按 index+1 提交后，为后续
+      SPECULATIVE_LOOKAHEAD 个序号创建推测任务（只使用当前空闲的 Worker），推测任务在队列为空时才执行
+    - 任意客户端提交到推测任务的 (subfolder, index) 时认领该任务，不再重复推理
+    - 有真实任务排队且没有空闲 Worker 时，由提交接口取消最近开始的推测任务（task_queue.preemption_candidate）
+    - 失败、被取消、过期或完成后 SPECULATIVE_TTL 秒内未被认领的推测任务计为浪费
+    """
+    
+    def __init__(self):
+        self._tasks: Dict[Tuple[str, int], SpeculativeTask] = {}  # (subfolder, index) -> 未认领的推测任务
+        self._keys: Dict[str, Tuple[str, int]] = {}  # task_id -> (subfolder, index)
+        self._claimed_running: Set[str] = set()  # 认领时尚未完成的推测任务
+        self._streaks: Dict[Tuple[str, str], Streak] = {}  # (客户端, subfolder) -> 连续序号
+        self.launched = 0
+        self.hits = 0
+        self.hits_ready = 0  # 认领时已完成
+        self.wasted = 0
+        self.preempted = 0
+        self.useful_seconds = 0.0
+        self.wasted_seconds = 0.0
+    
+    async def claim(
+        self, db: AsyncSession, subfolder: str, index: int, client_info: dict, deadline: Optional[datetime]
+    ) -> Optional[Tuple[str, TaskStatus]]:
+        """
+        认领 (subfolder, index) 的推测任务，转为该客户端的任务
+        
+        Returns:
+            (task_id, 当前状态)，没有可认领的推测任务时返回 None
+        """
+        key = (subfolder, index)
+        if key not in self._tasks:
+            return None
+        # 先取出，避免并发的提交认领同一个任务
+        speculative = self._forget(key)
+        task_id = speculative.task_id
+        updated = await db.execute(
+            update(Task)
+            .where(Task.task_id == task_id, Task.speculative.is_(True), Task.status.in_(CLAIMABLE_STATUSES))
+            .values(
+                speculative=False,
+                client_ip=client_info["client_ip"],
+                user_agent=client_info["user_agent"],
+                deadline=deadline
+            )
+        )
+        await db.commit()
+        if not updated.rowcount:
+            # 推测任务已失败、被取消或过期（结束回调尚未执行）
+            self.wasted += 1
+            self.wasted_seconds += speculative.seconds
+            return None
+        
+        # 按准入控制移入队列；没有空余容量时留在推测队列中优先执行，不超出队列容量
+        reserved = admission_controller.try_reserve()
+        try:
+            task_queue.promote(task_id, enqueue=reserved)
+        finally:
+            if reserved:
+                admission_controller.release()
+        task_queue.touch(task_id)
+        result = await db.execute(select(Task.status).where(Task.task_id == task_id))
+        status = result.scalar_one()
+        self.hits += 1
+        if status in (TaskStatus.PENDING, TaskStatus.PROCESSING):
+            self._claimed_running.add(task_id)
+        else:
+            self.hits_ready += 1
+            self.useful_seconds += speculative.seconds
+        logger.info(f"认领推测任务: {task_id}, 序号: {index}, 子文件夹: {subfolder}, 状态: {status.value}")
+        return task_id, status
+    
+    async def observe(self, client: Optional[str], subfolder: str, index: int) -> int:
+        """
+        记录客户端的提交，识别到顺序提交时为后续序号创建推测任务
+        
+        Returns:
+            新创建的推测任务数
+        """
+        if not settings.SPECULATIVE_ENABLED:
+            return 0
+        now = time.time()
+        self._sweep(now)
+        
+        streak_key = (client or "", subfolder)
+        streak = self._streaks.get(streak_key)
+        length = streak.length + 1 if streak and index == streak.last_index + 1 else 1
+        self._streaks[streak_key] = Streak(index, length, now)
+        if length < settings.SPECULATIVE_MIN_STREAK:
+            return 0
+        
+        # 只使用当前空闲的 Worker（不含等待中的真实任务与推测任务）
+        idle = (
+            task_queue.target_workers - task_queue.active_count
+            - task_queue.queue_size - task_queue.speculative_size
+        )
+        budget = min(idle, settings.SPECULATIVE_MAX_TASKS - len(self._tasks))
+        launched = 0
+        for next_index in range(index + 1, index + 1 + settings.SPECULATIVE_LOOKAHEAD):
+            if launched >= budget:
+                break
+            if (subfolder, next_index) in self._tasks:
+                continue
+            await self._launch(client, subfolder, next_index)
+            launched += 1
+        return launched
+    
+    async def _launch(self, client: Optional[str], subfolder: str, index: int):
+        """创建推测任务（SPECULATIVE_TTL 秒内未开始执行则过期）"""
+        task_id = str(uuid.uuid4())
+        async with async_session_factory() as session:
+            session.add(Task(
+                task_id=task_id,
+                index=index,
+                subfolder=subfolder,
+                status=TaskStatus.PENDING,
+                speculative=True,
+                deadline=datetime.utcnow() + timedelta(seconds=settings.SPECULATIVE_TTL),
+                client_ip=client
+            ))
+            await session.commit()
+        key = (subfolder, index)
+        self._tasks[key] = SpeculativeTask(task_id, time.time())
+        self._keys[task_id] = key
+        task_queue.enqueue_speculative({"task_id": task_id, "index": index, "subfolder": subfolder})
+        self.launched += 1
+        logger.info(f"创建推测任务: {task_id}, 序号: {index}, 子文件夹: {subfolder}")
+    
+    def finished(self, task_id: str, status: Optional[TaskStatus], seconds: float):
+        """任务处理结束（由任务处理器对所有任务调用，非推测任务直接返回）"""
+        if task_id in self._claimed_running:
+            self._claimed_running.discard(task_id)
+            self.useful_seconds += seconds
+            return
+        key = self._keys.get(task_id)
+        if key is None:
+            return
+        speculative = self._tasks[key]
+        speculative.finished_at = time.time()
+        speculative.seconds = seconds
+        if status == TaskStatus.COMPLETED:
+            return
+        if status == TaskStatus.CANCELLED:
+            self.preempted += 1
+        self._discard(key)
+    
+    def _forget(self, key: Tuple[str, int]) -> SpeculativeTask:
+        speculative = self._tasks.pop(key)
+        self._keys.pop(speculative.task_id, None)
+        return speculative
+    
+    def _discard(self, key: Tuple[str, int]):
+        """推测任务未被认领，计为浪费"""
+        speculative = self._forget(key)
+        self.wasted += 1
+        self.wasted_seconds += speculative.seconds
+    
+    def _sweep(self, now: float):
+        """清除完成后超时未认领的推测任务与过期的顺序记录"""
+        for key, speculative in list(self._tasks.items()):
+            if speculative.finished_at is not None and now - speculative.finished_at > settings.SPECULATIVE_TTL:
+                self._discard(key)
+        for streak_key, streak in list(self._streaks.items()):
+            if now - streak.seen_at > settings.SPECULATIVE_TTL:
+                del self._streaks[streak_key]
+    
+    @property
+    def stats(self) -> dict:
+        """命中率与推理时间（有效: 被认领的推测任务，浪费: 未被认领的推测任务）"""
+        settled = self.hits + self.wasted
+        return {
+            "enabled": settings.SPECULATIVE_ENABLED,
+            "outstanding": len(self._tasks),
+            "launched_total": self.launched,
+            "hits_total": self.hits,
+            "hits_ready_total": self.hits_ready,
+            "wasted_total": self.wasted,
+            "preempted_total": self.preempted,
+            "hit_rate": round(self.hits / settled, 4) if settled else 0.0,
+            "useful_seconds": round(self.useful_seconds, 1),
+            "wasted_seconds": round(self.wasted_seconds, 1),
+        }
+
+
+# 全局推测执行实例
+speculator = Speculator()
@@ -8,21 +8,55 @@ from pathlib import Path
 from typing import Optional, List, Tuple
 
 from loguru import logger
-from PIL import Image, ImageDraw, ImageFont
 
 from app.config import settings
+from app.services.executor import (
+    COMMAND_FAILED, GPU_QUERY_COMMAND, OUTPUT_DIR_ENV, SSH_TRANSPORT_ERROR, STAGING_SUFFIX, TASK_OUTPUT_SUBDIR,
+    InferenceExecutor, parse_gpu_load, task_result_base
+)
+from app.services.phase_timing import PhaseTimer
+from app.services.resilience import CircuitBreaker, RetryPolicy
+from app.services.task_output import OutputBuffer
+from app.services.result_manifest import ResultFile, ResultManifest, file_sha256, manifest_command
+from app.services.result_store import result_store
+from app.services.simulation import (
+    OUTCOME_FAILURE, OUTCOME_SUCCESS, OUTCOME_TIMEOUT, OUTCOME_TRANSPORT, mock_engine
+)
 
 
-class SSHService:
+# 模拟推理结果对应的退出码
+MOCK_EXIT_CODES = {OUTCOME_FAILURE: 1, OUTCOME_TIMEOUT: COMMAND_FAILED, OUTCOME_TRANSPORT: SSH_TRANSPORT_ERROR}
+
+
+class SSHService(InferenceExecutor):
     """SSH远程执行服务（使用系统SSH命令）"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        user: str = None,
+        password: str = None,
+        name: str = None
+    ):
+        self.host = host or settings.SSH_HOST
+        self.port = port or settings.SSH_PORT
+        self.user = user or settings.SSH_USER
+        self.password = password if password is not None else settings.SSH_PASSWORD
+        self.name = name or f"{self.host}:{self.port}"
         self._connected = False
         self._ssh_available = self._check_ssh()
+        self._mock_running = 0  # Mock模式下正在执行的推理数（用于模拟GPU负载）
+        self.breaker = CircuitBreaker(self.name)
+        self.retry_policy = RetryPolicy()
     
     def _check_ssh(self) -> bool:
-        """检查系统是否有SSH命令"""
-        return shutil.which("ssh") is not None
+        """检查系统是否有SSH命令（SSH_COMMAND 可替换为本地模拟脚本）"""
+        return shutil.which(settings.SSH_COMMAND.split()[0]) is not None
+    
+    def _should_retry(self, result: Tuple[int, str, str]) -> bool:
+        """连接失败或超时、且熔断器未打开时可以重试"""
+        return result[0] in (SSH_TRANSPORT_ERROR, COMMAND_FAILED) and self.breaker.state != CircuitBreaker.OPEN
     
     def _run_command(self, command: str, timeout: int = 120) -> Tuple[int, str, str]:
         """
@@ -41,9 +75,44 @@ class SSHService:
             )
             return result.returncode, result.stdout, result.stderr
         except subprocess.TimeoutExpired:
-            return -1, "", "命令执行超时"
+            return COMMAND_FAILED, "", "命令执行超时"
         except Exception as e:
-            return -1, "", str(e)
+            return COMMAND_FAILED, "", str(e)
+    
+    async def _stream_command(self, command: str, timeout: int, output: OutputBuffer) -> int:
+        """
+        运行本地命令并逐行读取 stdout/stderr 写入 output（不在内存中累积完整输出）
+        
+        Returns:
+            退出码，超时或异常时为 COMMAND_FAILED
+        """
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True  # 独立进程组，超时或取消时连同 sshpass/ssh 一起结束
+            )
+        except Exception as e:
+            output.feed("stderr", str(e))
+            return COMMAND_FAILED
+        return await self._stream_process(process, timeout, output)
+    
+    def _run_remote(self, command: str, timeout: int) -> Tuple[int, str, str]:
+        """
+        经过熔断器执行 ssh/scp 命令
+        
+        熔断器打开时不发起连接，直接返回 SSH_TRANSPORT_ERROR；连接失败或超时计为一次失败
+        """
+        if not self.breaker.allow():
+            return SSH_TRANSPORT_ERROR, "", f"推理主机 {self.name} 熔断中，{self.breaker.retry_after:.0f}s 后重试"
+        
+        exit_code, stdout, stderr = self._run_command(command, timeout)
+        if exit_code in (SSH_TRANSPORT_ERROR, COMMAND_FAILED):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return exit_code, stdout, stderr
     
     def connect(self) -> bool:
         """测试SSH连接"""
@@ -53,14 +122,14 @@ class SSHService:
         
         # 测试连接
         ssh_cmd = self._build_ssh_command("echo 'connection test'")
-        exit_code, stdout, stderr = self._run_command(ssh_cmd, timeout=30)
+        exit_code, stdout, stderr = self._run_remote(ssh_cmd, settings.SSH_LIST_TIMEOUT)
         
         if exit_code == 0:
             self._connected = True
-            logger.info("SSH连接测试成功")
+            logger.info(f"SSH连接测试成功: {self.name}")
             return True
         else:
-            logger.error(f"SSH连接测试失败: {stderr}")
+            logger.error(f"SSH连接测试失败: {self.name}, {stderr}")
             self._connected = False
             return False
     
@@ -69,25 +138,33 @@ class SSHService:
         self._connected = False
         logger.info("SSH服务已停止")
     
+    @property
+    def _timeout_options(self) -> str:
+        """连接超时与保活探测：主机无响应时 ssh 在约 3 个保活周期后退出，而不是一直挂起"""
+        return (
+            f"-o ConnectTimeout={settings.SSH_CONNECT_TIMEOUT} "
+            f"-o ServerAliveInterval={settings.SSH_KEEPALIVE_INTERVAL} -o ServerAliveCountMax=3"
+        )
+    
     def _build_ssh_command(self, remote_command: str) -> str:
         """构建SSH命令"""
         # 使用sshpass传递密码（如果可用），否则需要配置SSH密钥
         sshpass_available = shutil.which("sshpass") is not None
         
-        ssh_options = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR"
+        ssh_options = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR " + self._timeout_options
         
         if sshpass_available:
             return (
-                f'sshpass -p "{settings.SSH_PASSWORD}" '
-                f'ssh {ssh_options} -p {settings.SSH_PORT} '
-                f'{settings.SSH_USER}@{settings.SSH_HOST} '
+                f'sshpass -p "{self.password}" '
+                f'{settings.SSH_COMMAND} {ssh_options} -p {self.port} '
+                f'{self.user}@{self.host} '
                 f'"{remote_command}"'
             )
         else:
             # 没有sshpass，假设已配置SSH密钥
             return (
-                f'ssh {ssh_options} -p {settings.SSH_PORT} '
-                f'{settings.SSH_USER}@{settings.SSH_HOST} '
+                f'{settings.SSH_COMMAND} {ssh_options} -p {self.port} '
+                f'{self.user}@{self.host} '
                 f'"{remote_command}"'
             )
     
@@ -95,19 +172,19 @@ class SSHService:
         """构建SCP命令"""
         sshpass_available = shutil.which("sshpass") is not None
         
-        scp_options = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR"
+        scp_options = "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -o LogLevel=ERROR " + self._timeout_options
         
         if sshpass_available:
             return (
-                f'sshpass -p "{settings.SSH_PASSWORD}" '
-                f'scp {scp_options} -P {settings.SSH_PORT} '
-                f'{settings.SSH_USER}@{settings.SSH_HOST}:{remote_path} '
+                f'sshpass -p "{self.password}" '
+                f'{settings.SCP_COMMAND} {scp_options} -P {self.port} '
+                f'{self.user}@{self.host}:{remote_path} '
                 f'"{local_path}"'
             )
         else:
             return (
-                f'scp {scp_options} -P {settings.SSH_PORT} '
-                f'{settings.SSH_USER}@{settings.SSH_HOST}:{remote_path} '
+                f'{settings.SCP_COMMAND} {scp_options} -P {self.port} '
+                f'{self.user}@{self.host}:{remote_path} '
                 f'"{local_path}"'
             )
     
@@ -118,14 +195,14 @@ class SSHService:
         Args:
             remote_command: 要在远程执行的命令
             timeout: 超时时间（秒）
-            
+        
         Returns:
             (exit_code, stdout, stderr)
         """
         ssh_cmd = self._build_ssh_command(remote_command)
-        logger.info(f"执行远程命令: {remote_command[:100]}...")
+        logger.info(f"[{self.name}] 执行远程命令: {remote_command[:100]}...")
         
-        exit_code, stdout, stderr = self._run_command(ssh_cmd, timeout)
+        exit_code, stdout, stderr = self._run_remote(ssh_cmd, timeout)
         
         logger.info(f"命令执行完成，退出码: {exit_code}")
         if stderr and exit_code != 0:
@@ -133,45 +210,160 @@ class SSHService:
         
         return exit_code, stdout, stderr
     
-    async def run_inference(self, index: int, subfolder: str) -> dict:
+    def _pid_file(self, task_id: str) -> str:
+        """远程推理进程的 PID 文件路径"""
+        return f"{settings.REMOTE_PID_DIR}/{task_id}.pid"
+    
+    def kill_remote(self, task_id: str) -> bool:
+        """
+        终止远程推理进程组（demo.sh 及其启动的所有子进程）
+        
+        通过 PID 文件找到远程 shell，向其所在进程组发送 SIGTERM；进程已结束时视为成功
+        """
+        pid_file = self._pid_file(task_id)
+        # 外层双引号中的 $ 需要转义，交由远程 shell 展开
+        remote_command = (
+            f"if [ -f {pid_file} ]; then "
+            f"pgid=\\$(ps -o pgid= -p \\$(cat {pid_file}) | tr -d ' '); "
+            f"kill -TERM -- -\\$pgid 2>/dev/null; "
+            f"rm -f {pid_file}; fi"
+        )
+        exit_code, stdout, stderr = self.execute_command(remote_command, settings.SSH_LIST_TIMEOUT)
+        if exit_code == 0:
+            logger.info(f"[{self.name}] 已终止远程推理进程: {task_id}")
+            return True
+        logger.warning(f"[{self.name}] 终止远程推理进程失败: {task_id}, {stderr}")
+        return False
+    
+    def remove_output(self, task_id: str):
+        """
+        删除任务的独立输出目录（已发布的目录与临时目录）
+        
+        同时清理超过 2 倍 TASK_TIMEOUT 未修改的临时目录（后端重启前未完成的任务遗留）
+        """
+        if settings.MOCK_MODE or not settings.TASK_OUTPUT_DIRS:
+            return
+        result_base = task_result_base(task_id)
+        remote_command = (
+            f"rm -rf {result_base} {result_base}{STAGING_SUFFIX}; "
+            f"find {settings.REMOTE_RESULT_DIR}/{TASK_OUTPUT_SUBDIR} -mindepth 1 -maxdepth 1 "
+            f"-name '*{STAGING_SUFFIX}' -mmin +{max(settings.TASK_TIMEOUT * 2 // 60, 1)} "
+            f"-exec rm -rf {{}} + 2>/dev/null; true"
+        )
+        exit_code, stdout, stderr = self.execute_command(remote_command, settings.SSH_LIST_TIMEOUT)
+        if exit_code != 0:
+            logger.warning(f"[{self.name}] 删除远程任务目录失败: {task_id}, {stderr}")
+    
+    async def _stream_remote(self, remote_command: str, timeout: int, output: OutputBuffer) -> int:
+        """经过熔断器执行远程命令，输出流式写入 output"""
+        if not self.breaker.allow():
+            output.feed("stderr", f"推理主机 {self.name} 熔断中，{self.breaker.retry_after:.0f}s 后重试")
+            return SSH_TRANSPORT_ERROR
+        
+        ssh_cmd = self._build_ssh_command(remote_command)
+        logger.info(f"[{self.name}] 执行远程命令: {remote_command[:100]}...")
+        exit_code = await self._stream_command(ssh_cmd, timeout, output)
+        if exit_code in (SSH_TRANSPORT_ERROR, COMMAND_FAILED):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        
+        logger.info(f"命令执行完成，退出码: {exit_code}，输出 {output.total_lines} 行")
+        if exit_code != 0:
+            logger.warning(f"stderr: {output.stderr_tail(10)[-500:]}")
+        return exit_code
+    
+    async def run_inference(
+        self,
+        index: int,
+        subfolder: str,
+        timer: Optional[PhaseTimer] = None,
+        task_id: Optional[str] = None,
+        output: Optional[OutputBuffer] = None
+    ) -> dict:
         """
         执行模型推理
         
         Args:
             index: 序号参数
             subfolder: 子文件夹参数
-            
+            timer: 阶段计时器（可选），记录远程执行起止及远程时间戳标记
+            task_id: 任务ID（可选），提供时在远程记录 PID 文件，支持取消与超时后终止远程进程；
+                开启 TASK_OUTPUT_DIRS 时结果写入任务独立目录
+            output: 输出缓冲（可选），远程输出逐行写入，可实时查看日志与进度
+        
         Returns:
             推理结果字典
         """
+        output = output if output is not None else OutputBuffer()
+        
         # Mock模式：模拟推理过程
         if settings.MOCK_MODE:
-            return await self._mock_inference(index)
+            return await self._mock_inference(index, timer, output)
         
         start_time = time.time()
+        if timer:
+            timer.mark("remote_start", start_time)
         
         # 构建远程命令（使用 bash -l -c 登录模式加载环境）
+        # date +@@TS:... 输出远程时间戳标记，用于拆分登录、conda激活与脚本耗时
+        script_cmd = f"bash {settings.REMOTE_SCRIPT} {index} {subfolder}"
+        result_base = task_result_base(task_id)
+        if result_base != settings.REMOTE_RESULT_DIR:
+            # 任务独立输出目录：脚本写入临时目录，成功后整体重命名发布（失败时由 remove_output 清理）
+            staging = f"{result_base}{STAGING_SUFFIX}"
+            script_cmd = (
+                f"rm -rf {staging} && mkdir -p {staging}/sample_{subfolder} && "
+                f"{OUTPUT_DIR_ENV}={staging}/sample_{subfolder} {script_cmd}"
+            )
         inner_cmd = (
-            f"source /opt/anaconda3/etc/profile.d/conda.sh && "
+            f"date +@@TS:shell_ready:%s.%N && "
+            f"source {settings.CONDA_PROFILE} && "
             f"conda activate {settings.REMOTE_CONDA_ENV} && "
+            f"date +@@TS:env_ready:%s.%N && "
             f"cd {settings.REMOTE_WORK_DIR} && "
-            f"bash {settings.REMOTE_SCRIPT} {index} {subfolder}"
+            f"{script_cmd} && "
+            f"date +@@TS:script_end:%s.%N"
         )
+        if result_base != settings.REMOTE_RESULT_DIR:
+            inner_cmd += f" && rm -rf {result_base} && mv {staging} {result_base}"
+        if settings.RESULT_MANIFEST:
+            # 推理结束后直接输出结果清单（大小、修改时间、sha256），省去单独的列目录请求
+            inner_cmd += f" && {manifest_command(f'{result_base}/sample_{subfolder}')}"
+        if task_id:
+            # 记录远程 shell 的 PID（其进程组包含 demo.sh 启动的所有进程），结束后删除
+            pid_file = self._pid_file(task_id)
+            inner_cmd = (
+                f"mkdir -p {settings.REMOTE_PID_DIR} && echo \\$\\$ > {pid_file} && "
+                f"{{ {inner_cmd}; }}; status=\\$?; rm -f {pid_file}; exit \\$status"
+            )
         remote_command = f"bash -l -c '{inner_cmd}'"
         
-        # 在线程池中执行（避免阻塞事件循环）
-        loop = asyncio.get_event_loop()
-        exit_code, stdout, stderr = await loop.run_in_executor(
-            None,
-            lambda: self.execute_command(remote_command, timeout=settings.TASK_TIMEOUT)
+        # 异步子进程流式读取输出（不占用线程池）。
+        # 只有远程命令尚未开始（没有输出 shell_ready 标记）的连接失败才重试，避免重复执行推理
+        exit_code = await self.retry_policy.run_async(
+            f"[{self.name}] 远程推理连接",
+            lambda: self._stream_remote(remote_command, settings.TASK_TIMEOUT, output),
+            lambda code: (
+                code == SSH_TRANSPORT_ERROR
+                and "shell_ready" not in output.markers
+                and self._should_retry((code, "", ""))
+            )
         )
         
         inference_time = time.time() - start_time
+        if timer:
+            timer.mark("remote_end")
+            timer.add_remote_markers(output.markers)
+        
+        # 本地超时只会结束 ssh 客户端，远程进程需要显式终止
+        if exit_code == COMMAND_FAILED and task_id:
+            await asyncio.to_thread(self.kill_remote, task_id)
         
         if exit_code != 0:
             return {
                 "success": False,
-                "error": stderr or stdout or "命令执行失败",
+                "error": output.stderr_tail() or "\n".join(item["line"] for item in output.tail(20)) or "命令执行失败",
                 "exit_code": exit_code,
                 "inference_time": round(inference_time, 2)
             }
@@ -180,22 +372,24 @@ class SSHService:
             "success": True,
             "message": "推理完成",
             "inference_time": round(inference_time, 2),
-            "result_dir": settings.REMOTE_RESULT_DIR
+            "result_dir": result_base,
+            "manifest": output.manifest if output.manifest.complete else None
         }
     
-    def list_result_files(self, subfolder: str = None) -> List[str]:
+    def list_result_files(self, subfolder: str = None, task_id: Optional[str] = None) -> List[str]:
         """
         列出结果目录中的gif文件
         
         Args:
             subfolder: 子文件夹参数，如 "00000"，会查找 sample_00000 目录
+            task_id: 任务ID（可选），开启 TASK_OUTPUT_DIRS 时在任务独立目录中查找
         
         Returns:
             文件路径列表
         """
         if subfolder:
             # 只查找 sample_{subfolder} 目录最外层的 gif 文件（不递归子目录）
-            target_dir = f"{settings.REMOTE_RESULT_DIR}/sample_{subfolder}"
+            target_dir = f"{task_result_base(task_id)}/sample_{subfolder}"
             remote_command = (
                 f"find {target_dir} -maxdepth 1 -type f -name '*.gif' 2>/dev/null"
             )
@@ -207,7 +401,11 @@ class SSHService:
                 f"2>/dev/null"
             )
         
-        exit_code, stdout, stderr = self.execute_command(remote_command, timeout=30)
+        exit_code, stdout, stderr = self.retry_policy.run(
+            f"[{self.name}] 列出结果文件",
+            lambda: self.execute_command(remote_command, settings.SSH_LIST_TIMEOUT),
+            self._should_retry
+        )
         
         if exit_code == 0 and stdout:
             files = [f.strip() for f in stdout.strip().split('\n') if f.strip()]
@@ -215,22 +413,53 @@ class SSHService:
         
         return []
     
-    def download_file(self, remote_path: str, local_path: str) -> bool:
+    def probe_gpu_load(self) -> Optional[dict]:
+        """
+        通过 nvidia-smi 探测远程GPU负载
+        
+        Returns:
+            {"gpus": GPU数量, "utilization": 最高利用率(%), "memory": 最高显存占用比例}，
+            探测失败时返回 None
+        """
+        if settings.MOCK_MODE:
+            # Mock模式：按正在执行的推理数模拟负载
+            utilization = min(100.0, self._mock_running * 45.0 + random.uniform(0, 10))
+            return {"gpus": 1, "utilization": utilization, "memory": min(1.0, utilization / 100)}
+        
+        exit_code, stdout, stderr = self.execute_command(" ".join(GPU_QUERY_COMMAND), settings.SSH_LIST_TIMEOUT)
+        if exit_code != 0:
+            return None
+        return parse_gpu_load(stdout)
+    
+    def download_file(self, remote_path: str, local_path: str, expected_sha256: Optional[str] = None) -> bool:
         """
         从远程服务器下载文件
         
         Args:
             remote_path: 远程文件完整路径
             local_path: 本地保存路径
-            
+            expected_sha256: 期望的 sha256（可选），下载后校验，不一致视为失败
+        
         Returns:
             是否成功
         """
         # 确保本地目录存在
         Path(local_path).parent.mkdir(parents=True, exist_ok=True)
-        
         scp_cmd = self._build_scp_command(remote_path, local_path)
-        exit_code, stdout, stderr = self._run_command(scp_cmd, timeout=60)
+        
+        def attempt() -> Tuple[int, str, str]:
+            result = self._run_remote(scp_cmd, settings.SSH_TRANSFER_TIMEOUT)
+            if result[0] == 0 and expected_sha256 and file_sha256(Path(local_path)) != expected_sha256:
+                Path(local_path).unlink(missing_ok=True)
+                return 1, "", "文件校验失败（sha256 不一致）"
+            return result
+        
+        # 下载是幂等的，任何失败都可以重试（熔断器打开时除外）
+        exit_code, stdout, stderr = self.retry_policy.run(
+            f"[{self.name}] 下载 {remote_path}",
+            attempt,
+            lambda r: r[0] != 0 and self.breaker.state != CircuitBreaker.OPEN
+        )
         
         if exit_code == 0:
             logger.info(f"文件下载成功: {remote_path} -> {local_path}")
@@ -239,37 +468,155 @@ class SSHService:
             logger.error(f"文件下载失败: {stderr}")
             return False
     
-    def download_results(self, subfolder: str, local_dir: str) -> List[str]:
+    def download_results(
+        self,
+        subfolder: str,
+        local_dir: str,
+        timer: Optional[PhaseTimer] = None,
+        manifest: Optional[ResultManifest] = None,
+        report: Optional[dict] = None,
+        task_id: Optional[str] = None
+    ) -> List[str]:
         """
         下载推理结果文件到本地
         
         Args:
             subfolder: 子文件夹参数，如 "00000"
             local_dir: 本地目录
-            
+            timer: 阶段计时器（可选），记录列目录与下载的起止时间
+            manifest: 推理输出的结果清单（可选），提供时不再列远程目录，并跳过本地已存在且哈希一致的文件
+            report: 同步统计（可选），写入传输字节数、复用文件数与节省的字节数
+            task_id: 任务ID（可选），开启 TASK_OUTPUT_DIRS 时从任务独立目录下载
+        
         Returns:
             下载的本地文件路径列表
         """
-        # Mock模式：生成模拟图片
+        report = report if report is not None else {}
+        for key in ("transferred_bytes", "saved_bytes", "resumed_bytes", "reused_files"):
+            report.setdefault(key, 0)
+        # Mock模式：从预生成的 GIF 池取结果文件
         if settings.MOCK_MODE:
-            return self._generate_mock_result_image(local_dir, 0)
+            if timer:
+                timer.mark("download_start")
+            files = mock_engine.materialize(local_dir, settings.MOCK_UNIQUE_OUTPUTS)
+            if timer:
+                timer.mark("download_end")
+            return files
         
         downloaded_files = []
-        # 获取指定 subfolder 目录最外层的 gif 文件
-        remote_files = self.list_result_files(subfolder)
+        if manifest is not None and manifest.complete:
+            remote_files = manifest.entries
+        else:
+            # 没有结果清单时，列出指定 subfolder 目录最外层的 gif 文件
+            if timer:
+                timer.mark("listing_start")
+            remote_files = [ResultFile(path) for path in self.list_result_files(subfolder, task_id)]
+            if timer:
+                timer.mark("listing_end")
         
         logger.info(f"找到 {len(remote_files)} 个结果文件")
         
-        for remote_path in remote_files:
+        skipped = 0
+        result_base = task_result_base(task_id)
+        if timer:
+            timer.mark("download_start")
+        for remote_file in remote_files:
             # 保留相对于结果目录的路径结构
-            relative_path = remote_path.replace(settings.REMOTE_RESULT_DIR + "/", "")
+            relative_path = remote_file.path.replace(result_base + "/", "")
             local_path = str(Path(local_dir) / relative_path)
             
-            if self.download_file(remote_path, local_path):
+            if self._is_same_file(Path(local_path), remote_file):
+                skipped += 1
+                report["saved_bytes"] += remote_file.size or 0
                 downloaded_files.append(local_path)
-        
+            elif settings.SYNC_MODE == "store" and remote_file.sha256:
+                if self._sync_via_store(remote_file, Path(local_path), report):
+                    downloaded_files.append(local_path)
+            elif self.download_file(remote_file.path, local_path, remote_file.sha256):
+                report["transferred_bytes"] += Path(local_path).stat().st_size
+                downloaded_files.append(local_path)
+        if timer:
+            timer.mark("download_end")
+        
+        if skipped:
+            logger.info(f"{skipped} 个文件本地已存在且哈希一致，跳过下载")
+        logger.info(
+            f"结果同步完成: 传输 {report['transferred_bytes']} 字节，"
+            f"复用 {report['reused_files']} 个文件，节省 {report['saved_bytes']} 字节"
+        )
         return downloaded_files
     
+    def _sync_via_store(self, remote_file: ResultFile, local_path: Path, report: dict) -> bool:
+        """
+        通过内容存储同步单个文件
+        
+        存储中已有相同哈希的内容时直接硬链接到任务目录，否则下载到存储（支持断点续传）后再链接
+        """
+        sha256 = remote_file.sha256
+        with result_store.lock(sha256):
+            if result_store.has(sha256, remote_file.size):
+                report["reused_files"] += 1
+                report["saved_bytes"] += remote_file.size or 0
+            else:
+                partial = result_store.prepare(sha256)
+                resumed = partial.stat().st_size if partial.exists() else 0
+                if not self._fetch_into_store(remote_file):
+                    return False
+                report["resumed_bytes"] += resumed
+                report["saved_bytes"] += resumed
+                report["transferred_bytes"] += (remote_file.size or 0) - resumed
+            # 在锁内链接，避免存储回收在链接前删除未被引用的内容
+            result_store.link(sha256, local_path)
+        return True
+    
+    def _fetch_into_store(self, remote_file: ResultFile) -> bool:
+        """下载文件到内容存储的临时文件，已有部分内容时只传输剩余字节，校验哈希后移入存储"""
+        partial = result_store.partial_path(remote_file.sha256)
+        
+        def attempt() -> Tuple[int, str, str]:
+            offset = partial.stat().st_size if partial.exists() else 0
+            if remote_file.size is not None and offset >= remote_file.size:
+                # 临时文件已完整（或异常偏大），校验不通过时重新下载
+                if offset == remote_file.size and file_sha256(partial) == remote_file.sha256:
+                    return 0, "", ""
+                partial.unlink()
+                offset = 0
+            
+            if offset:
+                logger.info(f"[{self.name}] 续传 {remote_file.path}，已有 {offset} 字节")
+                command = self._build_ssh_command(f"tail -c +{offset + 1} {remote_file.path}") + f' >> "{partial}"'
+            else:
+                command = self._build_scp_command(remote_file.path, str(partial))
+            
+            # 传输失败时保留临时文件，下次从已有字节处续传
+            result = self._run_remote(command, settings.SSH_TRANSFER_TIMEOUT)
+            if result[0] == 0 and file_sha256(partial) != remote_file.sha256:
+                partial.unlink(missing_ok=True)
+                return 1, "", "文件校验失败（sha256 不一致）"
+            return result
+        
+        exit_code, stdout, stderr = self.retry_policy.run(
+            f"[{self.name}] 下载 {remote_file.path}",
+            attempt,
+            lambda r: r[0] != 0 and self.breaker.state != CircuitBreaker.OPEN
+        )
+        if exit_code != 0:
+            logger.error(f"文件下载失败: {remote_file.path}, {stderr}")
+            return False
+        
+        result_store.commit(remote_file.sha256)
+        logger.info(f"文件下载成功: {remote_file.path} -> 内容存储 {remote_file.sha256[:12]}")
+        return True
+    
+    @staticmethod
+    def _is_same_file(local_path: Path, remote_file: ResultFile) -> bool:
+        """本地文件与远程文件大小、哈希均一致"""
+        if not remote_file.sha256 or not local_path.is_file():
+            return False
+        if remote_file.size is not None and local_path.stat().st_size != remote_file.size:
+            return False
+        return file_sha256(local_path) == remote_file.sha256
+    
     @property
     def is_connected(self) -> bool:
         """检查是否可用"""
@@ -277,23 +624,52 @@ class SSHService:
             return True
         return self._ssh_available
     
-    async def _mock_inference(self, index: int) -> dict:
+    async def _mock_inference(
+        self, index: int, timer: Optional[PhaseTimer] = None, output: Optional[OutputBuffer] = None
+    ) -> dict:
         """
-        Mock推理 - 用于测试
+        Mock推理 - 用于压测与容量规划，耗时分布与失败率见 MOCK_* 配置
         
         Args:
             index: 序号参数
-            
+            timer: 阶段计时器（可选）
+            output: 输出缓冲（可选），写入模拟的逐帧进度与远程时间戳标记
+        
         Returns:
-            模拟的推理结果
+            模拟的推理结果，失败时退出码与真实执行一致（连接失败 255，超时 COMMAND_FAILED）
         """
         logger.info(f"[MOCK MODE] 模拟推理，序号: {index}")
+        output = output if output is not None else OutputBuffer()
         start_time = time.time()
+        if timer:
+            timer.mark("remote_start", start_time)
         
-        # 模拟推理耗时（2-5秒）
-        await asyncio.sleep(random.uniform(2, 5))
+        if not self.breaker.allow():
+            output.feed("stderr", f"推理主机 {self.name} 熔断中，{self.breaker.retry_after:.0f}s 后重试")
+            outcome = OUTCOME_TRANSPORT
+        else:
+            self._mock_running += 1
+            try:
+                outcome = await mock_engine.run(index, output)
+            finally:
+                self._mock_running -= 1
+            if outcome in (OUTCOME_TRANSPORT, OUTCOME_TIMEOUT):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
         
         inference_time = time.time() - start_time
+        if timer:
+            timer.mark("remote_end")
+            timer.add_remote_markers(output.markers)
+        
+        if outcome != OUTCOME_SUCCESS:
+            return {
+                "success": False,
+                "error": output.stderr_tail() or "命令执行失败",
+                "exit_code": MOCK_EXIT_CODES[outcome],
+                "inference_time": round(inference_time, 2)
+            }
         
         return {
             "success": True,
@@ -301,56 +677,6 @@ class SSHService:
             "inference_time": round(inference_time, 2),
             "result_dir": settings.REMOTE_RESULT_DIR
         }
-    
-    def _generate_mock_result_image(self, local_dir: str, index: int) -> List[str]:
-        """
-        生成模拟的结果图片
-        
-        Args:
-            local_dir: 本地保存目录
-            index: 序号
-            
-        Returns:
-            生成的文件路径列表
-        """
-        files = []
-        Path(local_dir).mkdir(parents=True, exist_ok=True)
-        
-        # 生成一张模拟结果图片
-        img_width, img_height = 800, 600
-        img = Image.new('RGB', (img_width, img_height), color=(30, 30, 30))
-        draw = ImageDraw.Draw(img)
-        
-        # 绘制模拟检测框
-        colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
-        labels = ["car", "pedestrian", "cyclist", "truck"]
-        
-        for i in range(random.randint(2, 5)):
-            x1 = random.randint(50, img_width - 200)
-            y1 = random.randint(50, img_height - 150)
-            x2 = x1 + random.randint(80, 180)
-            y2 = y1 + random.randint(60, 120)
-            color = colors[i % len(colors)]
-            label = labels[i % len(labels)]
-            confidence = random.uniform(0.75, 0.98)
-            
-            # 画框
-            draw.rectangle([x1, y1, x2, y2], outline=color, width=2)
-            # 标签
-            draw.text((x1, y1 - 15), f"{label} {confidence:.2f}", fill=color)
-        
-        # 添加标题
-        draw.text((10, 10), f"[MOCK] Inference Result - Index: {index}", fill=(255, 255, 255))
-        draw.text((10, img_height - 30), "This is a mock result for testing", fill=(150, 150, 150))
-        
-        # 保存图片
-        filename = f"result_{index}.jpg"
-        filepath = str(Path(local_dir) / filename)
-        img.save(filepath, "JPEG", quality=90)
-        files.append(filepath)
-        
-        logger.info(f"[MOCK] 生成模拟结果图片: {filepath}")
-        return files
 
 
 # 全局SSH服务实例
@@ -0,0 +1,105 @@
+"""远程输出采集 - 逐行读取推理输出，环形缓冲保存最近日志并解析进度"""
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.services.phase_timing import REMOTE_MARKER_PATTERN
+from app.services.result_manifest import ResultManifest
+
+
+# 显式进度标记: @@PROGRESS:<已完成>/<总数>
+PROGRESS_MARKER_PATTERN = re.compile(r"^@@PROGRESS:(\d+)/(\d+)\s*$")
+
+# 按 \r 或 \n 分行（tqdm 等进度条使用 \r 刷新同一行）
+LINE_SPLIT_PATTERN = re.compile(r"[\r\n]")
+
+
+class OutputBuffer:
+    """
+    单个任务的输出缓冲
+    
+    - 只保留最近 TASK_OUTPUT_LINES 行，单行超过 TASK_OUTPUT_LINE_LENGTH 截断，内存占用有上限
+    - @@ 开头的标记行（时间戳、进度、结果清单）单独解析，不进入日志
+    - 普通输出行匹配 PROGRESS_PATTERN 时同样更新进度
+    """
+    
+    def __init__(self, max_lines: int = None, max_line_length: int = None):
+        self.max_line_length = max_line_length or settings.TASK_OUTPUT_LINE_LENGTH
+        self.lines: deque = deque(maxlen=max_lines or settings.TASK_OUTPUT_LINES)
+        self.total_lines = 0
+        self.markers: Dict[str, float] = {}
+        self.manifest = ResultManifest()
+        self.progress: Optional[float] = None  # 进度百分比 0-100
+        self.updated_at: Optional[float] = None
+        self._progress_pattern = (
+            re.compile(settings.PROGRESS_PATTERN) if settings.PROGRESS_PATTERN else None
+        )
+        self._partial: Dict[str, str] = {}
+    
+    def write(self, stream: str, text: str):
+        """写入一段原始输出（可能包含不完整的行）"""
+        pending = self._partial.get(stream, "") + text
+        *lines, pending = LINE_SPLIT_PATTERN.split(pending)
+        for line in lines:
+            self.feed(stream, line)
+        # 长时间没有换行的输出按最大行长度强制分行
+        while len(pending) > self.max_line_length:
+            self.feed(stream, pending[:self.max_line_length])
+            pending = pending[self.max_line_length:]
+        self._partial[stream] = pending
+    
+    def flush(self):
+        """输出结束，写入剩余的不完整行"""
+        for stream, pending in self._partial.items():
+            if pending:
+                self.feed(stream, pending)
+        self._partial.clear()
+    
+    def feed(self, stream: str, line: str):
+        """写入一行输出"""
+        line = line.rstrip()
+        if not line:
+            return
+        now = time.time()
+        self.updated_at = now
+        
+        if line.startswith("@@"):
+            marker = REMOTE_MARKER_PATTERN.match(line)
+            if marker:
+                self.markers[marker.group(1)] = float(marker.group(2))
+                return
+            progress = PROGRESS_MARKER_PATTERN.match(line)
+            if progress:
+                self._set_progress(int(progress.group(1)), int(progress.group(2)))
+                return
+            if self.manifest.feed(line):
+                return
+        
+        self.total_lines += 1
+        if len(line) > self.max_line_length:
+            line = line[:self.max_line_length] + "..."
+        self.lines.append((now, stream, line))
+        
+        if self._progress_pattern:
+            match = self._progress_pattern.search(line)
+            if match:
+                self._set_progress(int(match.group(1)), int(match.group(2)))
+    
+    def _set_progress(self, done: int, total: int):
+        if total > 0:
+            self.progress = round(min(done / total, 1.0) * 100, 1)
+    
+    def tail(self, count: int) -> List[dict]:
+        """最近 count 行输出"""
+        lines = list(self.lines)[-count:] if count > 0 else []
+        return [
+            {"time": round(ts, 3), "stream": stream, "line": line}
+            for ts, stream, line in lines
+        ]
+    
+    def stderr_tail(self, count: int = 20) -> str:
+        """最近 count 行标准错误输出，用于失败时的错误信息"""
+        lines = [line for _, stream, line in self.lines if stream == "stderr"]
+        return "\n".join(lines[-count:])
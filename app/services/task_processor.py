@@ -1,24 +1,206 @@
 """任务处理器 - 处理推理任务的核心逻辑"""
+import asyncio
 import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
 from app.models.database import async_session_factory
 from app.models.task import Task, TaskStatus
-from app.services.ssh_service import ssh_service
+from app.services.executor import InferenceExecutor, task_result_base
+from app.services.phase_timing import PhaseTimer
+from app.services.backend_pool import backend_pool
+from app.services.task_queue import EXPIRED_MESSAGE, task_queue
+from app.services.admission import admission_controller
+from app.services.analytics import task_analytics
+from app.services.speculation import speculator
+from app.services.task_output import OutputBuffer
+from app.services.result_manifest import ResultManifest
+from app.services.result_index import build_file_records, save_task_files
 
 
-async def process_inference_task(task_data: dict):
+@dataclass
+class RunningTask:
+    """正在处理的任务（用于取消）"""
+    future: Optional[asyncio.Future] = None  # 推理与结果获取协程
+    service: Optional[InferenceExecutor] = None  # 正在执行推理的主机
+    cancelled: bool = False
+    output: OutputBuffer = field(default_factory=OutputBuffer)  # 推理输出（最近日志与进度）
+    task: Optional[Task] = None  # 任务记录（处理结束后用于统计）
+
+
+# 正在处理的任务: task_id -> RunningTask
+_running: Dict[str, RunningTask] = {}
+
+# 共享输出目录时同一 subfolder 的任务串行执行: subfolder -> (锁, 持有与等待的任务数)
+_subfolder_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+
+@asynccontextmanager
+async def _subfolder_slot(subfolder: str):
+    """
+    未开启 TASK_OUTPUT_DIRS 时，同一 subfolder 的任务写入同一个远程目录，推理与结果获取需串行执行
+    
+    Mock 模式的结果直接生成在任务目录中，不需要串行
+    """
+    if settings.TASK_OUTPUT_DIRS or settings.MOCK_MODE:
+        yield
+        return
+    lock, users = _subfolder_locks.get(subfolder) or (asyncio.Lock(), 0)
+    _subfolder_locks[subfolder] = (lock, users + 1)
+    try:
+        async with lock:
+            yield
+    finally:
+        lock, users = _subfolder_locks[subfolder]
+        if users > 1:
+            _subfolder_locks[subfolder] = (lock, users - 1)
+        else:
+            del _subfolder_locks[subfolder]
+
+
+def get_live_output(task_id: str) -> Optional[OutputBuffer]:
+    """获取正在处理任务的输出缓冲，任务未在处理时返回 None"""
+    running = _running.get(task_id)
+    return running.output if running else None
+
+
+async def _persist_progress(task_id: str, output: OutputBuffer):
+    """定期将进度写入数据库（仅在进度变化时写入）"""
+    last = None
+    while True:
+        await asyncio.sleep(settings.PROGRESS_UPDATE_INTERVAL)
+        progress = output.progress
+        if progress is None or progress == last:
+            continue
+        last = progress
+        try:
+            async with async_session_factory() as session:
+                await session.execute(
+                    update(Task).where(Task.task_id == task_id).values(progress=progress)
+                )
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"进度写入失败: {task_id}, {e}")
+
+
+async def _collect_results(
+    service: InferenceExecutor,
+    task_id: str,
+    subfolder: str,
+    timer: PhaseTimer,
+    manifest: Optional[ResultManifest],
+    report: dict
+) -> List[str]:
+    """获取推理结果文件（本地模式直接使用本地路径，远程模式下载到本地，同步统计写入 report）"""
+    # 本地模式 + 结果清单：远程路径映射为本地路径，无需扫描目录
+    if settings.LOCAL_MODE and manifest is not None:
+        downloaded_files = [
+            entry.path.replace(settings.REMOTE_RESULT_DIR, settings.LOCAL_RESULT_DIR, 1)
+            for entry in manifest.entries
+        ]
+        logger.info(f"[LOCAL MODE] 使用结果清单，找到 {len(downloaded_files)} 个gif文件")
+        return downloaded_files
+    
+    # 本地模式：跳过下载，直接使用本地文件路径
+    if settings.LOCAL_MODE:
+        # 只查找 sample_{subfolder} 目录最外层的 gif 文件
+        local_sample_dir = Path(task_result_base(task_id, settings.LOCAL_RESULT_DIR)) / f"sample_{subfolder}"
+        downloaded_files = []
+        timer.mark("listing_start")
+        if local_sample_dir.exists():
+            for file_path in local_sample_dir.iterdir():  # 不递归，只查最外层
+                if file_path.is_file() and file_path.suffix.lower() == ".gif":
+                    downloaded_files.append(str(file_path))
+        timer.mark("listing_end")
+        logger.info(f"[LOCAL MODE] 跳过下载，直接使用本地路径，找到 {len(downloaded_files)} 个gif文件")
+        return downloaded_files
+    
+    # 下载结果文件到本地（scp 为阻塞调用，放到线程中执行）
+    local_result_dir = settings.RESULTS_DIR / task_id
+    local_result_dir.mkdir(parents=True, exist_ok=True)
+    return await asyncio.to_thread(
+        service.download_results, subfolder, str(local_result_dir), timer, manifest, report, task_id
+    )
+
+
+async def _run_with_failover(
+    task_id: str, index: int, subfolder: str, timer: PhaseTimer, running: RunningTask
+) -> Tuple[dict, List[str], str]:
+    """
+    在主机池中选择主机执行推理并获取结果
+    
+    连接层失败（主机宕机、网络中断）时换一台主机重试，最多 BACKEND_MAX_ATTEMPTS 次
+    
+    Returns:
+        (推理结果, 结果文件列表, 执行主机名)
+    """
+    async with _subfolder_slot(subfolder):
+        return await _run_on_backends(task_id, index, subfolder, timer, running)
+
+
+async def _run_on_backends(
+    task_id: str, index: int, subfolder: str, timer: PhaseTimer, running: RunningTask
+) -> Tuple[dict, List[str], str]:
+    tried = set()
+    while True:
+        backend = await backend_pool.acquire(exclude=tried)
+        running.service = backend.service
+        inference_result = {}
+        downloaded_files = []
+        start_time = time.time()
+        try:
+            inference_result = await backend.service.run_inference(
+                index, subfolder, timer, task_id, running.output
+            )
+            if inference_result.get("success"):
+                inference_result["sync"] = {}
+                downloaded_files = await _collect_results(
+                    backend.service, task_id, subfolder, timer,
+                    inference_result.get("manifest"), inference_result["sync"]
+                )
+        finally:
+            await backend_pool.release(
+                backend,
+                inference_result.get("inference_time") or time.time() - start_time,
+                bool(inference_result.get("success")),
+                InferenceExecutor.is_transport_error(inference_result.get("exit_code")),
+                cancelled=running.cancelled
+            )
+        
+        if settings.TASK_OUTPUT_DIRS and not (settings.LOCAL_MODE and inference_result.get("success")):
+            # 结果已下载到本地或推理失败，删除远程任务目录（本地模式下结果直接从任务目录读取）
+            await asyncio.to_thread(backend.service.remove_output, task_id)
+        
+        tried.add(backend.name)
+        if (
+            not running.cancelled
+            and InferenceExecutor.is_transport_error(inference_result.get("exit_code"))
+            and len(tried) < settings.BACKEND_MAX_ATTEMPTS
+            and backend_pool.has_alternative(tried)
+        ):
+            logger.warning(f"推理主机 {backend.name} 连接失败，换主机重试: {task_id}")
+            continue
+        return inference_result, downloaded_files, backend.name
+
+
+async def process_inference_task(task_data: dict) -> Optional[TaskStatus]:
     """
     处理推理任务
     
     Args:
         task_data: 任务数据，包含 task_id、index 和 subfolder
+    
+    Returns:
+        任务最终状态（任务数据无效或不存在时返回 None）
     """
     task_id = task_data.get("task_id")
     index = task_data.get("index")
@@ -28,6 +210,71 @@ async def process_inference_task(task_data: dict):
         logger.error(f"无效的任务数据: {task_data}")
         return
     
+    # 阶段计时：以入队时间为起点
+    timer = PhaseTimer(task_data.get("queued_at"))
+    timer.mark("queued", timer.origin)
+    timer.mark("picked_up", task_data.get("picked_up_at"))
+    
+    running = _running[task_id] = RunningTask()
+    try:
+        status = await _process(task_id, index, subfolder, timer, running)
+    finally:
+        _running.pop(task_id, None)
+    if running.task is not None:
+        task_analytics.record(status, subfolder, running.task.client_ip, running.task.inference_time)
+    speculator.finished(task_id, status, time.time() - task_data.get("picked_up_at", time.time()))
+    return status
+
+
+async def _expire(session: AsyncSession, task_id: str) -> TaskStatus:
+    """将排队中的任务标记为过期（仅当任务仍为等待状态，避免覆盖并发的取消）"""
+    updated = await session.execute(
+        update(Task)
+        .where(Task.task_id == task_id, Task.status == TaskStatus.PENDING)
+        .values(status=TaskStatus.EXPIRED, completed_at=datetime.utcnow(), error_message=EXPIRED_MESSAGE)
+    )
+    await session.commit()
+    if updated.rowcount == 0:
+        logger.info(f"任务状态已变化，跳过: {task_id}")
+        return TaskStatus.CANCELLED
+    logger.info(f"任务已过期，跳过执行: {task_id}")
+    return TaskStatus.EXPIRED
+
+
+async def _finish_cancelled(session: AsyncSession, task: Task, timer: PhaseTimer) -> TaskStatus:
+    """写入取消状态（取消接口已更新状态，这里补充耗时信息并避免被覆盖）"""
+    task.status = TaskStatus.CANCELLED
+    task.completed_at = task.completed_at or datetime.utcnow()
+    timer.mark("finalize")
+    task.phase_timings = timer.to_json()
+    await session.commit()
+    logger.info(f"任务已取消: {task.task_id}")
+    return TaskStatus.CANCELLED
+
+
+async def _finalize(session: AsyncSession, task: Task, timer: PhaseTimer, status: TaskStatus, **values) -> TaskStatus:
+    """
+    写入任务的最终状态（仅当任务仍为处理中，避免覆盖下载结果期间并发的取消）
+    
+    任务已被取消时丢弃本次的修改（含结果文件记录），返回 CANCELLED
+    """
+    timer.mark("finalize")
+    updated = await session.execute(
+        update(Task)
+        .where(Task.task_id == task.task_id, Task.status == TaskStatus.PROCESSING)
+        .values(status=status, completed_at=datetime.utcnow(), phase_timings=timer.to_json(), **values)
+    )
+    if updated.rowcount == 0:
+        await session.rollback()
+        await session.refresh(task)
+        return await _finish_cancelled(session, task, timer)
+    await session.commit()
+    return status
+
+
+async def _process(
+    task_id: str, index: int, subfolder: str, timer: PhaseTimer, running: RunningTask
+) -> Optional[TaskStatus]:
     async with async_session_factory() as session:
         try:
             # 查询任务
@@ -39,65 +286,145 @@ async def process_inference_task(task_data: dict):
             if not task:
                 logger.error(f"任务不存在: {task_id}")
                 return
+            running.task = task
+            
+            if task.status == TaskStatus.CANCELLED:
+                logger.info(f"任务已取消，跳过: {task_id}")
+                return TaskStatus.CANCELLED
             
-            # 更新状态为处理中
-            task.status = TaskStatus.PROCESSING
+            if task.deadline and task.deadline <= datetime.utcnow():
+                # 超过期限仍未开始执行（客户端多半已不再等待结果），不占用推理主机
+                return await _expire(session, task_id)
+            
+            # 更新状态为处理中（仅当任务仍为等待状态，避免覆盖并发的取消）
+            updated = await session.execute(
+                update(Task)
+                .where(Task.task_id == task_id, Task.status == TaskStatus.PENDING)
+                .values(status=TaskStatus.PROCESSING)
+            )
             await session.commit()
+            if updated.rowcount == 0:
+                logger.info(f"任务状态已变化，跳过: {task_id}")
+                return TaskStatus.CANCELLED
+            timer.mark("status_committed")
             logger.info(f"任务状态更新为处理中: {task_id}, 序号: {index}, 子文件夹: {subfolder}")
             
             # 执行SSH远程推理
             try:
-                inference_result = await ssh_service.run_inference(index, subfolder)
+                running.future = asyncio.ensure_future(
+                    _run_with_failover(task_id, index, subfolder, timer, running)
+                )
+                progress_writer = asyncio.create_task(_persist_progress(task_id, running.output))
+                try:
+                    inference_result, downloaded_files, backend_name = await running.future
+                except asyncio.CancelledError:
+                    if not running.cancelled:
+                        raise
+                    return await _finish_cancelled(session, task, timer)
+                finally:
+                    progress_writer.cancel()
+                task.progress = running.output.progress
+                task.backend = backend_name
+                
+                if running.cancelled:
+                    return await _finish_cancelled(session, task, timer)
                 
                 if not inference_result.get("success"):
                     # 推理失败
-                    task.status = TaskStatus.FAILED
-                    task.error_message = inference_result.get("error", "推理失败")
-                    task.inference_time = inference_result.get("inference_time")
-                    task.completed_at = datetime.utcnow()
-                    await session.commit()
-                    logger.error(f"任务推理失败: {task_id}")
-                    return
-                
-                # 本地模式：跳过下载，直接使用本地文件路径
-                if settings.LOCAL_MODE:
-                    # 只查找 sample_{subfolder} 目录最外层的 gif 文件
-                    local_sample_dir = Path(settings.LOCAL_RESULT_DIR) / f"sample_{subfolder}"
-                    downloaded_files = []
-                    if local_sample_dir.exists():
-                        for file_path in local_sample_dir.iterdir():  # 不递归，只查最外层
-                            if file_path.is_file() and file_path.suffix.lower() == ".gif":
-                                downloaded_files.append(str(file_path))
-                    logger.info(f"[LOCAL MODE] 跳过下载，直接使用本地路径，找到 {len(downloaded_files)} 个gif文件")
-                else:
-                    # 下载结果文件到本地
-                    local_result_dir = settings.RESULTS_DIR / task_id
-                    local_result_dir.mkdir(parents=True, exist_ok=True)
-                    downloaded_files = ssh_service.download_results(subfolder, str(local_result_dir))
+                    status = await _finalize(
+                        session, task, timer, TaskStatus.FAILED,
+                        error_message=inference_result.get("error", "推理失败"),
+                        inference_time=inference_result.get("inference_time")
+                    )
+                    if status == TaskStatus.FAILED:
+                        logger.error(f"任务推理失败: {task_id}")
+                    return status
                 
                 if not downloaded_files:
                     logger.warning(f"未找到结果文件: {task_id}")
                 
                 # 更新任务状态为完成
-                task.status = TaskStatus.COMPLETED
-                task.result = json.dumps({
-                    "files": downloaded_files,
-                    "remote_dir": settings.REMOTE_RESULT_DIR
-                }, ensure_ascii=False)
-                task.inference_time = inference_result.get("inference_time")
-                task.completed_at = datetime.utcnow()
-                
-                await session.commit()
-                logger.info(f"任务完成: {task_id}, 下载了 {len(downloaded_files)} 个文件")
-                
+                await save_task_files(
+                    session, task.id,
+                    build_file_records(task_id, downloaded_files, inference_result.get("manifest"))
+                )
+                sync = inference_result.get("sync")
+                status = await _finalize(
+                    session, task, timer, TaskStatus.COMPLETED,
+                    progress=100.0,
+                    result=json.dumps({"sync": sync}, ensure_ascii=False) if sync else None,
+                    inference_time=inference_result.get("inference_time")
+                )
+                if status == TaskStatus.COMPLETED:
+                    logger.info(f"任务完成: {task_id}, 下载了 {len(downloaded_files)} 个文件")
+                return status
+            
             except Exception as e:
                 # 推理失败
-                task.status = TaskStatus.FAILED
-                task.error_message = str(e)
-                task.completed_at = datetime.utcnow()
-                await session.commit()
-                logger.error(f"任务推理失败: {task_id}, 错误: {e}")
-                
+                await session.rollback()
+                await session.refresh(task)
+                status = await _finalize(session, task, timer, TaskStatus.FAILED, error_message=str(e))
+                if status == TaskStatus.FAILED:
+                    logger.error(f"任务推理失败: {task_id}, 错误: {e}")
+                return status
+        
         except Exception as e:
             logger.error(f"处理任务时发生异常: {task_id}, 错误: {e}")
             await session.rollback()
+            return TaskStatus.FAILED
+
+
+async def _cancel_running(task_id: str):
+    """终止正在处理的任务：远程推理进程被终止，Mock 模式或尚未分配主机时直接取消协程"""
+    running = _running.get(task_id)
+    if not running or running.cancelled:
+        return
+    running.cancelled = True
+    if running.service and not settings.MOCK_MODE:
+        await asyncio.to_thread(running.service.kill_remote, task_id)
+    elif running.future:
+        running.future.cancel()
+
+
+async def cancel_task(task_id: str) -> Tuple[bool, Optional[TaskStatus]]:
+    """
+    取消任务
+    
+    - deferred / pending: 直接标记为已取消，队列中的任务在出队时被跳过
+    - processing: 终止远程推理进程组后标记为已取消
+    
+    Returns:
+        (是否取消成功, 取消前的状态)，任务不存在时状态为 None
+    """
+    cancellable = (TaskStatus.DEFERRED, TaskStatus.PENDING, TaskStatus.PROCESSING)
+    async with async_session_factory() as session:
+        # 状态可能被 Worker 并发修改，按读取到的状态条件更新，失败时重新读取
+        for _ in range(len(cancellable)):
+            result = await session.execute(
+                select(Task.status).where(Task.task_id == task_id)
+            )
+            previous = result.scalar_one_or_none()
+            if previous is None or previous not in cancellable:
+                return False, previous
+            
+            updated = await session.execute(
+                update(Task)
+                .where(Task.task_id == task_id, Task.status == previous)
+                .values(status=TaskStatus.CANCELLED, completed_at=datetime.utcnow(), error_message="任务已取消")
+            )
+            await session.commit()
+            if updated.rowcount:
+                break
+        else:
+            return False, previous
+    
+    if previous == TaskStatus.DEFERRED:
+        admission_controller.cancel_deferred()
+    elif previous == TaskStatus.PENDING and task_queue.cancel(task_id):
+        admission_controller.notify_capacity()
+    else:
+        # 已被 Worker 取出（可能尚未更新为处理中）
+        await _cancel_running(task_id)
+    
+    logger.info(f"任务已取消: {task_id}, 原状态: {previous.value}")
+    return True, previous
@@ -1,9 +1,16 @@
 """任务队列服务 - 基于asyncio的轻量级任务队列"""
 import asyncio
-from typing import Callable, Any
+import time
+from collections import deque
+from typing import Callable, Any, Dict, List, Optional, Set, Tuple
 from loguru import logger
 
 from app.config import settings
+from app.models.task import TaskStatus
+
+
+# 过期任务的错误信息
+EXPIRED_MESSAGE = "任务已过期（超过期限仍未开始执行）"
 
 
 class TaskQueue:
@@ -13,9 +20,23 @@ class TaskQueue:
         self.max_size = max_size or settings.MAX_QUEUE_SIZE
         self.max_workers = max_workers or settings.MAX_WORKERS
         self._queue: asyncio.Queue = None
-        self._workers: list[asyncio.Task] = []
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._target_workers = self.max_workers  # 期望的工作协程数，可运行时调整
         self._running = False
         self._processor: Callable = None
+        self._active = 0  # 正在处理的任务数
+        self._started_at = 0.0
+        self._completions: deque = deque(maxlen=1000)  # 最近完成时间，用于估算吞吐量
+        # 上次采集以来的 (处理耗时, 是否成功)，由自适应并发采集；未开启时只保留最近的记录
+        self._outcomes: deque = deque(maxlen=1000)
+        self._queued_ids: Set[str] = set()  # 队列中的任务ID
+        self._cancelled: Set[str] = set()  # 已取消但仍在队列中的任务ID，出队时跳过
+        self._last_seen: Dict[str, float] = {}  # 队列中任务最近一次被查询的时间（用于判断客户端是否已放弃）
+        self._durations: deque = deque(maxlen=100)  # 最近成功任务的处理耗时，用于估算过期任务节省的时间
+        self._speculative: deque = deque()  # 推测任务（低优先级，队列为空时才执行）
+        self._speculative_running: Dict[str, None] = {}  # 正在执行的推测任务ID（按开始顺序）
+        self.expired_count = 0
+        self.deprioritized_count = 0
     
     async def start(self, processor: Callable):
         """启动任务队列"""
@@ -26,13 +47,12 @@ class TaskQueue:
         self._queue = asyncio.Queue(maxsize=self.max_size)
         self._processor = processor
         self._running = True
+        self._started_at = time.time()
         
         # 启动工作协程
-        for i in range(self.max_workers):
-            worker = asyncio.create_task(self._worker(i))
-            self._workers.append(worker)
+        self._spawn_workers()
         
-        logger.info(f"任务队列已启动，工作线程数: {self.max_workers}")
+        logger.info(f"任务队列已启动，工作线程数: {self._target_workers}")
     
     async def stop(self):
         """停止任务队列"""
@@ -42,47 +62,114 @@ class TaskQueue:
         self._running = False
         
         # 取消所有工作协程
-        for worker in self._workers:
+        workers = list(self._workers.values())
+        for worker in workers:
             worker.cancel()
         
         # 等待所有工作协程结束
-        await asyncio.gather(*self._workers, return_exceptions=True)
+        await asyncio.gather(*workers, return_exceptions=True)
         self._workers.clear()
         
         logger.info("任务队列已停止")
     
+    def _spawn_workers(self):
+        """补齐到期望数量的工作协程"""
+        for i in range(self._target_workers):
+            if i not in self._workers:
+                self._workers[i] = asyncio.create_task(self._worker(i))
+    
+    def resize(self, count: int):
+        """
+        调整工作协程数量
+        
+        扩容立即生效；缩容时编号超出的 Worker 在完成当前任务后退出，不会中断正在执行的任务
+        """
+        count = max(count, 1)
+        if count == self._target_workers:
+            return
+        logger.info(f"调整工作线程数: {self._target_workers} -> {count}")
+        self._target_workers = count
+        if self._running:
+            self._spawn_workers()
+    
     async def _worker(self, worker_id: int):
         """工作协程"""
         logger.info(f"Worker-{worker_id} 已启动")
         
-        while self._running:
-            try:
-                # 从队列获取任务，超时1秒
+        try:
+            while self._running and worker_id < self._target_workers:
                 try:
-                    task_data = await asyncio.wait_for(
-                        self._queue.get(),
-                        timeout=1.0
-                    )
-                except asyncio.TimeoutError:
-                    continue
-                
-                task_id = task_data.get("task_id", "unknown")
-                logger.info(f"Worker-{worker_id} 开始处理任务: {task_id}")
+                    # 已认领的推测任务优先执行；其他推测任务在队列为空时执行，否则从队列获取任务，超时1秒
+                    if self._speculative and (self._queue.empty() or self._speculative[0].get("claimed")):
+                        task_data = self._speculative.popleft()
+                    else:
+                        try:
+                            task_data = await asyncio.wait_for(
+                                self._queue.get(),
+                                timeout=1.0
+                            )
+                        except asyncio.TimeoutError:
+                            continue
+                    
+                    speculative = task_data.get("speculative", False)
+                    task_id = task_data.get("task_id", "unknown")
+                    if task_id in self._cancelled:
+                        self._queued_ids.discard(task_id)
+                        self._last_seen.pop(task_id, None)
+                        self._cancelled.discard(task_id)
+                        self._queue.task_done()
+                        logger.info(f"Worker-{worker_id} 跳过已取消任务: {task_id}")
+                        continue
+                    if not speculative and self._deprioritize(task_data):
+                        self._queue.task_done()
+                        logger.info(f"Worker-{worker_id} 任务长时间未被查询，移到队尾: {task_id}")
+                        continue
+                    self._queued_ids.discard(task_id)
+                    self._last_seen.pop(task_id, None)
+                    
+                    task_data["picked_up_at"] = time.time()
+                    if speculative and not task_data.get("claimed"):
+                        self._speculative_running[task_id] = None
+                    logger.info(f"Worker-{worker_id} 开始处理{'推测' if speculative else ''}任务: {task_id}")
+                    
+                    self._active += 1
+                    status = None
+                    try:
+                        # 执行任务处理（task_id/worker_id 通过 contextvars 绑定到该任务内的所有日志）
+                        with logger.contextualize(task_id=task_id, worker_id=worker_id):
+                            status = await self._processor(task_data)
+                        logger.info(f"Worker-{worker_id} 完成任务: {task_id}")
+                    except Exception as e:
+                        logger.error(f"Worker-{worker_id} 处理任务失败: {task_id}, 错误: {e}")
+                    finally:
+                        self._active -= 1
+                        self._speculative_running.pop(task_id, None)
+                        now = time.time()
+                        duration = now - task_data["picked_up_at"]
+                        if status == TaskStatus.EXPIRED:
+                            # 过期任务没有执行推理，不计入吞吐量与自适应并发的统计
+                            self.record_expired()
+                        else:
+                            self._completions.append(now)
+                            if status != TaskStatus.CANCELLED:
+                                # 被取消的任务不反映推理主机的负载，不计入自适应并发的信号
+                                self._outcomes.append((duration, status == TaskStatus.COMPLETED))
+                            if status == TaskStatus.COMPLETED:
+                                self._durations.append(duration)
+                        if not speculative:
+                            self._queue.task_done()
                 
-                try:
-                    # 执行任务处理
-                    await self._processor(task_data)
-                    logger.info(f"Worker-{worker_id} 完成任务: {task_id}")
+                except asyncio.CancelledError:
+                    logger.info(f"Worker-{worker_id} 被取消")
+                    break
                 except Exception as e:
-                    logger.error(f"Worker-{worker_id} 处理任务失败: {task_id}, 错误: {e}")
-                finally:
-                    self._queue.task_done()
-                    
-            except asyncio.CancelledError:
-                logger.info(f"Worker-{worker_id} 被取消")
-                break
-            except Exception as e:
-                logger.error(f"Worker-{worker_id} 发生异常: {e}")
+                    logger.error(f"Worker-{worker_id} 发生异常: {e}")
+        finally:
+            if self._workers.get(worker_id) is asyncio.current_task():
+                del self._workers[worker_id]
+        
+        if self._running:
+            logger.info(f"Worker-{worker_id} 已退出（缩容）")
     
     async def enqueue(self, task_data: dict) -> bool:
         """将任务加入队列"""
@@ -92,19 +179,167 @@ class TaskQueue:
         
         try:
             # 非阻塞方式入队
+            task_data.setdefault("queued_at", time.time())
             self._queue.put_nowait(task_data)
             task_id = task_data.get("task_id", "unknown")
+            self._queued_ids.add(task_id)
             logger.info(f"任务已入队: {task_id}, 队列大小: {self._queue.qsize()}")
             return True
         except asyncio.QueueFull:
             logger.warning("任务队列已满，无法添加新任务")
             return False
     
+    def enqueue_speculative(self, task_data: dict):
+        """加入推测任务（不占用队列容量，只在队列为空时由空闲 Worker 执行）"""
+        task_data["speculative"] = True
+        task_data.setdefault("queued_at", time.time())
+        self._speculative.append(task_data)
+    
+    def promote(self, task_id: str, enqueue: bool) -> bool:
+        """
+        推测任务被客户端认领后按真实任务处理，执行中的不再被抢占
+        
+        未开始的任务在 enqueue 为 True（调用方已通过准入控制预留位置）时移入队列，否则标记为已认领并移到推测队列最前，
+        由下一个空闲 Worker 先于队列中的任务执行
+        
+        Returns:
+            是否移入了队列
+        """
+        self._speculative_running.pop(task_id, None)
+        for task_data in self._speculative:
+            if task_data["task_id"] != task_id:
+                continue
+            self._speculative.remove(task_data)
+            if enqueue:
+                try:
+                    self._queue.put_nowait({**task_data, "speculative": False})
+                    self._queued_ids.add(task_id)
+                    return True
+                except asyncio.QueueFull:
+                    pass
+            task_data["claimed"] = True
+            self._speculative.appendleft(task_data)
+            return False
+        return False
+    
+    def preemption_candidate(self) -> Optional[str]:
+        """
+        没有空闲 Worker 且有任务在排队时，返回一个应让出 Worker 的推测任务（最近开始执行的，已投入的时间最少）
+        """
+        if not self._speculative_running or self.waiting_count == 0 or self._active < self._target_workers:
+            return None
+        task_id, _ = self._speculative_running.popitem()
+        return task_id
+    
+    def _deprioritize(self, task_data: dict) -> bool:
+        """
+        客户端超过 TASK_ABANDON_AFTER 秒没有查询的任务移到队尾（每个任务一次，队列中没有其他任务时不移动）
+        
+        Returns:
+            是否已移到队尾
+        """
+        if settings.TASK_ABANDON_AFTER <= 0 or task_data.get("deprioritized") or self._queue.empty():
+            return False
+        task_id = task_data.get("task_id")
+        last_seen = self._last_seen.get(task_id, task_data.get("queued_at", time.time()))
+        if time.time() - last_seen <= settings.TASK_ABANDON_AFTER:
+            return False
+        task_data["deprioritized"] = True
+        self._queue.put_nowait(task_data)  # 刚取出一个任务，不会超出容量
+        self.deprioritized_count += 1
+        return True
+    
+    def touch(self, task_id: str):
+        """记录任务被查询（状态、日志或结果），只跟踪仍在队列中的任务"""
+        if task_id in self._queued_ids:
+            self._last_seen[task_id] = time.time()
+    
+    def record_expired(self, count: int = 1):
+        """记录过期跳过的任务数（出队时过期，或 deferred 任务回填时过期）"""
+        self.expired_count += count
+    
+    def cancel(self, task_id: str) -> bool:
+        """
+        取消队列中的任务（O(1)，不遍历队列）
+        
+        任务仅被标记，Worker 出队时直接跳过；任务已被 Worker 取出时返回 False
+        """
+        if task_id not in self._queued_ids or task_id in self._cancelled:
+            return False
+        self._cancelled.add(task_id)
+        logger.info(f"任务已从队列取消: {task_id}")
+        return True
+    
+    def collect_outcomes(self) -> List[Tuple[float, bool]]:
+        """取出上次采集以来完成任务的 (处理耗时, 是否成功) 列表"""
+        outcomes = list(self._outcomes)
+        self._outcomes.clear()
+        return outcomes
+    
     @property
     def queue_size(self) -> int:
-        """获取当前队列大小"""
+        """
+        队列占用的位置数（含已取消、尚未被 Worker 取出的任务）
+        
+        已取消的任务在出队前仍占用队列容量，准入控制与推测执行按该值判断剩余容量
+        """
         return self._queue.qsize() if self._queue else 0
     
+    @property
+    def waiting_count(self) -> int:
+        """等待执行的任务数（不含已取消的任务）"""
+        return self.queue_size - len(self._cancelled)
+    
+    @property
+    def speculative_size(self) -> int:
+        """获取等待执行的推测任务数"""
+        return len(self._speculative)
+    
+    @property
+    def active_count(self) -> int:
+        """获取正在处理的任务数"""
+        return self._active
+    
+    @property
+    def worker_count(self) -> int:
+        """获取当前存活的工作协程数"""
+        return len(self._workers)
+    
+    @property
+    def target_workers(self) -> int:
+        """获取期望的工作协程数"""
+        return self._target_workers
+    
+    def throughput(self, window: float) -> float:
+        """
+        估算最近 window 秒内的吞吐量
+        
+        Returns:
+            每秒完成的任务数，窗口内无完成记录时返回 0
+        """
+        now = time.time()
+        recent = sum(1 for ts in self._completions if now - ts <= window)
+        if not recent:
+            return 0.0
+        # 启动时间不足一个窗口时按实际运行时长计算
+        span = max(min(window, now - self._started_at), 1.0)
+        return recent / span
+    
+    @property
+    def stats(self) -> dict:
+        """队列统计（过期与移到队尾的任务数、按最近平均处理耗时估算的过期任务节省的执行时间）"""
+        mean_duration = sum(self._durations) / len(self._durations) if self._durations else 0.0
+        return {
+            "size": self.queue_size,
+            "waiting": self.waiting_count,
+            "active": self._active,
+            "expired_total": self.expired_count,
+            "deprioritized_total": self.deprioritized_count,
+            "reclaimed_seconds": round(self.expired_count * mean_duration, 1),
+            "speculative": len(self._speculative),
+            "speculative_active": len(self._speculative_running),
+        }
+    
     @property
     def is_running(self) -> bool:
         """检查队列是否在运行"""
@@ -1,51 +1,268 @@
 """日志配置"""
+import atexit
+import json
+import os
+import queue
 import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
 from loguru import logger
 
 from app.config import settings
 
 
+# 队列满时不丢弃的最低日志级别（ERROR），这类日志阻塞等待入队
+KEEP_LEVEL_NO = 40
+
+
+class _DailyFile:
+    """
+    按日期命名的追加写文件（{prefix}_YYYY-MM-DD.log）
+
+    每条日志以一次 O_APPEND 的 os.write 写出，多个 gunicorn worker 进程
+    写同一文件时行不会交错；按日期换文件而非重命名轮转，因此也不存在
+    多进程同时轮转的冲突。
+    """
+
+    def __init__(self, directory: Path, prefix: str, retention_days: int = 30):
+        self._directory = Path(directory)
+        self._prefix = prefix
+        self._retention_days = retention_days
+        self._date = None
+        self._fd = None
+
+    def write(self, message: str):
+        date = time.strftime("%Y-%m-%d")
+        if date != self._date:
+            self._open(date)
+        os.write(self._fd, message.encode("utf-8"))
+
+    def _open(self, date: str):
+        self.close()
+        path = self._directory / f"{self._prefix}_{date}.log"
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._date = date
+        self._cleanup()
+
+    def _cleanup(self):
+        """删除超过保留天数的旧日志"""
+        cutoff = time.time() - self._retention_days * 86400
+        for path in self._directory.glob(f"{self._prefix}_*.log"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _StreamTarget:
+    """控制台输出目标"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, message: str):
+        self._stream.write(message)
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+
+
+class QueuedSink:
+    """
+    队列化 sink：调用线程只做格式化与一次非阻塞入队，由后台线程写出
+
+    队列有界，写出跟不上时丢弃新日志并计数，保证日志调用不会因磁盘抖动而阻塞事件循环；
+    ERROR 及以上的日志不丢弃，队列满时等待入队。
+    """
+
+    def __init__(self, target, max_size: int):
+        self._target = target
+        self._max_size = max_size
+        self.dropped = 0
+        self._stopped = False
+        self._start()
+
+    def restart_in_child(self):
+        if not self._stopped:
+            self._start()
+
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self._max_size)
+        self._thread = threading.Thread(target=self._drain, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            record = getattr(message, "record", None)
+            if record is not None and record["level"].no >= KEEP_LEVEL_NO:
+                self._queue.put(message)
+            else:
+                self.dropped += 1
+
+    def _drain(self):
+        reported = 0
+        while True:
+            message = self._queue.get()
+            if message is None:
+                break
+            batch = [message]
+            # 批量取出已积压的日志，减少 flush 次数
+            while len(batch) < 512:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    self._write_batch(batch)
+                    return
+                batch.append(message)
+            if self.dropped != reported:
+                batch.append(f"[logger] 日志队列已满，累计丢弃 {self.dropped} 条\n")
+                reported = self.dropped
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[str]):
+        try:
+            for message in batch:
+                self._target.write(message)
+            self._target.flush()
+        except Exception as e:
+            sys.stderr.write(f"日志写出失败: {e}\n")
+
+    def stop(self, timeout: float = 5.0):
+        """写完队列中剩余日志并停止后台线程（loguru 移除 handler 时也会调用）"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._target.close()
+
+
+# 当前生效的队列化 sink
+_queued_sinks: List[QueuedSink] = []
+
+
+def _restart_sinks_in_child():
+    """fork 后子进程中后台线程不存在，需要重新启动"""
+    for sink in _queued_sinks:
+        sink.restart_in_child()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_sinks_in_child)
+
+
+def _json_formatter(record) -> str:
+    """JSON 结构化格式：每条日志一行，extra 中的绑定字段（task_id、worker_id 等）平铺输出"""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "process": record["process"].id,
+        "message": record["message"],
+    }
+    for key, value in record["extra"].items():
+        if not key.startswith("_"):
+            payload[key] = value
+    if record["exception"]:
+        payload["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+def _level_filter(default_level: str) -> dict:
+    """构建按模块的日志级别过滤（loguru 以模块名前缀匹配）"""
+    levels = {"": default_level}
+    levels.update(settings.LOG_MODULE_LEVELS)
+    return levels
+
+
+def _sink(target):
+    """异步模式下用队列包装输出目标"""
+    if not settings.LOG_ASYNC:
+        return target
+    sink = QueuedSink(target, settings.LOG_QUEUE_SIZE)
+    _queued_sinks.append(sink)
+    return sink
+
+
+def shutdown_logger():
+    """停止后台写出线程，确保队列中的日志全部落盘"""
+    while _queued_sinks:
+        _queued_sinks.pop().stop()
+
+
+def dropped_log_count() -> int:
+    """队列满时丢弃的日志条数"""
+    return sum(sink.dropped for sink in _queued_sinks)
+
+
 def setup_logger():
     """配置日志"""
     # 移除默认处理器
     logger.remove()
-    
+    shutdown_logger()
+
     # 日志格式
-    log_format = (
-        "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
-        "<level>{level: <8}</level> | "
-        "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
-        "<level>{message}</level>"
-    )
-    
+    if settings.LOG_JSON:
+        log_format = _json_formatter
+    else:
+        log_format = (
+            "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | "
+            "<level>{level: <8}</level> | "
+            "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> | "
+            "<level>{message}</level>"
+        )
+
+    console_level = settings.LOG_LEVEL or ("DEBUG" if settings.DEBUG else "INFO")
+
     # 控制台输出
     logger.add(
-        sys.stdout,
+        _sink(_StreamTarget(sys.stdout)),
         format=log_format,
-        level="DEBUG" if settings.DEBUG else "INFO",
-        colorize=True
+        level=console_level,
+        filter=_level_filter(console_level),
+        colorize=not settings.LOG_JSON
     )
-    
-    # 文件输出 - 一般日志
+
+    # 文件输出 - 一般日志（按日期分文件，保留30天）
     logger.add(
-        settings.LOGS_DIR / "app_{time:YYYY-MM-DD}.log",
+        _sink(_DailyFile(settings.LOGS_DIR, "app")),
         format=log_format,
         level="INFO",
-        rotation="00:00",  # 每天轮转
-        retention="30 days",  # 保留30天
-        compression="zip",
-        encoding="utf-8"
+        filter=_level_filter("INFO"),
+        colorize=False
     )
-    
+
     # 文件输出 - 错误日志
     logger.add(
-        settings.LOGS_DIR / "error_{time:YYYY-MM-DD}.log",
+        _sink(_DailyFile(settings.LOGS_DIR, "error")),
         format=log_format,
         level="ERROR",
-        rotation="00:00",
-        retention="30 days",
-        compression="zip",
-        encoding="utf-8"
+        colorize=False
     )
-    
+
     logger.info("日志系统初始化完成")
+
+
+atexit.register(shutdown_logger)
@@ -0,0 +1,393 @@
+"""
+推理 API 端到端压测
+
+在子进程中以 MOCK_MODE + 临时 SQLite 数据库启动应用（uvicorn，单进程），用异步客户端按配置的流量组合
+持续请求，统计各路由的吞吐、p50/p95/p99 延迟与请求期间的服务端事件循环延迟:
+- 提交:   POST /api/inference，按 --submit-rate 开环发送（泊松到达，不因响应变慢而降低压力）
+- 轮询:   GET /api/task/{id}/status，--pollers 个并发用户轮询最近提交的任务
+- 列表:   GET /api/tasks，--listers 个并发用户
+- 下载:   GET /api/task/{id}/result + /file/{path}，--downloaders 个并发用户下载已完成任务的结果
+
+事件循环延迟由服务端进程内的探针每 --lag-interval 秒采样一次，请求期间的最大采样值计入该请求所属路由。
+
+--save 保存结果作为基线，--compare 与基线对比，p95 延迟或吞吐劣化超过 --tolerance 时以非零状态退出，
+便于在 CI 中作为回归门槛。
+
+依赖 httpx（不在应用依赖中）: pip install -r benchmarks/requirements.txt
+
+用法:
+    python -m benchmarks.load_test --duration 30 --pollers 20 --submit-rate 4
+    python -m benchmarks.load_test --save benchmarks/baseline.json
+    python -m benchmarks.load_test --compare benchmarks/baseline.json --tolerance 0.2
+    python -m benchmarks.load_test --env MAX_WORKERS=4 --env MOCK_LATENCY=lognormal:1:0.5
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ROUTE_SUBMIT = "POST /api/inference"
+ROUTE_STATUS = "GET /api/task/{id}/status"
+ROUTE_LIST = "GET /api/tasks"
+ROUTE_RESULT = "GET /api/task/{id}/result"
+ROUTE_FILE = "GET /api/task/{id}/file/{path}"
+
+# 应用拒绝请求（队列已满、限流）的状态码，单独统计，不计为错误
+REJECT_STATUS = (429, 503)
+# 与基线对比时忽略的延迟绝对变化（毫秒），避免亚毫秒级抖动触发回归
+LATENCY_NOISE_MS = 1.0
+
+
+def _percentile(samples: list, q: float) -> float:
+    """已排序样本的分位数"""
+    if not samples:
+        return 0.0
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+# ---------------------------------------------------------------- 服务端子进程
+
+async def _serve(port: int, lag_file: str, interval: float):
+    """启动应用并采样事件循环延迟，退出时写入 lag_file"""
+    import uvicorn
+    from app.main import app
+
+    samples = []
+
+    async def probe():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            samples.append((time.time(), time.perf_counter() - start - interval))
+
+    task = asyncio.create_task(probe())
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    )
+    try:
+        await server.serve()
+    finally:
+        task.cancel()
+        Path(lag_file).write_text(json.dumps(samples))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(work_dir: Path, port: int, args) -> subprocess.Popen:
+    """以 MOCK_MODE 与临时数据库启动服务端子进程"""
+    env = dict(os.environ)
+    env.update(
+        MOCK_MODE="true",
+        LOCAL_MODE="false",
+        DEBUG="false",
+        DATABASE_URL=f"sqlite+aiosqlite:///{work_dir}/bench.db",
+        RESULTS_DIR=str(work_dir / "results"),
+        LOGS_DIR=str(work_dir / "logs"),
+        LOG_LEVEL="WARNING",
+        MAX_WORKERS=str(args.workers),
+        MAX_QUEUE_SIZE=str(args.queue_size),
+        MOCK_LATENCY=args.mock_latency,
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = open(work_dir / "server.log", "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(port),
+         "--lag-file", str(work_dir / "lag.json"), "--lag-interval", str(args.lag_interval)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+# ---------------------------------------------------------------- 客户端
+
+class Recorder:
+    """记录每个请求的起止时间与状态码"""
+
+    def __init__(self):
+        self.requests = defaultdict(list)  # 路由 -> [(开始, 结束, 状态码)]
+        self.recording = False
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs):
+        start = time.time()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, 0
+        if self.recording:
+            self.requests[route].append((start, time.time(), status))
+        return response
+
+
+class TrafficState:
+    """虚拟用户之间共享的任务状态"""
+
+    def __init__(self):
+        self.submitted = []
+        self.completed = []
+        self.finished = set()
+        self.files = {}  # task_id -> 结果文件 URL 列表
+
+
+async def _submitter(client, recorder: Recorder, state: TrafficState, rate: float, stop: asyncio.Event):
+    """开环提交：按泊松到达发送，每个请求独立执行"""
+    pending = set()
+    while not stop.is_set() and rate > 0:
+        await asyncio.sleep(random.expovariate(rate))
+        pending.add(asyncio.create_task(_submit_once(client, recorder, state)))
+        pending = {task for task in pending if not task.done()}
+    if pending:
+        await asyncio.wait(pending)
+
+
+async def _submit_once(client, recorder: Recorder, state: TrafficState):
+    response = await recorder.request(
+        client, ROUTE_SUBMIT, "POST", "/api/inference",
+        params={"index": random.randint(1, 100), "subfolder": f"{random.randint(0, 999):05d}"}
+    )
+    if response is not None and response.status_code == 200:
+        state.submitted.append(response.json()["task_id"])
+
+
+async def _poller(client, recorder: Recorder, state: TrafficState, think: float, stop: asyncio.Event):
+    while not stop.is_set():
+        active = [task_id for task_id in state.submitted[-200:] if task_id not in state.finished]
+        if active:
+            task_id = random.choice(active)
+            response = await recorder.request(client, ROUTE_STATUS, "GET", f"/api/task/{task_id}/status")
+            if response is not None and response.status_code == 200:
+                status = response.json()["status"]
+                if status in ("completed", "failed", "cancelled", "expired") and task_id not in state.finished:
+                    state.finished.add(task_id)
+                    if status == "completed":
+                        state.completed.append(task_id)
+        await asyncio.sleep(think)
+
+
+async def _lister(client, recorder: Recorder, page_size: int, think: float, stop: asyncio.Event):
+    while not stop.is_set():
+        await recorder.request(client, ROUTE_LIST, "GET", "/api/tasks", params={"page_size": page_size})
+        await asyncio.sleep(think)
+
+
+async def _downloader(client, recorder: Recorder, state: TrafficState, think: float, stop: asyncio.Event):
+    while not stop.is_set():
+        if state.completed:
+            task_id = random.choice(state.completed[-200:])
+            urls = state.files.get(task_id)
+            if urls is None:
+                response = await recorder.request(client, ROUTE_RESULT, "GET", f"/api/task/{task_id}/result")
+                if response is not None and response.status_code == 200:
+                    urls = state.files[task_id] = [item["url"] for item in response.json()["files"]]
+            if urls:
+                await recorder.request(client, ROUTE_FILE, "GET", random.choice(urls))
+        await asyncio.sleep(think)
+
+
+async def _wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("服务端启动失败，见 server.log")
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("等待服务端启动超时")
+
+
+async def _drive(base_url: str, server: subprocess.Popen, args) -> tuple:
+    """预热后按配置的流量组合运行 --duration 秒，返回 (记录, 任务状态, 测量起止)"""
+    recorder = Recorder()
+    state = TrafficState()
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        await _wait_ready(client, server)
+        users = [asyncio.create_task(_submitter(client, recorder, state, args.submit_rate, stop))]
+        users += [asyncio.create_task(_poller(client, recorder, state, args.think, stop)) for _ in range(args.pollers)]
+        users += [asyncio.create_task(_lister(client, recorder, args.page_size, args.think, stop))
+                  for _ in range(args.listers)]
+        users += [asyncio.create_task(_downloader(client, recorder, state, args.think, stop))
+                  for _ in range(args.downloaders)]
+
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        window_start = time.time()
+        await asyncio.sleep(args.duration)
+        window_end = time.time()
+        recorder.recording = False
+        stop.set()
+        await asyncio.gather(*users)
+    return recorder, state, (window_start, window_end)
+
+
+# ---------------------------------------------------------------- 报告
+
+def _build_report(recorder: Recorder, state: TrafficState, window: tuple, lag_samples: list, args) -> dict:
+    window_start, window_end = window
+    elapsed = window_end - window_start
+    lag_samples = sorted(s for s in lag_samples if window_start <= s[0] <= window_end + args.lag_interval)
+    lag_times = [t for t, _ in lag_samples]
+
+    def lag_during(start: float, end: float) -> float:
+        """请求期间（含结束后一个采样周期）的最大事件循环延迟"""
+        lo = bisect.bisect_left(lag_times, start)
+        hi = bisect.bisect_right(lag_times, end + args.lag_interval)
+        return max((lag for _, lag in lag_samples[lo:hi]), default=0.0)
+
+    routes = {}
+    for route, items in sorted(recorder.requests.items()):
+        ok = sorted((end - start) * 1000 for start, end, status in items if 200 <= status < 400)
+        lags = sorted(lag_during(start, end) * 1000 for start, end, _ in items)
+        routes[route] = {
+            "count": len(items),
+            "rps": len(ok) / elapsed,
+            "p50_ms": _percentile(ok, 0.50),
+            "p95_ms": _percentile(ok, 0.95),
+            "p99_ms": _percentile(ok, 0.99),
+            "errors": sum(1 for _, _, status in items if status == 0 or status >= 400 and status not in REJECT_STATUS),
+            "rejected": sum(1 for _, _, status in items if status in REJECT_STATUS),
+            "loop_lag_p99_ms": _percentile(lags, 0.99),
+        }
+
+    lags = sorted(lag * 1000 for _, lag in lag_samples)
+    return {
+        "config": {
+            key: getattr(args, key) for key in (
+                "duration", "submit_rate", "pollers", "listers", "downloaders", "think",
+                "page_size", "workers", "queue_size", "mock_latency", "env",
+            )
+        },
+        "routes": routes,
+        "loop_lag": {
+            "p50_ms": _percentile(lags, 0.50),
+            "p99_ms": _percentile(lags, 0.99),
+            "max_ms": lags[-1] if lags else 0.0,
+        },
+        "tasks": {
+            "submitted": len(state.submitted),
+            "completed": len(state.completed),
+            "completed_per_s": len(state.completed) / elapsed,
+        },
+    }
+
+
+def _print_report(report: dict):
+    print(f"{'route':<32}{'count':>8}{'rps':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"
+          f"{'errors':>8}{'rejected':>10}{'lag p99(ms)':>13}")
+    for route, row in report["routes"].items():
+        print(f"{route:<32}{row['count']:>8}{row['rps']:>9.1f}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['errors']:>8}{row['rejected']:>10}{row['loop_lag_p99_ms']:>13.2f}")
+    loop = report["loop_lag"]
+    tasks = report["tasks"]
+    print(f"事件循环延迟: p50 {loop['p50_ms']:.2f}ms，p99 {loop['p99_ms']:.2f}ms，最大 {loop['max_ms']:.2f}ms")
+    print(f"任务: 提交 {tasks['submitted']}，完成 {tasks['completed']}（{tasks['completed_per_s']:.2f}/s）")
+
+
+def _compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """与基线对比，返回劣化项说明"""
+    regressions = []
+    for route, base in baseline.get("routes", {}).items():
+        row = report["routes"].get(route)
+        if row is None:
+            regressions.append(f"{route}: 本次没有请求")
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + tolerance) and row["p95_ms"] - base["p95_ms"] > LATENCY_NOISE_MS:
+            regressions.append(f"{route}: p95 {base['p95_ms']:.2f}ms -> {row['p95_ms']:.2f}ms")
+        if row["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: 吞吐 {base['rps']:.1f}/s -> {row['rps']:.1f}/s")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{route}: 错误 {base['errors']} -> {row['errors']}")
+    base_lag = baseline.get("loop_lag", {}).get("p99_ms", 0.0)
+    lag = report["loop_lag"]["p99_ms"]
+    if lag > base_lag * (1 + tolerance) and lag - base_lag > LATENCY_NOISE_MS:
+        regressions.append(f"事件循环延迟 p99 {base_lag:.2f}ms -> {lag:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=30, help="测量时长（秒）")
+    parser.add_argument("--warmup", type=float, default=5, help="预热时长（秒），不计入统计")
+    parser.add_argument("--submit-rate", type=float, default=2.0, help="每秒提交任务数（开环）")
+    parser.add_argument("--pollers", type=int, default=20, help="轮询状态的并发用户数")
+    parser.add_argument("--listers", type=int, default=2, help="查询任务列表的并发用户数")
+    parser.add_argument("--downloaders", type=int, default=4, help="下载结果文件的并发用户数")
+    parser.add_argument("--think", type=float, default=0.05, help="闭环用户两次请求之间的间隔（秒）")
+    parser.add_argument("--page-size", type=int, default=20, help="任务列表每页数量")
+    parser.add_argument("--workers", type=int, default=2, help="服务端 MAX_WORKERS")
+    parser.add_argument("--queue-size", type=int, default=100, help="服务端 MAX_QUEUE_SIZE")
+    parser.add_argument("--mock-latency", default="uniform:0.5:1.5", help="服务端 MOCK_LATENCY")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="服务端额外配置，可重复")
+    parser.add_argument("--request-timeout", type=float, default=30, help="单个请求超时（秒）")
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="事件循环延迟采样间隔（秒）")
+    parser.add_argument("--save", metavar="PATH", help="保存结果为基线")
+    parser.add_argument("--compare", metavar="PATH", help="与基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="对比时允许的劣化比例")
+    # 子进程模式（内部使用）
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--lag-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(_serve(args.port, args.lag_file, args.lag_interval))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as tmp:
+        work_dir = Path(tmp)
+        port = _free_port()
+        server = _start_server(work_dir, port, args)
+        try:
+            recorder, state, window = asyncio.run(_drive(f"http://127.0.0.1:{port}", server, args))
+        except RuntimeError:
+            print((work_dir / "server.log").read_text()[-3000:])
+            raise
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        lag_file = work_dir / "lag.json"
+        lag_samples = json.loads(lag_file.read_text()) if lag_file.exists() else []
+
+    report = _build_report(recorder, state, window, lag_samples, args)
+    _print_report(report)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        print(f"已保存基线: {args.save}")
+    if args.compare:
+        regressions = _compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print(f"相对基线劣化（容差 {args.tolerance:.0%}）:")
+            for item in regressions:
+                print(f"  {item}")
+            sys.exit(1)
+        print("与基线相比无明显劣化")
+
+
+if __name__ == "__main__":
+    main()
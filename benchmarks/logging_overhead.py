@@ -0,0 +1,120 @@
+"""
+日志调用开销微基准
+
+测量单次 logger.info 在调用线程（即事件循环线程）上的耗时，对比:
+- sync_*:    同步写出（LOG_ASYNC=false）
+- queued_*:  队列化写出（LOG_ASYNC=true，默认）
+- *_slow:    模拟磁盘抖动，每次写入阻塞 --stall-ms
+- filtered:  被级别过滤掉的 debug 调用
+
+队列化后调用方开销应与 sink 写入延迟无关；--max-us 可设置队列化用例 p99 上限，
+超出时以非零状态退出，便于在 CI 中作为回归门槛。
+
+用法:
+    python -m benchmarks.logging_overhead --calls 20000 --max-us 200
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.logger import QueuedSink, _DailyFile, _json_formatter  # noqa: E402
+
+
+TEXT_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} | {message}"
+
+
+class _SlowTarget(_DailyFile):
+    """模拟写入缓慢的磁盘"""
+
+    def __init__(self, directory: Path, prefix: str, stall_ms: float):
+        super().__init__(directory, prefix)
+        self._stall = stall_ms / 1000
+
+    def write(self, message: str):
+        time.sleep(self._stall)
+        super().write(message)
+
+
+def _measure(calls: int, log_call) -> list:
+    """逐次计时，返回每次调用的耗时（微秒）"""
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        log_call(i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _run_case(name: str, calls: int, sink, log_call, log_format=TEXT_FORMAT, level="DEBUG") -> dict:
+    logger.remove()
+    logger.add(sink, format=log_format, level=level, colorize=False)
+    _measure(min(calls, 500), log_call)  # 预热
+    samples = _measure(calls, log_call)
+    dropped = getattr(sink, "dropped", 0)
+    logger.remove()
+    samples.sort()
+    return {
+        "case": name,
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p99_us": samples[int(len(samples) * 0.99) - 1],
+        "dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="日志调用开销微基准")
+    parser.add_argument("--calls", type=int, default=20000, help="每种配置的调用次数")
+    parser.add_argument("--stall-ms", type=float, default=2.0, help="慢磁盘用例每次写入的阻塞时间（毫秒）")
+    parser.add_argument("--queue-size", type=int, default=10000, help="队列容量（对应 LOG_QUEUE_SIZE）")
+    parser.add_argument("--max-us", type=float, default=0, help="队列化用例 p99 上限（微秒）")
+    args = parser.parse_args()
+
+    def info_call(i):
+        logger.info("任务已入队: {}, 队列大小: {}", "bench-task", i)
+
+    def bound_call(i):
+        with logger.contextualize(task_id="bench-task", worker_id=0):
+            logger.info("Worker-{} 开始处理任务: {}", 0, i)
+
+    def filtered_call(i):
+        logger.debug("被过滤的调试日志 {}", i)
+
+    # 慢磁盘用例调用次数较少，避免同步用例运行过久
+    slow_calls = min(args.calls, 1000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_dir = Path(tmp)
+        results = [
+            _run_case("sync_file", args.calls, _DailyFile(log_dir, "sync"), info_call),
+            _run_case("queued_file", args.calls, QueuedSink(_DailyFile(log_dir, "queued"), args.queue_size), info_call),
+            _run_case("queued_json", args.calls, QueuedSink(_DailyFile(log_dir, "json"), args.queue_size),
+                      bound_call, log_format=_json_formatter),
+            _run_case("filtered", args.calls, QueuedSink(_DailyFile(log_dir, "filtered"), args.queue_size),
+                      filtered_call, level="INFO"),
+            _run_case("sync_slow", slow_calls, _SlowTarget(log_dir, "sync_slow", args.stall_ms), info_call),
+            _run_case("queued_slow", slow_calls,
+                      QueuedSink(_SlowTarget(log_dir, "queued_slow", args.stall_ms), args.queue_size), info_call),
+        ]
+
+    print(f"{'case':<14}{'mean(us)':>10}{'p50(us)':>10}{'p99(us)':>10}{'dropped':>9}")
+    for row in results:
+        print(f"{row['case']:<14}{row['mean_us']:>10.2f}{row['p50_us']:>10.2f}"
+              f"{row['p99_us']:>10.2f}{row['dropped']:>9}")
+
+    if args.max_us:
+        over = [r["case"] for r in results if r["case"].startswith("queued") and r["p99_us"] > args.max_us]
+        if over:
+            print(f"超出上限 {args.max_us}us: {over}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
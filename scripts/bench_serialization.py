@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+API 响应序列化耗时对比：dict + jsonable_encoder + json（旧） vs Pydantic 响应模型 + orjson（新）
+
+使用 FastAPI 自身的 serialize_response 与响应类，只测序列化部分（不含数据库与 HTTP）。
+
+用法:
+    python scripts/bench_serialization.py --files 200 --page-size 100
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from app.api.schemas import (  # noqa: E402
+    ResultFile, TaskListResponse, TaskResultResponse, TaskStatusResponse, TaskSummary
+)
+from app.models.task import TaskStatus  # noqa: E402
+from app.services.result_index import media_kind  # noqa: E402
+
+
+LOCAL_RESULT_DIR = "/home/xcsz/aaai2025/work_dirs/lcs/demo/test/vis"
+NOW = datetime(2026, 1, 22, 13, 30, 0, 123456)
+
+
+def _task(i: int):
+    return SimpleNamespace(
+        task_id=f"{i:08d}-0000-4000-8000-000000000000", index=i, status=TaskStatus.COMPLETED, progress=100.0,
+        created_at=NOW, completed_at=NOW + timedelta(seconds=30), inference_time=30.5, error_message=None,
+    )
+
+
+def _file_type(name: str) -> str:
+    """旧版按扩展名列表判断文件类型"""
+    ext = Path(name).suffix.lower()
+    return "image" if ext in [".jpg", ".jpeg", ".png", ".bmp", ".gif"] else "video" if ext in [".mp4", ".avi", ".mov"] else "other"
+
+
+def old_task_list(tasks):
+    return {
+        "total": 100000, "page": 1, "page_size": len(tasks),
+        "tasks": [
+            {
+                "task_id": t.task_id, "index": t.index, "status": t.status,
+                "created_at": t.created_at.isoformat(),
+                "completed_at": t.completed_at.isoformat() if t.completed_at else None,
+            }
+            for t in tasks
+        ],
+    }
+
+
+def new_task_list(tasks):
+    return TaskListResponse(
+        total=100000, page=1, page_size=len(tasks),
+        tasks=[
+            TaskSummary(task_id=t.task_id, index=t.index, status=t.status,
+                        created_at=t.created_at, completed_at=t.completed_at)
+            for t in tasks
+        ],
+    )
+
+
+def old_result(task, paths):
+    files = []
+    for file_path in paths:
+        relative_path = file_path.replace(LOCAL_RESULT_DIR + "/", "")
+        files.append({
+            "filename": Path(file_path).name, "type": _file_type(file_path), "path": file_path,
+            "url": f"/api/task/{task.task_id}/file/{relative_path}",
+        })
+    return {
+        "task_id": task.task_id, "index": task.index, "status": task.status,
+        "inference_time": task.inference_time, "created_at": task.created_at.isoformat(),
+        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+        "files": files, "local_mode": True,
+    }
+
+
+def new_result(task, entries):
+    root = f"{LOCAL_RESULT_DIR}/"
+    return TaskResultResponse(
+        task_id=task.task_id, index=task.index, status=task.status, inference_time=task.inference_time,
+        created_at=task.created_at, completed_at=task.completed_at,
+        files=[
+            ResultFile(filename=e["name"], type=e["media_type"], size=e["size"],
+                       url=f"/api/task/{task.task_id}/file/{e['path']}", path=root + e["path"])
+            for e in entries
+        ],
+        local_mode=True,
+    )
+
+
+def old_status(task):
+    return {
+        "task_id": task.task_id, "index": task.index, "status": task.status, "progress": task.progress,
+        "created_at": task.created_at.isoformat(),
+        "completed_at": task.completed_at.isoformat() if task.completed_at else None,
+        "inference_time": task.inference_time, "error_message": task.error_message,
+    }
+
+
+def new_status(task):
+    return TaskStatusResponse(
+        task_id=task.task_id, index=task.index, status=task.status, progress=task.progress,
+        created_at=task.created_at, completed_at=task.completed_at,
+        inference_time=task.inference_time, error_message=task.error_message,
+    )
+
+
+async def _bench(build, field, response_class, rounds: int) -> float:
+    """构建响应数据 + FastAPI 序列化 + 响应类渲染，返回单次耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        content = await serialize_response(field=field, response_content=build(), is_coroutine=True)
+        response_class(content)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200, help="结果文件数")
+    parser.add_argument("--page-size", type=int, default=100, help="任务列表每页数量")
+    parser.add_argument("--rounds", type=int, default=2000, help="每项重复次数")
+    args = parser.parse_args()
+
+    tasks = [_task(i) for i in range(args.page_size)]
+    task = tasks[0]
+    names = [f"sample_00000/result_{k}.{'mp4' if k % 10 == 0 else 'gif'}" for k in range(args.files)]
+    paths = [f"{LOCAL_RESULT_DIR}/{name}" for name in names]
+    entries = [{"path": name, "name": Path(name).name, "size": 123456, "media_type": media_kind(name)}
+               for name in names]
+
+    cases = [
+        (f"GET /api/tasks (page_size={args.page_size})",
+         lambda: old_task_list(tasks), lambda: new_task_list(tasks), TaskListResponse),
+        (f"GET /api/task/{{id}}/result ({args.files} 个文件)",
+         lambda: old_result(task, paths), lambda: new_result(task, entries), TaskResultResponse),
+        ("GET /api/task/{id}/status",
+         lambda: old_status(task), lambda: new_status(task), TaskStatusResponse),
+    ]
+    for name, old, new, model in cases:
+        field = create_response_field(name="bench", type_=model)
+        before = await _bench(old, None, JSONResponse, args.rounds)
+        after = await _bench(new, field, ORJSONResponse, args.rounds)
+        print(f"{name}\n  旧: {before:8.1f}us   新: {after:8.1f}us   ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
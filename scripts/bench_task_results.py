@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+任务结果存储格式对比：旧版 Task.result JSON 文件列表 vs task_files + path_prefixes 表
+
+分别生成两种格式的 SQLite 数据库，对比单行占用与 get_task_result 的数据读取耗时
+（查询 + 组装文件列表，不含 HTTP 开销）。
+
+用法:
+    python scripts/bench_task_results.py --tasks 1000000 --files 3
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+
+from app.models.database import Base  # noqa: E402
+from app.services.result_index import media_kind  # noqa: E402
+
+
+LOCAL_RESULT_DIR = "/home/xcsz/aaai2025/work_dirs/lcs/demo/test/vis"
+BATCH = 10000
+
+
+def _task_id(i: int) -> str:
+    return f"{i:08d}-0000-4000-8000-000000000000"
+
+
+def _files(i: int, count: int):
+    subfolder = f"sample_{i % 1000:05d}"
+    return [(subfolder, f"result_{i}_{k}.gif") for k in range(count)]
+
+
+def _create(path: str) -> sqlite3.Connection:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+
+def _task_row(i: int, result):
+    return (_task_id(i), i % 100, f"{i % 1000:05d}", "COMPLETED", result, 30.0, "2026-01-01 00:00:00",
+            "2026-01-01 00:00:00", "2026-01-01 00:00:30")
+
+
+TASK_INSERT = (
+    "INSERT INTO tasks (task_id, \"index\", subfolder, status, result, inference_time, created_at, "
+    "updated_at, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def build_json(path: str, tasks: int, files: int):
+    """旧格式：文件绝对路径列表写入 Task.result"""
+    conn = _create(path)
+    for start in range(0, tasks, BATCH):
+        rows = []
+        for i in range(start, min(start + BATCH, tasks)):
+            result = json.dumps({
+                "files": [f"{LOCAL_RESULT_DIR}/{d}/{n}" for d, n in _files(i, files)],
+                "remote_dir": LOCAL_RESULT_DIR,
+            }, ensure_ascii=False)
+            rows.append(_task_row(i, result))
+        conn.executemany(TASK_INSERT, rows)
+        conn.commit()
+    return conn
+
+
+def build_table(path: str, tasks: int, files: int, with_hash: bool = True):
+    """新格式：task_files 表 + 共享目录表（with_hash=False 时不写哈希，与旧格式信息量相同）"""
+    conn = _create(path)
+    prefixes = {}
+    for start in range(0, tasks, BATCH):
+        rows, file_rows = [], []
+        for i in range(start, min(start + BATCH, tasks)):
+            rows.append(_task_row(i, None))
+            task_pk = i + 1
+            for directory, name in _files(i, files):
+                if directory not in prefixes:
+                    prefixes[directory] = len(prefixes) + 1
+                    conn.execute("INSERT INTO path_prefixes (id, path) VALUES (?, ?)", (prefixes[directory], directory))
+                sha256 = os.urandom(32) if with_hash else None
+                file_rows.append((task_pk, prefixes[directory], name, 1234567, sha256, media_kind(name)))
+        conn.executemany(TASK_INSERT, rows)
+        conn.executemany(
+            "INSERT INTO task_files (task_pk, prefix_id, name, size, sha256, media_type) VALUES (?, ?, ?, ?, ?, ?)",
+            file_rows
+        )
+        conn.commit()
+    return conn
+
+
+def read_json(conn: sqlite3.Connection, task_id: str):
+    row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+    result = json.loads(row["result"])
+    items = []
+    for file_path in result.get("files", []):
+        relative_path = file_path.replace(LOCAL_RESULT_DIR + "/", "")
+        name = Path(file_path).name
+        items.append({"filename": name, "type": media_kind(name), "path": file_path,
+                      "url": f"/api/task/{task_id}/file/{relative_path}"})
+    return items
+
+
+def build_table_no_hash(path: str, tasks: int, files: int):
+    return build_table(path, tasks, files, with_hash=False)
+
+
+def read_table(conn: sqlite3.Connection, task_id: str):
+    task = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+    rows = conn.execute(
+        "SELECT path_prefixes.path, task_files.name, task_files.size, task_files.sha256, task_files.media_type "
+        "FROM task_files JOIN path_prefixes ON task_files.prefix_id = path_prefixes.id "
+        "WHERE task_files.task_pk = ? ORDER BY task_files.id",
+        (task["id"],)
+    ).fetchall()
+    items = []
+    for directory, name, size, sha256, media_type in rows:
+        relative_path = f"{directory}/{name}" if directory else name
+        items.append({"filename": name, "type": media_type, "size": size, "sha256": sha256.hex() if sha256 else None,
+                      "path": f"{LOCAL_RESULT_DIR}/{relative_path}",
+                      "url": f"/api/task/{task_id}/file/{relative_path}"})
+    return items
+
+
+def table_sizes(conn: sqlite3.Connection) -> dict:
+    """各表与索引占用字节数（需要 SQLite 编译了 dbstat），否则返回空"""
+    try:
+        return {row[0]: row[1] for row in conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")}
+    except sqlite3.OperationalError:
+        return {}
+
+
+def measure(name: str, conn: sqlite3.Connection, path: str, reader, tasks: int, lookups: int):
+    conn.execute("VACUUM")
+    size = os.path.getsize(path)
+    ids = [_task_id(random.randrange(tasks)) for _ in range(lookups)]
+    latencies = []
+    for task_id in ids:
+        start = time.perf_counter()
+        reader(conn, task_id)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"\n[{name}]")
+    print(f"  数据库大小: {size / 1024 / 1024:.1f} MiB，平均每个任务 {size / tasks:.0f} 字节")
+    for table, table_size in sorted(table_sizes(conn).items()):
+        print(f"    {table}: {table_size / 1024 / 1024:.1f} MiB")
+    print(
+        f"  读取耗时: p50 {latencies[len(latencies) // 2] * 1e6:.0f}us，"
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1000000, help="任务数")
+    parser.add_argument("--files", type=int, default=3, help="每个任务的结果文件数")
+    parser.add_argument("--lookups", type=int, default=5000, help="随机读取次数")
+    parser.add_argument("--dir", default=None, help="数据库目录（默认临时目录）")
+    args = parser.parse_args()
+
+    work_dir = args.dir or tempfile.mkdtemp(prefix="bench_results_")
+    layouts = (
+        ("JSON 文本列", build_json, read_json),
+        ("task_files 表（不含哈希）", build_table_no_hash, read_table),
+        ("task_files 表（含大小与 sha256）", build_table, read_table),
+    )
+    for name, builder, reader in layouts:
+        path = os.path.join(work_dir, f"{builder.__name__}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        start = time.time()
+        conn = builder(path, args.tasks, args.files)
+        print(f"生成 {name}: {args.tasks} 个任务，耗时 {time.time() - start:.1f}s")
+        measure(name, conn, path, reader, args.tasks, args.lookups)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+本地模拟 ssh/scp，用于在没有真实推理主机的环境下测试多主机调度与传输代码路径
+
+用法（.env）:
+    SSH_COMMAND=python scripts/fake_ssh.py
+    SCP_COMMAND=python scripts/fake_ssh.py --scp
+    INFERENCE_HOSTS=[{"name": "gpu-a", "host": "fake-a"}, {"name": "gpu-b", "host": "fake-b"}]
+
+远程命令在本机通过 bash 执行（conda 被替换为空操作），scp 退化为本地文件复制。
+
+环境变量:
+    FAKE_SSH_DOWN_HOSTS   逗号分隔的主机名，模拟连接失败（退出码255）
+    FAKE_SSH_LATENCY      每次连接的模拟握手耗时（秒）
+    FAKE_SSH_ERROR_RATE   每次连接随机失败（退出码255）的概率，模拟网络抖动
+"""
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+
+# conda 不存在时替换为空操作，source 不存在的文件时忽略
+BASH_PRELUDE = (
+    'conda() { :; }; export -f conda; '
+    'source() { if [ -f "$1" ]; then builtin source "$@"; fi; }; export -f source; '
+)
+
+
+def _parse(args):
+    """跳过 ssh/scp 选项，返回 (目标, 其余参数)"""
+    rest = []
+    target = None
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ("-o", "-p", "-P", "-i", "-F"):
+            i += 2
+            continue
+        if arg.startswith("-") and target is None:
+            i += 1
+            continue
+        if target is None:
+            target = arg
+        else:
+            rest.append(arg)
+        i += 1
+    return target, rest
+
+
+def _connect(host: str):
+    """模拟建立连接"""
+    time.sleep(float(os.environ.get("FAKE_SSH_LATENCY", "0")))
+    down = {h.strip() for h in os.environ.get("FAKE_SSH_DOWN_HOSTS", "").split(",") if h.strip()}
+    if host in down:
+        sys.stderr.write(f"ssh: connect to host {host}: Connection refused\n")
+        sys.exit(255)
+    if random.random() < float(os.environ.get("FAKE_SSH_ERROR_RATE", "0")):
+        sys.stderr.write(f"ssh: connect to host {host}: Connection timed out\n")
+        sys.exit(255)
+
+
+def ssh_main(args):
+    target, rest = _parse(args)
+    if not target or not rest:
+        sys.stderr.write("usage: fake_ssh.py [options] user@host command\n")
+        sys.exit(255)
+    host = target.split("@")[-1]
+    _connect(host)
+    # 不使用登录 shell，避免本机 profile 重新定义 conda
+    command = " ".join(rest).replace("bash -l -c", "bash -c")
+    # 与 sshd 一致，远程命令运行在独立的会话/进程组中
+    result = subprocess.run(["bash", "-c", BASH_PRELUDE + command], start_new_session=True)
+    sys.exit(result.returncode)
+
+
+def scp_main(args):
+    target, rest = _parse(args)
+    if not target or len(rest) != 1 or ":" not in target:
+        sys.stderr.write("usage: fake_ssh.py --scp [options] user@host:remote_path local_path\n")
+        sys.exit(255)
+    host_part, remote_path = target.split(":", 1)
+    _connect(host_part.split("@")[-1])
+    try:
+        shutil.copyfile(remote_path, rest[0])
+    except OSError as e:
+        sys.stderr.write(f"scp: {remote_path}: {e}\n")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    if argv and argv[0] == "--scp":
+        scp_main(argv[1:])
+    else:
+        ssh_main(argv)
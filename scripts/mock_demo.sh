@@ -0,0 +1,11 @@
+#!/bin/bash
+# 模拟推理脚本，替代远程主机上的 demo.sh，配合 scripts/fake_ssh.py 在本机压测完整的传输链路
+#
+# 用法（.env）:
+#     SSH_COMMAND=python scripts/fake_ssh.py
+#     SCP_COMMAND=python scripts/fake_ssh.py --scp
+#     REMOTE_WORK_DIR=<本仓库路径>
+#     REMOTE_SCRIPT=scripts/mock_demo.sh
+#
+# 耗时分布、失败率与结果文件数使用 MOCK_* 配置（读取 .env 与环境变量）
+exec python "$(dirname "$0")/mock_remote.py" "$@"
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+"""
+模拟远程推理脚本（由 scripts/mock_demo.sh 调用）
+
+按 MOCK_LATENCY 采样耗时并逐帧输出进度，按 MOCK_FAILURE_RATE / MOCK_TIMEOUT_RATE 模拟失败与卡住，
+结束后将结果 GIF 写入 REMOTE_RESULT_DIR/sample_<subfolder>（设置了环境变量 RESULT_OUTPUT_DIR 时写入该目录）。连接失败由 fake_ssh.py 的 FAKE_SSH_ERROR_RATE 模拟。
+
+用法:
+    python scripts/mock_remote.py <index> <subfolder>
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.simulation import run_remote  # noqa: E402
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.stderr.write("usage: mock_remote.py <index> <subfolder>\n")
+        sys.exit(2)
+    sys.exit(run_remote(int(sys.argv[1]), sys.argv[2]))
@@ -0,0 +1,123 @@
+"""
+测试公共配置
+
+应用配置在导入时读取，因此在导入 app 之前设置环境变量: MOCK_MODE + 临时目录中的 SQLite 数据库与结果目录，
+模拟推理耗时压缩到百毫秒以内。应用（TestClient）在整个测试会话中只启动一次，
+全局服务（任务队列、准入控制等）绑定在 TestClient 的事件循环上，异步操作通过 run() 在该循环中执行。
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="inference-tests-")
+os.environ.update(
+    MOCK_MODE="true",
+    LOCAL_MODE="false",
+    DEBUG="false",
+    LOG_LEVEL="WARNING",
+    LOG_ASYNC="false",
+    DATABASE_URL=f"sqlite+aiosqlite:///{_TMP}/tasks.db",
+    RESULTS_DIR=f"{_TMP}/results",
+    LOGS_DIR=f"{_TMP}/logs",
+    ARCHIVE_DIR=f"{_TMP}/archive",
+    RATE_LIMIT_DB=f"{_TMP}/ratelimit.db",
+    MOCK_LATENCY="uniform:0.02:0.05",
+    MOCK_POOL_SIZE="2",
+    MOCK_GIF_FRAMES="2",
+    MOCK_RESULT_FILES="1",
+)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.models.database import async_session_factory  # noqa: E402
+from app.models.task import Task, TaskStatus  # noqa: E402
+from app.services.task_queue import task_queue  # noqa: E402
+
+# 未结束的任务状态
+UNFINISHED = (TaskStatus.DEFERRED, TaskStatus.PENDING, TaskStatus.PROCESSING)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def run(client):
+    """在应用的事件循环中执行协程函数: run(coro_fn, *args)"""
+    return client.portal.call
+
+
+async def count_tasks(*statuses: TaskStatus) -> int:
+    async with async_session_factory() as session:
+        result = await session.execute(select(func.count(Task.id)).where(Task.status.in_(statuses)))
+        return result.scalar()
+
+
+async def task_status(task_id: str) -> TaskStatus:
+    async with async_session_factory() as session:
+        result = await session.execute(select(Task.status).where(Task.task_id == task_id))
+        return result.scalar_one()
+
+
+async def subfolder_statuses(subfolder: str) -> dict:
+    """子文件夹下所有任务的状态（task_id -> 状态，按创建顺序）"""
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(Task.task_id, Task.status).where(Task.subfolder == subfolder).order_by(Task.id)
+        )
+        return dict(result.all())
+
+
+def wait_until(condition, timeout: float = 10.0, interval: float = 0.05):
+    """轮询直到 condition() 为真，超时则测试失败"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("等待超时")
+        time.sleep(interval)
+
+
+@pytest.fixture
+def paused_queue(run):
+    """
+    暂停任务执行: Worker 取出任务后等待 resume() 才开始处理，便于构造队列已满、任务执行中等状态
+
+    测试结束时恢复执行，并等待所有任务结束，避免影响后续测试
+    """
+    original = task_queue._processor
+    gate = run(_new_event)
+
+    async def gated(task_data: dict):
+        await gate.wait()
+        return await original(task_data)
+
+    def resume():
+        run(_set_event, gate)
+
+    task_queue._processor = gated
+    gated.resume = resume
+    try:
+        yield gated
+    finally:
+        resume()
+        task_queue._processor = original
+        wait_until(lambda: run(count_tasks, *UNFINISHED) == 0, timeout=30)
+
+
+async def _new_event() -> asyncio.Event:
+    return asyncio.Event()
+
+
+async def _set_event(event: asyncio.Event):
+    event.set()
@@ -0,0 +1,123 @@
+"""准入控制: 队列满时拒绝（503 + Retry-After）、入队失败、延后排队与回填、取消与回填并发"""
+from contextlib import asynccontextmanager
+
+import pytest
+from conftest import subfolder_statuses, task_status, wait_until
+
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import TaskStatus
+from app.services import admission
+from app.services.admission import admission_controller
+from app.services.task_processor import cancel_task
+from app.services.task_queue import task_queue
+
+
+def submit_until(client, subfolder: str, status_code: int, limit: int = 20) -> list:
+    """连续提交任务，直到返回 status_code（最多 limit 次）"""
+    responses = []
+    for index in range(1, limit + 1):
+        response = client.post(f"/api/inference?index={index}&subfolder={subfolder}")
+        responses.append(response)
+        if response.status_code == status_code:
+            break
+    return responses
+
+
+@pytest.fixture
+def small_queue(monkeypatch):
+    """只允许 1 个任务排队（Worker 已取出的任务不占用位置）"""
+    monkeypatch.setattr(settings, "ADMISSION_CAPACITY", 1)
+
+
+def test_reject_when_full(client, run, paused_queue, small_queue):
+    rejected_before = admission_controller.rejected_count
+    responses = submit_until(client, "reject", 503, limit=task_queue.worker_count + 5)
+
+    rejected = responses[-1]
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert all(r.status_code == 200 for r in responses[:-1])
+    assert admission_controller.rejected_count == rejected_before + 1
+    # 拒绝发生在写数据库之前
+    assert len(run(subfolder_statuses, "reject")) == len(responses) - 1
+
+
+def test_enqueue_failure_marks_task_failed(client, run, monkeypatch):
+    async def refuse(task_data: dict) -> bool:
+        return False
+
+    monkeypatch.setattr(task_queue, "enqueue", refuse)
+    response = client.post("/api/inference?index=1&subfolder=enqueue-failed")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.ADMISSION_DEFAULT_RETRY_AFTER)
+    # 任务不会被执行，不能停留在 pending
+    assert list(run(subfolder_statuses, "enqueue-failed").values()) == [TaskStatus.FAILED]
+    assert admission_controller.stats["pending"] == 0
+
+
+def test_deferred_spill_and_promotion(client, run, paused_queue, small_queue, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_DEFERRED", True)
+    responses = submit_until(client, "deferred", 202, limit=task_queue.worker_count + 5)
+    responses.append(client.post("/api/inference?index=100&subfolder=deferred"))
+
+    deferred = responses[-2:]
+    for response in deferred:
+        assert response.status_code == 202
+        assert response.json()["status"] == "deferred"
+        assert int(response.headers["Retry-After"]) >= 1
+    assert admission_controller.stats["deferred"] == 2
+    # 已有 deferred 任务时，新任务也延后（保持先后顺序）
+    statuses = run(subfolder_statuses, "deferred")
+    assert [statuses[r.json()["task_id"]] for r in deferred] == [TaskStatus.DEFERRED] * 2
+
+    # 队列腾出位置后按创建顺序回填，全部正常完成
+    paused_queue.resume()
+    wait_until(lambda: set(run(subfolder_statuses, "deferred").values()) == {TaskStatus.COMPLETED}, timeout=30)
+    assert admission_controller.stats["deferred"] == 0
+
+
+def test_cancel_racing_drain(client, run, paused_queue, small_queue, monkeypatch):
+    """回填读取 deferred 任务之后、更新状态之前任务被取消: 不回填、不重复扣减计数"""
+    monkeypatch.setattr(settings, "ADMISSION_DEFERRED", True)
+    racing = set()
+    cancelled = []
+    enqueued = []
+    original_enqueue = task_queue.enqueue
+
+    @asynccontextmanager
+    async def racing_session_factory():
+        async with async_session_factory() as session:
+            execute = session.execute
+
+            async def execute_then_cancel(statement, *args, **kwargs):
+                result = await execute(statement, *args, **kwargs)
+                if racing and statement.is_select:
+                    for task_id in list(racing):
+                        racing.discard(task_id)
+                        cancelled.append(await cancel_task(task_id))
+                return result
+
+            session.execute = execute_then_cancel
+            yield session
+
+    async def recording_enqueue(task_data: dict) -> bool:
+        enqueued.append(task_data["task_id"])
+        return await original_enqueue(task_data)
+
+    monkeypatch.setattr(admission, "async_session_factory", racing_session_factory)
+    monkeypatch.setattr(task_queue, "enqueue", recording_enqueue)
+
+    responses = submit_until(client, "race", 202, limit=task_queue.worker_count + 5)
+    assert responses[-1].status_code == 202
+    task_id = responses[-1].json()["task_id"]
+    racing.add(task_id)
+
+    # 队列腾出位置后，回填协程读取到该任务时将其取消
+    paused_queue.resume()
+    wait_until(lambda: cancelled)
+    assert cancelled == [(True, TaskStatus.DEFERRED)]
+    wait_until(lambda: run(task_status, task_id) == TaskStatus.CANCELLED)
+    assert task_id not in enqueued
+    assert admission_controller.stats["deferred"] == 0
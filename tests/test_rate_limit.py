@@ -0,0 +1,178 @@
+"""按客户端限流: 令牌桶（内存 / SQLite 两种存储结果一致）、空闲桶清除、限流依赖与未完成任务数上限"""
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+
+from app.api import routes
+from app.api.routes import check_client_quota
+from app.config import settings
+from app.models.database import async_session_factory
+from app.models.task import Task, TaskStatus
+from app.services import rate_limit
+from app.services.rate_limit import MemoryBuckets, RateLimit, RateLimiter, SQLiteBuckets
+
+RULE = RateLimit("submit", rate=2.0, burst=3)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SQLiteBuckets(str(tmp_path / "buckets.db"))
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_burst_exhausted(store):
+    results = [store.take(RULE, "c", 100.0) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert [tokens for _, tokens in results] == [2, 1, 0, 0]
+
+
+def test_refill_after_time_passes(store):
+    for _ in range(3):
+        store.take(RULE, "c", 100.0)
+    assert store.take(RULE, "c", 100.2)[0] is False
+    # 被拒绝时桶中已有 0.4 个令牌，再过 0.5 秒补充 1 个（rate=2）
+    allowed, tokens = store.take(RULE, "c", 100.7)
+    assert allowed
+    assert tokens == pytest.approx(0.4)
+    # 空闲足够久后最多补满到 burst
+    assert store.take(RULE, "c", 200.0) == (True, 2)
+
+
+def test_buckets_are_per_key(store):
+    for _ in range(3):
+        store.take(RULE, "a", 100.0)
+    assert store.take(RULE, "a", 100.0)[0] is False
+    assert store.take(RULE, "b", 100.0) == (True, 2)
+
+
+def test_sweep_removes_idle_buckets(store):
+    store.take(RULE, "old", 100.0)
+    store.take(RULE, "new", 150.0)
+    assert store.sweep(before=120.0) == 1
+    assert len(store) == 1
+    # 清除的桶重新创建时为满桶
+    assert store.take(RULE, "old", 151.0) == (True, 2)
+
+
+def test_backends_agree(tmp_path):
+    memory, sqlite = MemoryBuckets(), SQLiteBuckets(str(tmp_path / "buckets.db"))
+    schedule = [("a", 0.0), ("a", 0.1), ("b", 0.1), ("a", 0.2), ("a", 0.25), ("a", 0.9), ("b", 1.0), ("a", 1.0), ("a", 5.0)]
+    for key, now in schedule:
+        m_allowed, m_tokens = memory.take(RULE, key, now)
+        s_allowed, s_tokens = sqlite.take(RULE, key, now)
+        assert m_allowed == s_allowed
+        assert m_tokens == pytest.approx(s_tokens)
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_limiter_decision(monkeypatch, tmp_path, backend):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", backend)
+    monkeypatch.setattr(settings, "RATE_LIMIT_DB", tmp_path / "buckets.db")
+    monkeypatch.setattr(settings, "RATE_LIMIT_SUBMIT_RATE", 2.0)
+    monkeypatch.setattr(settings, "RATE_LIMIT_SUBMIT_BURST", 2)
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    limiter = RateLimiter()
+
+    first = limiter.check("submit", "1.2.3.4")
+    assert (first.allowed, first.limit, first.remaining, first.retry_after) == (True, 2, 1, 0)
+    assert first.reset == pytest.approx(0.5)
+    limiter.check("submit", "1.2.3.4")
+    denied = limiter.check("submit", "1.2.3.4")
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(0.5)
+    assert limiter.limited_count == {"submit": 1, "poll": 0}
+    # 规则之间互不影响
+    assert limiter.check("poll", "1.2.3.4").allowed
+
+    # 超过 SWEEP_INTERVAL 后检查时清除已补满的桶
+    clock.now += rate_limit.SWEEP_INTERVAL
+    assert limiter.check("submit", "5.6.7.8").allowed
+    assert limiter.stats["buckets"] == 1
+
+
+def test_limiter_allows_when_store_fails(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", "sqlite")
+    monkeypatch.setattr(settings, "RATE_LIMIT_DB", tmp_path / "missing" / "buckets.db")
+    limiter = RateLimiter()
+    assert limiter.check("submit", "1.2.3.4").allowed
+    assert limiter.error_count == 1
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    """开启限流，查询接口突发容量为 2（补充很慢，测试期间不会补充）"""
+    monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", "memory")
+    monkeypatch.setattr(settings, "RATE_LIMIT_POLL_RATE", 0.001)
+    monkeypatch.setattr(settings, "RATE_LIMIT_POLL_BURST", 2)
+    monkeypatch.setattr(routes, "rate_limiter", RateLimiter())
+
+
+def test_rate_limited_dependency(client, limited):
+    responses = [client.get("/api/tasks?page_size=1") for _ in range(3)]
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].headers["X-RateLimit-Limit"] == "2"
+    assert responses[0].headers["X-RateLimit-Remaining"] == "1"
+    assert responses[2].headers["X-RateLimit-Remaining"] == "0"
+    assert int(responses[2].headers["Retry-After"]) >= 1
+
+
+def test_rate_limit_exempt_client(client, limited, monkeypatch):
+    # TestClient 不提供客户端地址，限流按 "unknown" 计数
+    monkeypatch.setattr(settings, "RATE_LIMIT_EXEMPT", ["unknown"])
+    responses = [client.get("/api/tasks?page_size=1") for _ in range(3)]
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert "X-RateLimit-Limit" not in responses[0].headers
+
+
+async def _seed_tasks(client_ip: str, statuses: list) -> list:
+    async with async_session_factory() as session:
+        tasks = [
+            Task(task_id=f"quota-{uuid.uuid4()}", index=1, subfolder="quota", status=status, client_ip=client_ip)
+            for status in statuses
+        ]
+        session.add_all(tasks)
+        await session.commit()
+        return [task.id for task in tasks]
+
+
+async def _delete_tasks(task_pks: list):
+    async with async_session_factory() as session:
+        await session.execute(delete(Task).where(Task.id.in_(task_pks)))
+        await session.commit()
+
+
+async def _check_quota(client_ip: str):
+    async with async_session_factory() as session:
+        await check_client_quota(session, client_ip)
+
+
+def test_client_active_task_quota(run, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_ACTIVE_TASKS", 2)
+    # 已结束的任务不计入
+    task_pks = run(_seed_tasks, "10.0.0.1", [TaskStatus.PENDING, TaskStatus.COMPLETED, TaskStatus.FAILED])
+    try:
+        run(_check_quota, "10.0.0.1")
+        task_pks += run(_seed_tasks, "10.0.0.1", [TaskStatus.DEFERRED])
+        with pytest.raises(HTTPException) as exc:
+            run(_check_quota, "10.0.0.1")
+        assert exc.value.status_code == 429
+        assert exc.value.headers["Retry-After"] == str(settings.ADMISSION_DEFAULT_RETRY_AFTER)
+        # 按客户端计数，豁免的客户端不受限制
+        run(_check_quota, "10.0.0.2")
+        monkeypatch.setattr(settings, "RATE_LIMIT_EXEMPT", ["10.0.0.1"])
+        run(_check_quota, "10.0.0.1")
+    finally:
+        run(_delete_tasks, task_pks)
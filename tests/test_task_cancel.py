@@ -0,0 +1,129 @@
+"""任务取消: 排队中任务 O(1) 出队、执行中任务终止、批量取消、写入最终状态时不覆盖并发的取消"""
+import time
+
+import pytest
+from conftest import task_status, wait_until
+from sqlalchemy import update
+
+from app.models.database import async_session_factory
+from app.models.task import Task, TaskStatus
+from app.services import task_processor
+from app.services.backend_pool import backend_pool
+from app.services.simulation import LatencyModel, mock_engine
+from app.services.task_queue import task_queue
+
+
+def submit(client, subfolder: str, index: int = 1) -> str:
+    response = client.post(f"/api/inference?index={index}&subfolder={subfolder}")
+    assert response.status_code == 200
+    return response.json()["task_id"]
+
+
+def backend_counts() -> tuple:
+    return tuple(sum(backend.stats[key] for backend in backend_pool.backends) for key in ("failed", "cancelled"))
+
+
+def test_cancel_pending_task(client, run, paused_queue, monkeypatch):
+    processed = []
+    gated = task_queue._processor
+
+    async def recording(task_data: dict):
+        processed.append(task_data["task_id"])
+        return await gated(task_data)
+
+    monkeypatch.setattr(task_queue, "_processor", recording)
+    # 所有 Worker 都在等待，最后一个任务留在队列中
+    running = [submit(client, "cancel-pending", index) for index in range(1, task_queue.worker_count + 1)]
+    wait_until(lambda: task_queue.active_count == task_queue.worker_count)
+    queued = submit(client, "cancel-pending", 100)
+    assert task_queue.waiting_count == 1
+
+    response = client.delete(f"/api/task/{queued}")
+    assert response.status_code == 200
+    assert response.json()["previous_status"] == "pending"
+    assert run(task_status, queued) == TaskStatus.CANCELLED
+    # 只做标记，不遍历队列: 出队前仍占用位置，但不再计入等待数
+    assert task_queue.queue_size == 1
+    assert task_queue.waiting_count == 0
+    assert client.delete(f"/api/task/{queued}").status_code == 409
+
+    paused_queue.resume()
+    wait_until(lambda: task_queue.queue_size == 0)
+    wait_until(lambda: all(run(task_status, task_id) == TaskStatus.COMPLETED for task_id in running))
+    assert queued not in processed
+    assert run(task_status, queued) == TaskStatus.CANCELLED
+
+
+def test_cancel_processing_task(client, run, monkeypatch):
+    monkeypatch.setattr(mock_engine, "_latency", LatencyModel("uniform:30:30"))
+    failed_before, cancelled_before = backend_counts()
+    task_id = submit(client, "cancel-processing")
+    wait_until(lambda: run(task_status, task_id) == TaskStatus.PROCESSING)
+
+    start = time.monotonic()
+    response = client.delete(f"/api/task/{task_id}")
+    assert response.status_code == 200
+    assert response.json()["previous_status"] == "processing"
+    # 推理被终止，Worker 立即释放（不等待 30 秒的模拟推理）
+    wait_until(lambda: task_queue.active_count == 0)
+    assert time.monotonic() - start < 5
+    assert run(task_status, task_id) == TaskStatus.CANCELLED
+    # 取消不计为推理主机的失败
+    assert backend_counts() == (failed_before, cancelled_before + 1)
+
+
+async def _seed_finished() -> str:
+    async with async_session_factory() as session:
+        task = Task(task_id=f"finished-{time.time_ns()}", index=1, subfolder="cancel-batch", status=TaskStatus.COMPLETED)
+        session.add(task)
+        await session.commit()
+        return task.task_id
+
+
+def test_batch_cancel(client, run, paused_queue):
+    # Worker 已取出、尚未开始处理的任务（数据库中仍为 pending）
+    picked = [submit(client, "cancel-batch", index) for index in range(1, task_queue.worker_count + 1)]
+    wait_until(lambda: task_queue.active_count == task_queue.worker_count)
+    queued = [submit(client, "cancel-batch", 100 + index) for index in range(2)]
+    finished = run(_seed_finished)
+
+    response = client.post(
+        "/api/tasks/cancel", json={"task_ids": queued + [picked[0], finished, "missing", queued[0]]}
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["cancelled"] == queued + [picked[0]]
+    assert body["finished"] == [finished]
+    assert body["not_found"] == ["missing"]
+
+    paused_queue.resume()
+    wait_until(lambda: task_queue.active_count == 0 and task_queue.queue_size == 0)
+    assert [run(task_status, task_id) for task_id in queued + picked] == (
+        [TaskStatus.CANCELLED] * 3 + [TaskStatus.COMPLETED] * (len(picked) - 1)
+    )
+
+
+@pytest.mark.parametrize("save_fails", [False, True])
+def test_finalize_keeps_concurrent_cancel(client, run, monkeypatch, save_fails):
+    """下载结果期间任务被取消: 最终状态保持 CANCELLED，不写入结果文件记录"""
+    original = task_processor.save_task_files
+
+    async def cancel_then_save(session, task_pk, records):
+        async with async_session_factory() as other:
+            await other.execute(
+                update(Task).where(Task.id == task_pk).values(status=TaskStatus.CANCELLED, error_message="任务已取消")
+            )
+            await other.commit()
+        if save_fails:
+            raise RuntimeError("写入结果文件记录失败")
+        return await original(session, task_pk, records)
+
+    monkeypatch.setattr(task_processor, "save_task_files", cancel_then_save)
+    task_id = submit(client, f"finalize-{save_fails}")
+    wait_until(lambda: run(task_status, task_id) not in (TaskStatus.PENDING, TaskStatus.PROCESSING))
+    wait_until(lambda: task_queue.active_count == 0)
+
+    assert run(task_status, task_id) == TaskStatus.CANCELLED
+    result = client.get(f"/api/task/{task_id}/result").json()
+    assert result["status"] == "cancelled"
+    assert not result.get("files")